@@ -1,7 +1,23 @@
-from typing import List
-from src.characters.character import Character
+import random
+from typing import List, Optional, Sequence
+from src.characters.character import Character, PersonaTemplate
 from src.engine.state import Position
 
+PERSONA_TEMPLATES: List[PersonaTemplate] = [
+    PersonaTemplate("regular", "Friendly regular; knows the aisles, chats briefly with staff.", 4.0, (2, 4), weight=3),
+    PersonaTemplate("commuter", "Hurried commuter; grabs coffee or a drink and dislikes waiting in line.", 6.0, (1, 2), weight=4),
+    PersonaTemplate("bargain hunter", "Price-conscious; compares labels and mentions deals.", 2.0, (4, 8), weight=2),
+    PersonaTemplate("snacker", "Impulsive late-night snacker; drawn to chips, candy and energy drinks.", 3.0, (2, 5), weight=2),
+    PersonaTemplate("browser", "Laid-back browser; wanders, comments on displays, rarely in a hurry.", 1.5, (3, 7), weight=1),
+]
+
+FIRST_NAMES = [
+    "Ava", "Caleb", "Dina", "Eli", "Fay", "Gus", "Hana", "Ivan", "Jade", "Kofi",
+    "Lena", "Milo", "Nia", "Omar", "Pia", "Quinn", "Rosa", "Sam", "Tara", "Umar",
+    "Vera", "Wes", "Xena", "Yuri", "Zoe",
+]
+
+
 def create_cast(store_origin):
     oy, ox = store_origin
     cast: List[Character] = [
@@ -15,3 +31,34 @@ def create_cast(store_origin):
         Character("Gina", Position(oy+9, ox+22)),
     ]
     return cast
+
+
+def next_arrival(persona: PersonaTemplate, now: int, rng: Optional[random.Random] = None) -> int:
+    """Tick of a customer's next visit: exponential gap at the persona's arrival rate."""
+    gap = (rng or random).expovariate(max(persona.arrival_rate, 1e-6) / 1000.0)
+    return now + 1 + int(gap)
+
+
+def generate_cast(n: int, store_origin=(0, 0), rng: Optional[random.Random] = None,
+                  templates: Sequence[PersonaTemplate] = PERSONA_TEMPLATES, keep_named: bool = True) -> List[Character]:
+    """Bob (plus the named regulars if keep_named) and `n` generated customers.
+
+    Generated customers start offstage with a first arrival drawn from their
+    persona's arrival rate. They carry no personality text or memory until
+    they enter the store (Character.materialize) and drop both when they
+    leave (Character.release).
+    """
+    rng = rng or random.Random()
+    cast = create_cast(store_origin)
+    if not keep_named:
+        cast = [c for c in cast if c.is_owner]
+    oy, ox = store_origin
+    weights = [t.weight for t in templates]
+    picks = rng.choices(list(templates), weights=weights, k=n)
+    for i, persona in enumerate(picks):
+        name = f"{FIRST_NAMES[i % len(FIRST_NAMES)]} #{i + 1}"
+        cast.append(Character(
+            name, Position(oy, ox), memory=None, persona=persona,
+            active=False, return_tick=next_arrival(persona, 0, rng),
+        ))
+    return cast
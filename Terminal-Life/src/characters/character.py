@@ -1,8 +1,10 @@
 import random
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from src.engine.state import Position
 from src.memory.memory import CharacterMemory
+from src.engine.spatial import SpatialHash
+from src.store.pathfinding import FlowField
 
 PERSONALITIES = {
     "Bob": "Helpful, calm, observant store owner. Focused on smooth checkout & customer satisfaction.",
@@ -15,33 +17,82 @@ PERSONALITIES = {
     "Gina": "Energetic, spontaneous; impulse buyer, quick shifts in topic."
 }
 
+
+@dataclass(frozen=True)
+class PersonaTemplate:
+    """Shared description of a kind of shopper, used for generated customers."""
+    label: str
+    personality: str
+    arrival_rate: float  # expected visits per 1000 ticks
+    basket_size: Tuple[int, int]  # shelves visited per trip (min, max)
+    weight: float = 1.0  # relative share of the generated population
+
+
 @dataclass
 class Character:
     name: str
     pos: Position
     is_owner: bool = False
     path: List[Position] = field(default_factory=list)
+    flow: Optional[FlowField] = field(default=None, repr=False, compare=False)
     waiting_ticks: int = 0
-    memory: CharacterMemory = field(default_factory=CharacterMemory)
+    memory: Optional[CharacterMemory] = field(default_factory=CharacterMemory)
     personality: str = ""
     target_kind: Optional[str] = None
     active: bool = True  # False means offstage (not currently in store)
     return_tick: Optional[int] = None  # when to spawn back
     mood_score: float = 0.0  # -1..1 baseline drift
     mood_label: str = "Neutral"
+    spatial: Optional[SpatialHash] = field(default=None, repr=False, compare=False)
+    # generated customers: persona & memory exist only while on stage
+    persona: Optional[PersonaTemplate] = field(default=None, repr=False)
+    basket: int = -1  # shelves left this trip; -1 = no basket, pick the queue at random
 
     def __post_init__(self):
-        if not self.personality:
+        if not self.personality and self.persona is None:
             self.personality = PERSONALITIES.get(self.name, "Neutral.")
 
+    def materialize(self):
+        """Create persona text and memory on (re)entering the store."""
+        if self.memory is None:
+            self.memory = CharacterMemory()
+        if not self.personality and self.persona is not None:
+            self.personality = self.persona.personality
+
+    def release(self):
+        """Drop per-visit state of a generated customer once it leaves."""
+        if self.persona is not None:
+            self.memory = None
+            self.personality = ""
+
     @property
     def symbol(self):
         return self.name[0].upper()
 
+    @property
+    def has_route(self) -> bool:
+        return bool(self.path) or self.flow is not None
+
     def set_path(self, points: List[Position], target_kind: str):
         self.path = points
+        self.flow = None
+        self.target_kind = target_kind
+
+    def follow(self, flow: FlowField, target_kind: str):
+        """Walk down a shared flow field instead of an explicit path."""
+        self.path = []
+        self.flow = flow
         self.target_kind = target_kind
 
+    def clear_route(self):
+        self.path = []
+        self.flow = None
+
+    def move_to(self, y: int, x: int):
+        self.pos.y, self.pos.x = y, x
+        if self.spatial is not None and self.active:
+            self.spatial.update(self)
+
     def step(self):
         if not self.active:
             return
@@ -49,14 +100,23 @@ class Character:
             self.waiting_ticks -= 1
             return
         if self.path:
-            self.pos = self.path.pop(0)
+            nxt = self.path.pop(0)
+            self.move_to(nxt.y, nxt.x)
+        elif self.flow is not None:
+            step = self.flow.next_step(self.pos.y, self.pos.x)
+            if step is None:
+                self.flow = None
+                return
+            self.move_to(*step)
+            if self.flow.distance(*step) == 0:
+                self.flow = None
 
-    def decide_wait(self):
-        self.waiting_ticks = random.randint(2, 5)
+    def decide_wait(self, rng: Optional[random.Random] = None):
+        self.waiting_ticks = (rng or random).randint(2, 5)
 
-    def update_mood(self):
+    def update_mood(self, rng: Optional[random.Random] = None):
         """Random mild drift; conversations could hook in later."""
-        drift = random.uniform(-0.05, 0.05)
+        drift = (rng or random).uniform(-0.05, 0.05)
         self.mood_score = max(-1.0, min(1.0, self.mood_score * 0.9 + drift))
         if self.mood_score > 0.4:
             self.mood_label = "Happy"
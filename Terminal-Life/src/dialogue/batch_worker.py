@@ -1,8 +1,22 @@
+import heapq
+import itertools
+import re
 import threading
-import queue
-from collections import defaultdict, deque
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Deque, Dict, List, Tuple, Optional, Callable
 
+# request priorities, most urgent first
+PRIORITY_CHECKOUT = 0     # the owner and the customer being served at the till
+PRIORITY_ADJACENT = 1     # a pair that is talking right now
+PRIORITY_SPECULATIVE = 2  # prefetch for a pair that has not met yet
+
+PACK_TAG = re.compile(r'^\[?P(\d+)\]?\s*[:.)-]?\s*(.*)$')
+
+PREFIX_WINDOW = 16  # distinct system prefixes remembered when counting prefix reuse
+REQUEST_TIMEOUT = 30.0  # seconds a request already sent to the server may take
+
 
 class DialogueBatchWorker:
     """Background worker that fulfills batched dialogue generation requests.
@@ -10,77 +24,528 @@ class DialogueBatchWorker:
     Each request asks the LLM for N candidate single-line utterances for a *directed*
     speaker->listener pair (order matters). Lines are stored in a buffer keyed by
     (speaker, listener). The main thread polls buffers non-blockingly.
+
+    With inline=True no thread is started and enqueue() fulfils the request
+    before returning, which makes buffer contents independent of timing.
+
+    If the client can submit() requests without blocking (AsyncLocalLLMClient),
+    the worker keeps up to `client.max_concurrency` of them in flight and fills
+    the buffers from their completion callbacks; otherwise requests run one at
+    a time.
+
+    With stream=True (and a client that can stream), each line goes into its
+    buffer as soon as its newline arrives instead of after the whole batch.
+
+    A payload may carry a 'deadline' (time.monotonic() value): requests still
+    queued when it passes are dropped (llm.expired). A request already sent
+    is given `request_timeout` seconds whatever its deadline, and lines that
+    land after the deadline (llm.late) are buffered for the pair's next turn.
+
+    Requests are served by priority (PRIORITY_*), FIFO within a level. At
+    most one request per pair key is queued or in flight: promote() lets a
+    caller reuse the pending one (raising its priority if needed) instead of
+    queuing a duplicate, and drop_involving() discards queued requests for a
+    character who left and cancels their in-flight ones.
+
+    With pack_pairs > 1, requests that are already waiting when a slot opens
+    are packed into one call (up to pack_pairs of them, most urgent first):
+    each pair's payload 'pair_block' goes into a single prompt that asks for
+    lines tagged [P1], [P2], ..., and the tagged lines are fanned out to the
+    pairs' buffers. Pairs that get no valid line back are retried on their own.
+
+    A payload with 'speakers' asks for an exchange: turns written as
+    "Name: line" by either character, kept in that form and in script order
+    so both directions of the conversation are served from one buffer.
+
+    With a `cache` (src.dialogue.line_cache.LineCache), every completed batch
+    whose payload has 'cache' = [speaker, listener, topic, bucket] is stored
+    there as well. With an async client the writes go through a separate
+    thread, so SQLite never runs on the client's event loop; close() waits
+    for them.
+
+    With `metrics`, every request's prompt size is counted in estimated
+    tokens (llm.prompt_tokens), as is its system message (llm.prefix_tokens)
+    and, when that exact system message was one of the last PREFIX_WINDOW
+    sent, the tokens the server could take from its prompt cache
+    (llm.prefix_reused_tokens). Clients with an `on_usage` hook also report
+    the server's own counts (llm.usage.*).
     """
 
-    def __init__(self, client, stop_event: threading.Event):
+    def __init__(self, client, stop_event: threading.Event, inline: bool = False, metrics=None,
+                 stream: bool = True, pack_pairs: int = 1, cache=None,
+                 request_timeout: float = REQUEST_TIMEOUT):
         self.client = client
+        self.request_timeout = request_timeout
+        self.cache = cache
+        self.stream = stream
+        self.pack_pairs = pack_pairs
+        self.metrics = metrics
         self.stop_event = stop_event
-        self.requests: "queue.Queue[Tuple[Tuple[str,str], dict]]" = queue.Queue()
+        self.inline = inline
+        # heap of (priority, seq, key); entries whose key is no longer in _queued
+        # at that priority are stale and skipped
+        self._heap: List[Tuple[int, int, Tuple[str, str]]] = []
+        self._seq = itertools.count()
+        self._queued: Dict[Tuple[str, str], Tuple[int, dict]] = {}
+        self._inflight: Dict[Tuple[str, str], Optional[Future]] = {}
+        self._cv = threading.Condition()
         self.buffers: Dict[Tuple[str, str], Deque[str]] = defaultdict(lambda: deque())
         self.lock = threading.Lock()
-        self.thread = threading.Thread(target=self._run, daemon=True)
-        self.thread.start()
+        self.thread: Optional[threading.Thread] = None
+        self._submit = getattr(client, 'submit', None)
+        # completions of submitted requests run on the client's event loop
+        self._writer = (ThreadPoolExecutor(1, thread_name_prefix='line-cache')
+                        if cache is not None and self._submit is not None and not inline else None)
+        # free in-flight slots; requests stay queued until one opens
+        self._slots = threading.Semaphore(getattr(client, 'max_concurrency', 1))
+        self._prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        if metrics is not None and hasattr(client, 'on_usage'):
+            client.on_usage = self._count_usage
+        if not inline:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
 
     # Public API ---------------------------------------------------------
-    def enqueue(self, key: Tuple[str, str], payload: dict):
-        """Queue a batch generation request.
+    def enqueue(self, key: Tuple[str, str], payload: dict, priority: int = PRIORITY_ADJACENT) -> bool:
+        """Queue a batch generation request; False if one for `key` was already pending.
 
-        payload keys: system, prompt, count, max_tokens (optional), temperature (optional)
+        payload keys: system, prompt, count, max_tokens (optional), temperature (optional),
+        deadline (optional), pair_block and pack_system (optional, for packing)
         """
-        self.requests.put((key, payload))
+        if self.inline:
+            with self._cv:
+                self._inflight[key] = None
+            job = self._job([(key, payload, priority)])
+            if job is not None:
+                self._process(job)
+            return True
+        with self._cv:
+            if self.promote(key, priority):
+                return False
+            self._queued[key] = (priority, payload)
+            heapq.heappush(self._heap, (priority, next(self._seq), key))
+            self._cv.notify()
+        return True
+
+    def promote(self, key: Tuple[str, str], priority: int = PRIORITY_ADJACENT) -> bool:
+        """True if a request for `key` is queued or in flight; a queued one is
+        moved up to `priority` if that is more urgent."""
+        with self._cv:
+            queued = self._queued.get(key)
+            if queued is None and key not in self._inflight:
+                return False
+            if queued is not None and priority < queued[0]:
+                self._queued[key] = (priority, queued[1])
+                heapq.heappush(self._heap, (priority, next(self._seq), key))
+        if self.metrics is not None:
+            self.metrics.count('llm.coalesced')
+        return True
+
+    def pending(self) -> int:
+        with self._cv:
+            return len(self._queued) + len(self._inflight)
+
+    def is_pending(self, key: Tuple[str, str]) -> bool:
+        with self._cv:
+            return key in self._queued or key in self._inflight
+
+    def drop_involving(self, name: str):
+        """Forget buffered lines and queued requests for pairs with `name`, and cancel in-flight ones.
+
+        Lines that stream in afterwards for those pairs are discarded. A
+        packed request is only cancelled once none of its pairs is wanted.
+        """
+        with self._cv:
+            stale = [k for k in self._queued if name in k]
+            for k in stale:
+                del self._queued[k]
+            gone = [k for k in self._inflight if name in k]
+            futs = {id(f): f for f in (self._inflight.pop(k) for k in gone) if f is not None}
+            for f in self._inflight.values():
+                futs.pop(id(f), None)
+            with self.lock:
+                for k in [k for k in self.buffers if name in k]:
+                    del self.buffers[k]
+        # requests not submitted yet are cancelled by _dispatch
+        for fut in futs.values():
+            fut.cancel()
+        if self.metrics is not None and (stale or gone):
+            self.metrics.count('llm.dropped', len(stale) + len(gone))
 
-    def pop(self, key: Tuple[str, str]) -> Optional[str]:
+    def pop(self, key: Tuple[str, str], speaker: Optional[str] = None) -> Optional[str]:
+        """Next buffered line for `key`; with `speaker`, only an exchange turn of theirs."""
         with self.lock:
             dq = self.buffers.get(key)
             if dq:
+                if speaker is not None and turn_speaker(dq[0]) != speaker:
+                    return None
                 try:
                     return dq.popleft()
                 except IndexError:
                     return None
         return None
 
+    def fill(self, key: Tuple[str, str], lines: List[str]):
+        with self.lock:
+            self.buffers[key].extend(lines)
+
+    def peek(self, key: Tuple[str, str]) -> Optional[str]:
+        with self.lock:
+            dq = self.buffers.get(key)
+            return dq[0] if dq else None
+
     def size(self, key: Tuple[str, str]) -> int:
         with self.lock:
             dq = self.buffers.get(key)
             return len(dq) if dq else 0
 
+    def account(self, system: str, messages: List[dict]):
+        """Count one request's estimated prompt and prefix tokens, and whether its prefix was sent recently."""
+        if self.metrics is None:
+            return
+        with self._prefix_lock:
+            reused = system in self._prefixes
+            self._prefixes[system] = None
+            self._prefixes.move_to_end(system)
+            if len(self._prefixes) > PREFIX_WINDOW:
+                self._prefixes.popitem(last=False)
+        prefix = estimate_tokens(system)
+        m = self.metrics
+        m.count('llm.requests')
+        m.count('llm.prompt_tokens', prefix + sum(estimate_tokens(msg['content']) for msg in messages))
+        m.count('llm.prefix_tokens', prefix)
+        if reused:
+            m.count('llm.prefix_reused')
+            m.count('llm.prefix_reused_tokens', prefix)
+
+    def export_buffers(self) -> List[list]:
+        with self.lock:
+            return [[a, b, list(dq)] for (a, b), dq in self.buffers.items() if dq]
+
+    def import_buffers(self, items: List[list]):
+        with self.lock:
+            self.buffers.clear()
+            for a, b, lines in items:
+                self.buffers[(a, b)].extend(lines)
+
+    def close(self):
+        """Finish pending cache writes; call after stop_event is set."""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
     # Internal -----------------------------------------------------------
+    def _count_usage(self, usage: dict):
+        for name, n in usage.items():
+            if n:
+                self.metrics.count(f'llm.usage.{name}', n)
+
     def _run(self):
         while not self.stop_event.is_set():
-            try:
-                key, payload = self.requests.get(timeout=0.25)
-            except queue.Empty:
-                continue
-            if self.stop_event.is_set():
+            # take a slot first so the most urgent request is picked when one frees up
+            if self._submit is not None and not self._acquire_slot():
                 break
-            system = payload.get('system')
-            prompt = payload.get('prompt')
-            count = int(payload.get('count', 6))
-            max_tokens = int(payload.get('max_tokens', count * 28))
-            temperature = float(payload.get('temperature', 0.8))
-            if not self.client.is_available():
+            items = self._next(timeout=0.25)
+            job = self._job(items) if items else None
+            if job is None:
+                if self._submit is not None:
+                    self._slots.release()
                 continue
-            raw = self.client.generate(system, [{"role": "user", "content": prompt}], max_tokens=max_tokens, temperature=temperature)
-            if not raw:
-                continue
-            # Split into candidate lines
-            lines = [l.strip().strip('"').strip("'") for l in raw.splitlines()]
-            cleaned: List[str] = []
-            for ln in lines:
-                if not ln:
+            if self._submit is not None:
+                self._dispatch(job)
+            else:
+                self._process(job)
+
+    def _acquire_slot(self) -> bool:
+        while not self._slots.acquire(timeout=0.25):
+            if self.stop_event.is_set():
+                return False
+        return True
+
+    def _next(self, timeout: float) -> List[Tuple[Tuple[str, str], dict, int]]:
+        """Pop the most urgent live request, plus more to pack with it, and mark them in flight."""
+        with self._cv:
+            end = time.monotonic() + timeout
+            while not self._heap:
+                remaining = end - time.monotonic()
+                if remaining <= 0 or self.stop_event.is_set():
+                    return []
+                self._cv.wait(remaining)
+            items: List[Tuple[Tuple[str, str], dict, int]] = []
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                priority, _, key = entry
+                queued = self._queued.get(key)
+                if queued is None or queued[0] != priority:
                     continue
-                # Strip simple numbering markers
-                head = ln.split(' ', 1)[0]
-                if any(head.startswith(p) for p in ('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
-                    ln = ln.split(' ', 1)[1] if ' ' in ln else ''
-                ln = ln.lstrip('-').lstrip('*').strip()
-                if ln:
-                    cleaned.append(ln)
-                if len(cleaned) >= count:
+                payload = queued[1]
+                if items and not (self._packable(items[0][1]) and self._packable(payload)):
+                    heapq.heappush(self._heap, entry)
                     break
-            if not cleaned:
+                del self._queued[key]
+                self._inflight[key] = None
+                items.append((key, payload, priority))
+                if len(items) >= self.pack_pairs:
+                    break
+            return items
+
+    def _packable(self, payload: dict) -> bool:
+        return self.pack_pairs > 1 and 'pair_block' in payload and not payload.get('single')
+
+    def _finish(self, key: Tuple[str, str]) -> bool:
+        """Mark `key` done; False if it was dropped while in flight."""
+        with self._cv:
+            return self._inflight.pop(key, False) is not False
+
+    def _job(self, items: List[Tuple[Tuple[str, str], dict, int]]) -> Optional["_BatchJob"]:
+        """A client request for the items whose deadline has not passed, or None."""
+        if not self.client.is_available():
+            for key, _, _ in items:
+                self._finish(key)
+            return None
+        live = []
+        now = time.monotonic()
+        for item in items:
+            deadline = item[1].get('deadline')
+            if deadline is not None and deadline <= now:
+                self._finish(item[0])
+                if self.metrics is not None:
+                    self.metrics.count('llm.expired')
                 continue
-            with self.lock:
-                dq = self.buffers[key]
-                for ln in cleaned:
-                    dq.append(ln)
+            live.append(item)
+        return _BatchJob(live, self.request_timeout) if live else None
+
+    def _dispatch(self, job: "_BatchJob"):
+        """Hand the job to the async client; the caller holds an in-flight slot."""
+        self.account(job.system, job.messages)
+        def on_chunk(text: str):
+            self._push(job, job.splitter.feed(text))
+
+        def done(raw: Optional[str]):
+            self._slots.release()
+            self._complete(job, raw)
+
+        fut = self._submit(job.system, job.messages, max_tokens=job.max_tokens, temperature=job.temperature,
+                           timeout=job.timeout, callback=done, on_chunk=on_chunk if self.stream else None)
+        with self._cv:
+            live = [key for key in job.keys if key in self._inflight]
+            for key in live:
+                self._inflight[key] = fut
+        if not live:
+            fut.cancel()  # dropped by drop_involving() while being submitted
+
+    def _process(self, job: "_BatchJob"):
+        self.account(job.system, job.messages)
+        stream = getattr(self.client, 'stream', None) if self.stream else None
+        if stream is not None:
+            parts = []
+            for text in stream(job.system, job.messages, max_tokens=job.max_tokens, temperature=job.temperature,
+                               timeout=job.timeout):
+                parts.append(text)
+                self._push(job, job.splitter.feed(text))
+            raw = "".join(parts).strip() or None
+        else:
+            raw = self.client.generate(job.system, job.messages, max_tokens=job.max_tokens,
+                                       temperature=job.temperature, timeout=job.timeout)
+        self._complete(job, raw)
+
+    def _complete(self, job: "_BatchJob", raw: Optional[str]):
+        if raw:
+            # a client that ignored on_chunk delivers everything here
+            splitter = job.splitter
+            self._push(job, splitter.finish() if splitter.fed else splitter.feed(raw) + splitter.finish())
+        live = [self._finish(key) for key in job.keys]
+        if self.metrics is not None:
+            self.metrics.record('llm.batch', time.perf_counter() - job.started)
+            now = time.monotonic()
+            late = sum(1 for _, payload, _ in job.items if payload.get('deadline', now) < now)
+            if raw and late:
+                self.metrics.count('llm.late', late)
+            if job.packed:
+                self.metrics.count('llm.packed', len(job.items))
+        if not raw:
+            return  # failed or timed out: keep what streamed in, drop the partial tail
+        if self.cache is not None:
+            if self._writer is not None:
+                try:
+                    self._writer.submit(self._store, job)
+                except RuntimeError:
+                    pass  # completed after close(): the run is over
+            else:
+                self._store(job)
+        if job.packed:
+            # the model skipped or mangled these pairs: retry them on their own
+            retry = [(key, payload, priority) for (key, payload, priority), ok in zip(job.items, live)
+                     if ok and not job.lines[key]]
+            if self.metrics is not None and retry:
+                self.metrics.count('llm.pack_fallback', len(retry))
+            for key, payload, priority in retry:
+                if payload.get('deadline') is not None:
+                    # the packed call may have outlived the deadline: give the retry as long to wait as it had
+                    payload = dict(payload, deadline=time.monotonic() + max(0.0, payload['deadline'] - job.sent))
+                self.enqueue(key, dict(payload, single=True), priority)
+
+    def _store(self, job: "_BatchJob"):
+        for key, payload, _ in job.items:
+            meta = payload.get('cache')
+            if meta and job.lines[key]:
+                self.cache.put(*meta, job.lines[key], exchange=bool(payload.get('speakers')))
+
+    def _push(self, job: "_BatchJob", ready: List[str]):
+        routed = job.route(ready)
+        if not routed:
+            return
+        if self.metrics is not None and job.first:
+            self.metrics.record('llm.first_line', time.perf_counter() - job.started)
+        job.first = False
+        with self._cv, self.lock:
+            for key, lines in routed.items():
+                if key in self._inflight:  # not dropped by drop_involving()
+                    self.buffers[key].extend(lines)
+
+
+class _BatchJob:
+    """One client request: a single pair's batch, or several packed into one prompt."""
+
+    def __init__(self, items: List[Tuple[Tuple[str, str], dict, int]], timeout: float):
+        self.items = items
+        self.keys = [key for key, _, _ in items]
+        self.packed = len(items) > 1
+        self.timeout = timeout
+        self.started = time.perf_counter()
+        self.sent = time.monotonic()
+        self.first = True
+        self.counts = {key: int(payload.get('count', 6)) for key, payload, _ in items}
+        self.speakers = {key: payload.get('speakers') for key, payload, _ in items}
+        self.lines: Dict[Tuple[str, str], List[str]] = {key: [] for key in self.keys}
+        head = items[0][1]
+        self.temperature = float(head.get('temperature', 0.8))
+        self.max_tokens = sum(int(p.get('max_tokens', self.counts[k] * 28)) for k, p, _ in items)
+        if self.packed:
+            self.system = f"{head.get('pack_system', head.get('system'))}\n\n{pack_rules(bool(head.get('speakers')))}"
+            prompt = pack_prompt([p for _, p, _ in items])
+            self.max_tokens += 4 * sum(self.counts.values())  # the [Pn] tags
+            # tags are parsed before cleanup; allow for some untagged chatter
+            self.splitter = LineAssembler(2 * sum(self.counts.values()), clean=str.strip)
+        else:
+            self.system = head.get('system')
+            prompt = head.get('prompt')
+            self.splitter = LineAssembler(self.counts[self.keys[0]])
+        self.messages = [{"role": "user", "content": prompt}]
+
+    def route(self, lines: List[str]) -> Dict[Tuple[str, str], List[str]]:
+        """Assign finished lines to their pairs, dropping untagged ones and extras."""
+        out: Dict[Tuple[str, str], List[str]] = {}
+        for ln in lines:
+            key = self.keys[0]
+            if self.packed:
+                m = PACK_TAG.match(ln)
+                if m is None or not 1 <= int(m.group(1)) <= len(self.keys):
+                    continue
+                key = self.keys[int(m.group(1)) - 1]
+                ln = clean_line(m.group(2))
+            if ln and self.speakers[key]:
+                ln = exchange_turn(ln, self.speakers[key])
+            if ln and len(self.lines[key]) < self.counts[key]:
+                self.lines[key].append(ln)
+                out.setdefault(key, []).append(ln)
+        return out
+
+
+def pack_rules(exchange: bool) -> str:
+    """Output rules for packed requests; static, so they can sit in the cached system prefix."""
+    if exchange:
+        return (
+            "Each request covers several separate conversations in the store, tagged [P1], [P2], ...\n"
+            "For EACH conversation, write its next turns, alternating between the two characters "
+            "and starting with the named speaker.\n"
+            "Rules:\n- Each turn ONE line, <=18 words.\n- No narration or quotes.\n"
+            "Output ONLY the turns, each on its own line, starting with its conversation tag and the speaker's "
+            "name, e.g. [P1] Name: ..."
+        )
+    return (
+        "Each request covers several separate conversations in the store, tagged [P1], [P2], ...\n"
+        "For EACH conversation, generate possible next single lines the named speaker might say.\n"
+        "Rules:\n- Each line standalone, <=18 words.\n- No quotes or speaker labels.\n- Vary wording.\n"
+        "Output ONLY the lines, each on its own line, starting with its conversation tag, e.g. [P1] ..."
+    )
+
+
+def pack_prompt(payloads: List[dict]) -> str:
+    """The dynamic part of a packed request: each pair's 'pair_block' and how many lines it needs."""
+    count = max(int(p.get('count', 6)) for p in payloads)
+    blocks = "\n\n".join(f"[P{n}]\n{p['pair_block']}" for n, p in enumerate(payloads, 1))
+    unit = "turns" if payloads[0].get('speakers') else "lines"
+    return f"{blocks}\n\nWrite {count} {unit} for each of these {len(payloads)} conversations."
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English prompt text (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def exchange_turn(line: str, speakers: List[str]) -> str:
+    """'Name: text' normalised to one of `speakers`, or '' if the line is not such a turn."""
+    name, sep, text = line.partition(':')
+    name = name.strip().strip('*').strip()
+    text = clean_line(text).strip('"').strip("'")
+    if not sep or not text:
+        return ''
+    for speaker in speakers:
+        if name.lower() == speaker.lower():
+            return f"{speaker}: {text}"
+    return ''
+
+
+def turn_speaker(line: str) -> str:
+    """Speaker name of a buffered exchange turn."""
+    return line.partition(':')[0]
+
+
+def clean_line(ln: str) -> str:
+    """One candidate line with quotes, numbering and bullets stripped ('' if nothing is left)."""
+    ln = ln.strip().strip('"').strip("'")
+    if not ln:
+        return ''
+    # Strip simple numbering markers
+    head = ln.split(' ', 1)[0]
+    if any(head.startswith(p) for p in ('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.')):
+        ln = ln.split(' ', 1)[1] if ' ' in ln else ''
+    return ln.lstrip('-').lstrip('*').strip()
+
+
+class LineAssembler:
+    """Splits completion text into cleaned candidate lines as it arrives.
+
+    feed() takes the next chunk of a streamed completion and returns the lines
+    it completed; finish() flushes the final unterminated line. At most
+    `limit` lines are returned in total, each passed through `clean`
+    (clean_line by default).
+    """
+
+    def __init__(self, limit: int, clean: Optional[Callable[[str], str]] = None):
+        self.limit = limit
+        self.clean = clean or clean_line
+        self.emitted = 0
+        self._partial = ''
+        self.fed = False
+
+    def feed(self, text: str) -> List[str]:
+        self.fed = True
+        if self.emitted >= self.limit:
+            return []
+        *complete, self._partial = (self._partial + text).split('\n')
+        return self._take(complete)
+
+    def finish(self) -> List[str]:
+        tail, self._partial = self._partial, ''
+        return self._take([tail])
+
+    def _take(self, raw: List[str]) -> List[str]:
+        out = []
+        for ln in raw:
+            ln = self.clean(ln)
+            if ln and self.emitted < self.limit:
+                out.append(ln)
+                self.emitted += 1
+        return out
@@ -1,12 +1,13 @@
 import random
 import re
 import threading
+import time
 from collections import deque
 from typing import Dict, List, Tuple, Optional
 
-from src.lm_integration.client import LocalLLMClient
+from src.lm_integration.client import AsyncLocalLLMClient, LocalLLMClient
 from src.characters.character import Character
-from src.dialogue.batch_worker import DialogueBatchWorker
+from src.dialogue.batch_worker import PRIORITY_ADJACENT, PRIORITY_SPECULATIVE, DialogueBatchWorker, turn_speaker
 
 SYSTEM_PROMPT = (
     "You are generating a SINGLE short in-character line of dialogue for a simulation in a convenience store.\n"
@@ -14,6 +15,18 @@ SYSTEM_PROMPT = (
     "- Under 18 words.\n- Natural casual tone.\n- Avoid trailing conjunctions like 'and', 'but'.\n- Finish the thought with punctuation."
 )
 
+# rules that follow the characters in a pair's static prompt prefix
+EXCHANGE_RULES = (
+    "Each request asks for the next turns of their conversation, alternating between the two of them.\n"
+    "Rules:\n- Each turn ONE line, <=18 words.\n- No narration or quotes.\n"
+    "Output ONLY the turns, each on its own line, starting with the speaker's name, e.g. Name: ..."
+)
+LINES_RULES = (
+    "Each request asks for possible next single lines one of them might say to the other.\n"
+    "Rules:\n- Each line standalone, <=18 words.\n- No quotes or speaker labels.\n- Vary wording.\n"
+    "Output ONLY the lines, each on its own line."
+)
+
 TOPICS = [
     "snack brands",
     "energy drinks",
@@ -33,10 +46,52 @@ class DialogueManager:
 
     Public method generate_line remains synchronous & non-blocking; it will pull a
     pre-generated line from a buffer or fall back to a quick single call / template.
+    With nonblocking=True (the default unless batches run inline) the single
+    call is skipped too: a buffer miss gets a template line at once, and the
+    batch queued for the pair fills the buffer for next time. A batch still
+    queued `llm_deadline` seconds after it was asked for is dropped; one the
+    server already has is left to finish, however late, into that buffer.
+    Up to `pack_pairs` waiting batches share one LLM call (pack_pairs=1 sends
+    one request per pair).
+
+    With exchange=True a batch is a short script of alternating turns for
+    both characters; generate_line serves it in order, and callers ask
+    next_speaker() who has the next turn.
+
+    Batch prompts are split for the server's prompt (KV) cache: the system
+    message is a static prefix per pair (SYSTEM_PROMPT, both personalities in
+    name order, the output rules) and everything that changes between
+    requests (situation, memories, thread) goes in the user message after it.
+
+    With a `cache` (src.dialogue.line_cache.LineCache), a stored batch for the
+    same speaker, listener, topic and situational bucket is used before the
+    LLM is asked, and works with the LLM offline.
+
+    Pass `client` to substitute a recording/replay client, `rng` for a seeded
+    random stream, and inline_batches=True to fill batches synchronously so a
+    run does not depend on worker-thread timing (needed for exact replays).
+    With `metrics` (src.engine.metrics.Metrics), LLM latencies and line
+    sources (buffer hit, single call, fallback template) are recorded.
+    Without a `client`, an AsyncLocalLLMClient with up to `llm_concurrency`
+    requests in flight is created (LocalLLMClient when llm_concurrency=1) and
+    closed by shutdown(); with llm=False no client is started at all and only
+    templates (or the cache) are used. stream_batches=False waits for whole batch
+    completions instead of buffering each line as it streams in.
     """
 
-    def __init__(self, batch_size: int = 6, min_buffer: int = 2):
-        self.client = LocalLLMClient()
+    def __init__(self, batch_size: int = 6, min_buffer: int = 2, client=None,
+                 rng: Optional[random.Random] = None, inline_batches: bool = False, metrics=None,
+                 llm_concurrency: Optional[int] = None, stream_batches: bool = True,
+                 nonblocking: Optional[bool] = None, llm_deadline: float = 6.0, pack_pairs: int = 4,
+                 exchange: bool = True, cache=None, llm: bool = True):
+        self._owns_client = client is None
+        if client is None and not llm:
+            client = LocalLLMClient(enabled=False)
+        elif client is None:
+            client = LocalLLMClient() if llm_concurrency == 1 else AsyncLocalLLMClient(llm_concurrency)
+        self.client = client
+        self.rng = rng if rng is not None else random.Random()
+        self.metrics = metrics
         self.available = self.client.is_available()
         # mapping pair key -> last chosen topic (for diversity)
         self.pair_topic: Dict[Tuple[str, str], str] = {}
@@ -45,9 +100,15 @@ class DialogueManager:
         self.threads: Dict[Tuple[str, str], Dict[str, object]] = {}
         # async batching infra
         self.stop_event = threading.Event()
-        self.batch_worker = DialogueBatchWorker(self.client, self.stop_event)
+        self.batch_worker = DialogueBatchWorker(self.client, self.stop_event, inline=inline_batches, metrics=metrics,
+                                                stream=stream_batches, pack_pairs=pack_pairs,
+                                                cache=cache)
         self.batch_size = batch_size
         self.min_buffer = min_buffer
+        self.nonblocking = not inline_batches if nonblocking is None else nonblocking
+        self.llm_deadline = llm_deadline
+        self.exchange = exchange
+        self.cache = cache
 
     # ----------------- internal utilities -----------------
     def _pair_key(self, a: Character, b: Character) -> Tuple[str, str]:
@@ -76,6 +137,34 @@ class DialogueManager:
         lines.append("Present characters: " + ", ".join(sorted(active_names)))
         return "\n".join(lines)
 
+    def pair_prefix(self, a: Character, b: Character) -> str:
+        """Static system prompt for a pair's batches, identical in both directions."""
+        first, second = sorted((a, b), key=lambda c: c.name)
+        return (
+            f"{SYSTEM_PROMPT}\n\n"
+            f"Characters:\n- {first.name}: {first.personality}\n- {second.name}: {second.personality}\n\n"
+            + (EXCHANGE_RULES if self.exchange else LINES_RULES)
+        )
+
+    def _situational_bucket(self, situational: str) -> str:
+        if 'register' in situational:
+            return 'register'
+        if 'shelf' in situational:
+            return 'shelf'
+        if 'checkout' in situational or 'line' in situational:
+            return 'queue'
+        if 'produce' in situational:
+            return 'produce'
+        if 'coffee' in situational:
+            return 'coffee'
+        if 'magazine' in situational:
+            return 'magazine'
+        if 'drink racks' in situational:
+            return 'drinks'
+        if 'freezer' in situational:
+            return 'freezer'
+        return 'aisles'
+
     def _choose_topic(self, speaker: Character, listener: Character, situational: str) -> str:
         key = self._pair_key(speaker, listener)
         last = self.pair_topic.get(key)
@@ -90,32 +179,15 @@ class DialogueManager:
             'drinks': ['energy drinks', 'prices vs last week'],
             'freezer': ['late-night cravings', 'prices vs last week']
         }
-        bucket = 'aisles'
-        if 'register' in situational:
-            bucket = 'register'
-        elif 'shelf' in situational:
-            bucket = 'shelf'
-        elif 'checkout' in situational or 'line' in situational:
-            bucket = 'queue'
-        elif 'produce' in situational:
-            bucket = 'produce'
-        elif 'coffee' in situational:
-            bucket = 'coffee'
-        elif 'magazine' in situational:
-            bucket = 'magazine'
-        elif 'drink racks' in situational:
-            bucket = 'drinks'
-        elif 'freezer' in situational:
-            bucket = 'freezer'
-        candidates = situ_map.get(bucket, TOPICS)
+        candidates = situ_map.get(self._situational_bucket(situational), TOPICS)
         weights = []
         for t in candidates:
             if t == last:
                 continue
             usage = self.topic_counts.get(t, 0)
-            weights.append((t, 1.0 / (1 + usage) + random.uniform(0, 0.25)))
+            weights.append((t, 1.0 / (1 + usage) + self.rng.uniform(0, 0.25)))
         if not weights:
-            chosen = random.choice(TOPICS)
+            chosen = self.rng.choice(TOPICS)
         else:
             weights.sort(key=lambda x: x[1], reverse=True)
             chosen = weights[0][0]
@@ -140,7 +212,7 @@ class DialogueManager:
                 'last_tick': tick
             }
         else:
-            if random.random() < 0.15:
+            if self.rng.random() < 0.15:
                 data['topic'] = topic
             data['last_tick'] = tick
         return self.threads[key]
@@ -149,32 +221,82 @@ class DialogueManager:
         to_del = [k for k in self.threads if name in k]
         for k in to_del:
             del self.threads[k]
+        self.batch_worker.drop_involving(name)
 
     # ----------------- batching -----------------
-    def _ensure_batch(self, speaker: Character, listener: Character, situational: str, tick: int):
-        if not self.available:
-            return
+    def _ensure_batch(self, speaker: Character, listener: Character, situational: str, tick: int,
+                      priority: int = PRIORITY_ADJACENT) -> bool:
+        """Top up the pair's buffer from the cache or queue an LLM batch; True if a request was queued."""
+        if not self.available and self.cache is None:
+            return False
         key = self._pair_key(speaker, listener)
-        if self.batch_worker.size(key) >= self.min_buffer:
-            return
+        if self.batch_worker.size(key) >= self.min_buffer or self.batch_worker.promote(key, priority):
+            return False
         topic = self._choose_topic(speaker, listener, situational)
         thread = self._ensure_thread(speaker, listener, topic, tick)
-        context = self.build_context(speaker, listener, active_names=[speaker.name, listener.name])
         thread_topic = thread['topic']  # type: ignore[index]
-        batch_prompt = (
-            f"Characters:\n- {speaker.name}: {speaker.personality}\n- {listener.name}: {listener.personality}\n\n"
-            f"Situation: {situational}\nContext:\n{context}\n\n"
+        cache_key = [speaker.name, listener.name, thread_topic, self._situational_bucket(situational)]
+        if self.cache is not None:
+            lines = self.cache.take(*cache_key, exchange=self.exchange)
+            if self.metrics is not None:
+                self.metrics.count('cache.hit' if lines else 'cache.miss')
+            if lines:
+                self.batch_worker.fill(key, lines)
+                return False
+        if not self.available:
+            return False
+        context = self.build_context(speaker, listener, active_names=[speaker.name, listener.name])
+        # dynamic suffix, least volatile first; the pair's static prefix is the system message
+        situation = (
             f"Ongoing thread topic: {thread_topic}\n"
-            f"Generate {self.batch_size} possible next SINGLE LINES that {speaker.name} might say to {listener.name}.\n"
-            "Rules:\n- Each line standalone, <=18 words.\n- No quotes or speaker labels.\n- Vary wording.\nOutput ONLY the lines, each on its own line."
+            f"Situation: {situational}\nContext:\n{context}\n\n"
         )
-        self.batch_worker.enqueue(key, {
-            'system': SYSTEM_PROMPT,
-            'prompt': batch_prompt,
+        if self.exchange:
+            task = f"Write the next {self.batch_size} turns, starting with {speaker.name}."
+        else:
+            task = f"Generate {self.batch_size} possible next lines that {speaker.name} might say to {listener.name}."
+        payload = {
+            'system': self.pair_prefix(speaker, listener),
+            'prompt': situation + task,
+            # used with 'pack_system' instead of the above when the worker packs several pairs into one request
+            'pack_system': SYSTEM_PROMPT,
+            'pair_block': (
+                f"Characters:\n- {speaker.name}: {speaker.personality}\n- {listener.name}: {listener.personality}\n"
+                + situation + f"Speaker: {speaker.name}, talking to {listener.name}"
+            ),
             'count': self.batch_size,
             'max_tokens': self.batch_size * 26,
-            'temperature': 0.85
-        })
+            'temperature': 0.85,
+            'deadline': time.monotonic() + self.llm_deadline,
+            'cache': cache_key,
+        }
+        if self.exchange:
+            payload['speakers'] = [speaker.name, listener.name]
+            payload['max_tokens'] += self.batch_size * 4  # the name labels
+        return self.batch_worker.enqueue(key, payload, priority=priority)
+
+    def next_speaker(self, a: Character, b: Character) -> Optional[str]:
+        """Name of whoever has the next buffered exchange turn between a and b, if any."""
+        if not self.exchange:
+            return None
+        turn = self.batch_worker.peek(self._pair_key(a, b))
+        return turn_speaker(turn) if turn else None
+
+    def wants_batch(self, a: Character, b: Character) -> bool:
+        """False if the pair already has enough buffered lines or a batch queued or in flight."""
+        key = self._pair_key(a, b)
+        return self.batch_worker.size(key) < self.min_buffer and not self.batch_worker.is_pending(key)
+
+    def prefetch(self, speaker: Character, listener: Character, situational: str, tick: int) -> bool:
+        """Queue a speculative batch for a pair that has not started talking; True if an LLM request was queued
+        (False when the cache covered it or nothing was needed)."""
+        if not self.available or not self.wants_batch(speaker, listener):
+            return False
+        if not self._ensure_batch(speaker, listener, situational, tick, priority=PRIORITY_SPECULATIVE):
+            return False
+        if self.metrics is not None:
+            self.metrics.count('llm.prefetch')
+        return True
 
     # ----------------- sanitization -----------------
     def _sanitize(self, text: str) -> str:
@@ -201,19 +323,40 @@ class DialogueManager:
         return line
 
     # ----------------- public API -----------------
-    def generate_line(self, speaker: Character, listener: Character, situational: str, verbose: bool = False, retries: int = 0, tick: int = 0, active_names: Optional[List[str]] = None):
-        if active_names is None:
-            active_names = []
-        # schedule batch fill
-        self._ensure_batch(speaker, listener, situational, tick)
+    def generate_line(self, speaker: Character, listener: Character, situational: str, verbose: bool = False, retries: int = 0, tick: int = 0,
+                      priority: int = PRIORITY_ADJACENT):
         key = self._pair_key(speaker, listener)
-        raw = self.batch_worker.pop(key)
-        if not raw and self.available:
+        thread = self.threads.get(key)
+        first_contact = not (thread and thread['history'])
+        # schedule batch fill
+        self._ensure_batch(speaker, listener, situational, tick, priority=priority)
+        if self.exchange:
+            raw = self.batch_worker.pop(key, speaker=speaker.name)
+            if raw:
+                raw = raw.split(':', 1)[1].strip()
+        else:
+            raw = self.batch_worker.pop(key)
+        source = 'buffer'
+        if not raw and self.available and not self.nonblocking:
             # light single shot
             single_prompt = f"One short line (<=18 words). No quotes. Context: {situational}. {speaker.name} to {listener.name}."
-            raw = self.client.generate(SYSTEM_PROMPT, [{"role": "user", "content": single_prompt}], max_tokens=42, temperature=0.9)
+            messages = [{"role": "user", "content": single_prompt}]
+            self.batch_worker.account(SYSTEM_PROMPT, messages)
+            started = time.perf_counter()
+            raw = self.client.generate(SYSTEM_PROMPT, messages, max_tokens=42, temperature=0.9,
+                                       timeout=self.llm_deadline)
+            if self.metrics is not None:
+                self.metrics.record('llm.single', time.perf_counter() - started)
+            source = 'single'
         if not raw:
-            raw = self.client.fallback(speaker.name, listener.name, situational)
+            raw = self.client.fallback(speaker.name, listener.name, situational, rng=self.rng)
+            source = 'fallback'
+        if self.metrics is not None:
+            self.metrics.count('lines')
+            self.metrics.count(f'lines.{source}')
+            if first_contact:
+                self.metrics.count('lines.first')
+                self.metrics.count(f'lines.first.{source}')
         msg = self._sanitize(raw)
         # mitigate register repetition
         if 'register' in situational:
@@ -232,5 +375,31 @@ class DialogueManager:
                 history.append(f"{speaker.name}: {msg}")
         return msg
 
+    # ----------------- snapshot support -----------------
+    def export_state(self) -> dict:
+        return {
+            'pair_topic': [[a, b, t] for (a, b), t in self.pair_topic.items()],
+            'topic_counts': dict(self.topic_counts),
+            'threads': [
+                [a, b, th['topic'], list(th['history']), th['last_tick']]  # type: ignore[call-overload]
+                for (a, b), th in self.threads.items()
+            ],
+            'buffers': self.batch_worker.export_buffers(),
+            'rng': self.rng.getstate(),
+        }
+
+    def import_state(self, state: dict):
+        self.pair_topic = {(a, b): t for a, b, t in state['pair_topic']}
+        self.topic_counts = dict(state['topic_counts'])
+        self.threads = {
+            (a, b): {'topic': topic, 'history': deque(hist, maxlen=8), 'last_tick': last}
+            for a, b, topic, hist, last in state['threads']
+        }
+        self.batch_worker.import_buffers(state['buffers'])
+        self.rng.setstate(state['rng'])
+
     def shutdown(self):
         self.stop_event.set()
+        if self._owns_client and hasattr(self.client, 'close'):
+            self.client.close()
+        self.batch_worker.close()
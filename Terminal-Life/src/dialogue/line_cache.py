@@ -0,0 +1,105 @@
+"""Persistent store of generated dialogue batches.
+
+Each row is one batch (a list of lines, or of "Name: line" turns in exchange
+mode) keyed by speaker, listener, thread topic and situational bucket. The
+batch worker adds every completed batch; DialogueManager takes one from here
+before asking the LLM, so warm starts and offline runs reuse earlier output.
+
+Rows are evicted least-recently-used beyond `max_rows` (a row that was
+never served counts as used when it was stored) and dropped after
+`ttl_seconds`. A row is not served to the same pair again until `no_repeat`
+other batches have been served to that pair.
+"""
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    speaker TEXT NOT NULL,
+    listener TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    exchange INTEGER NOT NULL,
+    lines TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL DEFAULT 0,
+    uses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS batches_key ON batches (speaker, listener, topic, bucket, exchange, last_used);
+CREATE INDEX IF NOT EXISTS batches_lru ON batches (last_used, created);
+"""
+
+PRUNE_EVERY = 100  # inserts between TTL / size sweeps
+
+
+class LineCache:
+    """SQLite (WAL) cache of dialogue batches, safe to share between threads."""
+
+    def __init__(self, path: str, max_rows: int = 50_000, ttl_seconds: float = 30 * 86400, no_repeat: int = 8):
+        self.path = path
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.no_repeat = no_repeat
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._inserts = 0
+        self.prune()
+
+    def put(self, speaker: str, listener: str, topic: str, bucket: str, lines: List[str], exchange: bool = False):
+        if not lines:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO batches (speaker, listener, topic, bucket, exchange, lines, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (speaker, listener, topic, bucket, int(exchange), json.dumps(lines, ensure_ascii=False), now, now))
+            self._inserts += 1
+            sweep = self._inserts % PRUNE_EVERY == 0
+        if sweep:
+            self.prune()
+
+    def take(self, speaker: str, listener: str, topic: str, bucket: str, exchange: bool = False) -> Optional[List[str]]:
+        """Batch for this key outside the pair's no-repeat window, or None.
+
+        Batches never served come first, then the least recently used.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                """SELECT id, lines FROM batches
+                   WHERE speaker = ? AND listener = ? AND topic = ? AND bucket = ? AND exchange = ? AND created >= ?
+                     AND id NOT IN (SELECT id FROM batches WHERE speaker = ? AND listener = ? AND uses > 0
+                                    ORDER BY last_used DESC LIMIT ?)
+                   ORDER BY uses > 0, last_used, id LIMIT 1""",
+                (speaker, listener, topic, bucket, int(exchange), now - self.ttl_seconds,
+                 speaker, listener, self.no_repeat)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE batches SET last_used = ?, uses = uses + 1 WHERE id = ?", (now, row[0]))
+        return json.loads(row[1])
+
+    def prune(self):
+        """Drop expired rows, then the least recently used ones beyond max_rows."""
+        with self._lock:
+            self._db.execute("DELETE FROM batches WHERE created < ?", (time.time() - self.ttl_seconds,))
+            excess = self._db.execute("SELECT COUNT(*) FROM batches").fetchone()[0] - self.max_rows
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM batches WHERE id IN (SELECT id FROM batches ORDER BY last_used, id LIMIT ?)",
+                    (excess,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,139 @@
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from src.characters.character import Character
+
+
+class DialoguePrefetcher:
+    """Warms dialogue buffers for pairs that are about to meet; attach as `sim.prefetcher`.
+
+    Every `every` ticks on-stage characters are walked forward along their
+    routes (explicit path or flow field, after any wait) for up to `horizon`
+    ticks, and pairs that will stand within `radius` of each other are ranked by how
+    soon that happens. At most `budget` speculative batches are queued per
+    run, and none while `max_pending` requests are already queued or in
+    flight, so prefetch only spends spare LLM capacity. Characters with more
+    than `max_crowd` others around them are skipped: any one pair in a crowd
+    is unlikely to be the one that talks.
+    """
+
+    def __init__(self, horizon: int = 8, every: int = 3, budget: int = 4, max_pending: int = 8, radius: int = 1,
+                 max_crowd: int = 6):
+        self.horizon = horizon
+        self.every = every
+        self.budget = budget
+        self.max_pending = max_pending
+        self.radius = radius
+        self.max_crowd = max_crowd
+
+    def maybe_run(self, sim) -> int:
+        if self.every <= 0 or sim.ticks % self.every:
+            return 0
+        return self.run(sim)
+
+    def run(self, sim) -> int:
+        """Queue batches for the soonest predicted meetings; returns how many were queued."""
+        mgr = sim.dialogue_mgr
+        if not mgr.available or self.budget <= 0:
+            return 0
+        room = min(self.budget, self.max_pending - mgr.batch_worker.pending())
+        if room <= 0:
+            return 0
+        queued = 0
+        chars = sim.visible_characters(0, 0, sim.layout.height, sim.layout.width)
+        for _, a, b in self.meetings(chars, wait=sim.remaining_wait, want=mgr.wants_batch):
+            if mgr.prefetch(a, b, sim.situational_context(a, b), sim.ticks):
+                queued += 1
+                if queued >= room:
+                    break
+        return queued
+
+    def meetings(self, chars: List[Character], wait: Optional[Callable[[Character], int]] = None,
+                 want: Optional[Callable[[Character, Character], bool]] = None
+                 ) -> Iterator[Tuple[int, Character, Character]]:
+        """(ticks until they meet, a, b) for pairs meeting within the horizon, soonest first.
+
+        Within a tick, characters with fewer neighbours come first: the
+        conversation picker chooses a random partner among all neighbours, so
+        a pair in a crowd is far less likely to talk than a pair on its own.
+        Characters already in a crowd are not projected at all, and routes
+        advance one tick per step of the generator, so a run that only needs
+        a few pairs stops projecting early. `wait(c)` gives the ticks before
+        `c` moves again (default c.waiting_ticks); pairs for which `want(a, b)`
+        is false are passed over.
+        """
+        r = self.radius
+        offsets = [(dy, dx) for dy in range(-r, r + 1) for dx in range(-r, r + 1)]
+        limit = self.max_crowd + 1  # crowd counts the character itself
+        start = [(c.pos.y, c.pos.x) for c in chars]
+        cells = self._cells(start)
+        crowd = {cell: self._crowd(cells, cell, offsets) for cell in cells}
+        walkers = [_Walker(c, at, wait) for c, at in zip(chars, start) if crowd[at] <= limit]
+        seen: Set[Tuple[int, int]] = set()
+        for t in range(self.horizon + 1):
+            if t:
+                for w in walkers:
+                    w.advance()
+            cells = self._cells([w.at for w in walkers])
+            crowd = {cell: self._crowd(cells, cell, offsets) for cell in cells}
+            # only characters with someone in reach can meet anyone this tick
+            social = [i for i, w in enumerate(walkers) if 1 < crowd[w.at] <= limit]
+            social.sort(key=lambda i: (crowd[walkers[i].at], walkers[i].c.name))
+            for i in social:
+                y, x = walkers[i].at
+                near = [j for dy, dx in offsets for j in cells.get((y + dy, x + dx), ())
+                        if j != i and crowd[walkers[j].at] <= limit]
+                near.sort(key=lambda j: (crowd[walkers[j].at], walkers[j].c.name))
+                for j in near:
+                    pair = (i, j) if i < j else (j, i)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    a, b = walkers[pair[0]].c, walkers[pair[1]].c
+                    if want is None or want(a, b):
+                        yield t, a, b
+
+    @staticmethod
+    def _cells(at: List[Tuple[int, int]]) -> Dict[Tuple[int, int], List[int]]:
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, cell in enumerate(at):
+            cells.setdefault(cell, []).append(i)
+        return cells
+
+    @staticmethod
+    def _crowd(cells, cell: Tuple[int, int], offsets) -> int:
+        y, x = cell
+        return sum(len(cells.get((y + dy, x + dx), ())) for dy, dx in offsets)
+
+
+class _Walker:
+    """One character's projected tile, advanced a tick at a time along its route (after any wait).
+
+    The wait and route are only read on the first advance(), so characters
+    projected for tick 0 alone cost nothing more.
+    """
+
+    __slots__ = ('c', 'at', 'waiting', 'path', 'flow', '_wait')
+
+    def __init__(self, c: Character, at: Tuple[int, int], wait: Optional[Callable[[Character], int]]):
+        self.c = c
+        self.at = at
+        self.waiting = None
+        self._wait = wait
+
+    def advance(self):
+        if self.waiting is None:
+            c = self.c
+            self.waiting = self._wait(c) if self._wait is not None else c.waiting_ticks
+            path = c.path
+            self.path = [(p.y, p.x) for p in reversed(path)] if path else None
+            self.flow = c.flow if not path else None
+        if self.waiting > 0:
+            self.waiting -= 1
+        elif self.path:
+            self.at = self.path.pop()
+        elif self.flow is not None:
+            nxt = self.flow.next_step(*self.at)
+            if nxt is None:
+                self.flow = None  # stays on its last tile
+            else:
+                self.at = nxt
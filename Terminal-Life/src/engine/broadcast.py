@@ -0,0 +1,231 @@
+"""Spectator stream: publishes delta-encoded frames to viewers on a socket.
+
+Wire format: one compact JSON object per line.
+
+    {"t": "key", "tick": n, "layout": [row, ...], "names": [name, ...],
+     "chars": [[idx, y, x, mood], ...], "queue": [idx, ...], "logs": [line, ...]}
+    {"t": "d", "tick": n, "set": [[idx, y, x, mood], ...], "del": [idx, ...],
+     "queue": [idx, ...] (only when it changed), "logs": [new line, ...]}
+
+`idx` indexes the keyframe's `names` (the simulation's character list) and
+`mood` indexes MOOD_LABELS. A viewer gets a keyframe when it connects, or
+after it fell behind, and deltas after that.
+
+Each frame is encoded once in the simulation thread, whatever the number of
+viewers. Every viewer has its own writer thread and a bounded outbox. A
+viewer too slow to drain its outbox has the backlog discarded and is sent a
+fresh keyframe, so it can never stall the simulation.
+"""
+import json
+import os
+import stat
+import queue
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from src.engine.soa import MOOD_LABELS
+
+OUTBOX_FRAMES = 256
+KEYFRAME_LOGS = 50
+
+
+def parse_address(text: str) -> Tuple[int, object]:
+    """'unix:/path', '/path' or './path' -> AF_UNIX; 'host:port' or ':port' -> AF_INET."""
+    if text.startswith('unix:'):
+        return socket.AF_UNIX, text[len('unix:'):]
+    if text.startswith(('/', '.')):
+        return socket.AF_UNIX, text
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"spectator address must be unix:PATH or HOST:PORT, got {text!r}")
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def _encode(msg: dict) -> bytes:
+    return (json.dumps(msg, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class _Viewer:
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.outbox: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=OUTBOX_FRAMES)
+        self.need_key = True
+        self.alive = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, blob: bytes):
+        try:
+            self.outbox.put_nowait(blob)
+        except queue.Full:
+            # fell behind: drop the backlog and resynchronise with a keyframe
+            while True:
+                try:
+                    self.outbox.get_nowait()
+                except queue.Empty:
+                    break
+            self.need_key = True
+
+    def close(self):
+        self.alive = False
+        try:
+            self.outbox.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        try:
+            while self.alive:
+                blob = self.outbox.get()
+                if blob is None:
+                    break
+                self.conn.sendall(blob)
+        except OSError:
+            pass
+        finally:
+            self.alive = False
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+
+
+def _unlink_socket(path: str) -> Optional[bool]:
+    """Remove `path` if it is a unix socket: True if removed, None if absent, False if something else."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISSOCK(mode):
+        return False
+    os.unlink(path)
+    return True
+
+
+class FrameBroadcaster:
+    """Serves the simulation to spectators; call `publish(sim)` from the sim loop.
+
+    publish() is rate-limited to `max_fps` and does nothing while no viewer
+    is connected.
+    """
+
+    def __init__(self, address: str, max_fps: float = 20.0):
+        self.address = address
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        family, addr = parse_address(address)
+        self._unix_path = addr if family == socket.AF_UNIX else None
+        if self._unix_path and _unlink_socket(self._unix_path) is False:
+            raise FileExistsError(f"{self._unix_path} exists and is not a socket")
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(addr)
+        self._server.listen()
+        self._lock = threading.Lock()
+        self._viewers: List[_Viewer] = []
+        self._closed = False
+        self._last_publish = 0.0
+        # last published state, for delta encoding
+        self._index: Optional[Dict[str, int]] = None
+        self._chars: Dict[int, Tuple[int, int, int]] = {}
+        self._queue: List[int] = []
+        self._log_total = 0
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    @property
+    def viewers(self) -> int:
+        with self._lock:
+            return sum(1 for v in self._viewers if v.alive)
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                self._viewers.append(_Viewer(conn))
+
+    # ----------------- publishing -----------------
+    def publish(self, sim, force: bool = False):
+        now = time.perf_counter()
+        if not force and now - self._last_publish < self.min_interval:
+            return
+        with self._lock:
+            self._viewers = [v for v in self._viewers if v.alive]
+            viewers = list(self._viewers)
+        if not viewers:
+            return
+        self._last_publish = now
+        if self._index is None:
+            self._index = {c.name: i for i, c in enumerate(sim.characters)}
+        chars = self._capture(sim)
+        order = sim.checkout.names()
+        q = [self._index[name] for name in order]
+        fresh = sim.total_logs - self._log_total
+        new_logs = list(sim.logs)[-min(fresh, len(sim.logs)):] if fresh > 0 else []
+        delta = None
+        key = None
+        for v in viewers:
+            if v.need_key:
+                if key is None:
+                    key = _encode(self._keyframe(sim, chars, q))
+                v.need_key = False
+                v.send(key)
+            else:
+                if delta is None:
+                    delta = _encode(self._delta(sim, chars, q, new_logs))
+                v.send(delta)
+        self._chars = chars
+        self._queue = q
+        self._log_total = sim.total_logs
+
+    def _capture(self, sim) -> Dict[int, Tuple[int, int, int]]:
+        h, w = sim.layout.height, sim.layout.width
+        out = {}
+        for c in sim.visible_characters(0, 0, h, w):
+            mood = c.mood_label
+            out[self._index[c.name]] = (c.pos.y, c.pos.x, MOOD_LABELS.index(mood) if mood in MOOD_LABELS else 2)
+        return out
+
+    def _keyframe(self, sim, chars, q) -> dict:
+        return {
+            't': 'key',
+            'tick': sim.ticks,
+            'layout': sim.layout.render_lines(),
+            'names': [c.name for c in sim.characters],
+            'chars': [[i, *st] for i, st in sorted(chars.items())],
+            'queue': q,
+            'logs': list(sim.logs)[-KEYFRAME_LOGS:],
+        }
+
+    def _delta(self, sim, chars, q, new_logs) -> dict:
+        prev = self._chars
+        msg = {
+            't': 'd',
+            'tick': sim.ticks,
+            'set': [[i, *st] for i, st in chars.items() if prev.get(i) != st],
+            'del': [i for i in prev if i not in chars],
+            'logs': new_logs,
+        }
+        if q != self._queue:
+            msg['queue'] = q
+        return msg
+
+    def close(self):
+        self._closed = True
+        try:
+            self._server.close()
+        except OSError:
+            pass
+        with self._lock:
+            for v in self._viewers:
+                v.close()
+            self._viewers.clear()
+        if self._unix_path:
+            try:
+                _unlink_socket(self._unix_path)
+            except OSError:
+                pass
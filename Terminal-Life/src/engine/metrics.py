@@ -0,0 +1,118 @@
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+SUB_BITS = 5  # 32 linear sub-buckets per power of two: values kept to within ~3%
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers, HdrHistogram-style.
+
+    Values below 2 * 2**SUB_BITS get their own bucket; above that every power
+    of two is split into 2**SUB_BITS equal buckets, so recording is a couple
+    of integer operations and memory stays at a few hundred counters no
+    matter how many values are recorded. Percentiles report the upper bound
+    of the bucket they fall in.
+    """
+
+    def __init__(self):
+        self.counts: List[int] = []
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(v: int) -> int:
+        sub = 1 << SUB_BITS
+        if v < 2 * sub:
+            return v
+        shift = v.bit_length() - SUB_BITS - 1
+        return sub * shift + (v >> shift)
+
+    @staticmethod
+    def _upper(idx: int) -> int:
+        sub = 1 << SUB_BITS
+        if idx < 2 * sub:
+            return idx
+        shift = idx // sub - 1
+        top = idx - sub * shift
+        return ((top + 1) << shift) - 1
+
+    def record(self, v: int):
+        v = max(0, int(v))
+        i = self._index(v)
+        counts = self.counts
+        if i >= len(counts):
+            counts.extend([0] * (i + 1 - len(counts)))
+        # unlocked: a lost increment under thread contention is acceptable for metrics
+        counts[i] += 1
+        if self.count == 0 or v < self.min:
+            self.min = v
+        if v > self.max:
+            self.max = v
+        self.count += 1
+        self.total += v
+
+    def percentile(self, q: float) -> int:
+        if self.count == 0:
+            return 0
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._upper(i), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.total / self.count, 1) if self.count else 0,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+        }
+
+
+class Metrics:
+    """Named latency histograms (microseconds) and counters for one run."""
+
+    def __init__(self):
+        self.hists: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.started = time.time()
+
+    def hist(self, name: str) -> Histogram:
+        h = self.hists.get(name)
+        if h is None:
+            h = self.hists[name] = Histogram()
+        return h
+
+    def record(self, name: str, seconds: float):
+        self.hist(name).record(int(seconds * 1_000_000))
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def rate(self, name: str, of: str) -> float:
+        """counters[name] / counters[of], 0.0 when nothing was counted."""
+        den = self.counters.get(of, 0)
+        return self.counters.get(name, 0) / den if den else 0.0
+
+    def summary(self) -> dict:
+        return {
+            'wall_seconds': round(time.time() - self.started, 3),
+            'histograms_us': {name: h.to_dict() for name, h in sorted(self.hists.items())},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.summary(), fh, indent=2)
+            fh.write("\n")
@@ -1,16 +1,33 @@
 import curses
+import time
 from dataclasses import dataclass
-from typing import List, Dict
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Optional, Tuple
 from src.store.layout import (
     WALL, SHELF, REGISTER, QUEUE, DOOR, FRIDGE, COFFEE, COUNTER,
     PRODUCE, DRINKS, FREEZER, MAGAZINE, TABLE
 )
 
+Cell = Tuple[str, int]       # (glyph, curses attr)
+Frame = List[List[Cell]]     # screen rows of cells
+
 @dataclass
 class PanelSplit:
     top_height: int
     bottom_height: int
 
+@dataclass
+class Camera:
+    """Store coordinates of the viewport's top-left corner.
+
+    With `follow` set to a character name the camera recenters on that
+    character every frame; panning drops back to a free camera.
+    """
+    y: int = 0
+    x: int = 0
+    follow: Optional[str] = None
+
 class Renderer:
     def __init__(self, simulation):
         self.sim = simulation
@@ -29,6 +46,23 @@ class Renderer:
             'Flat': '·',
             'Irritated': '✖'
         }
+        self._colors = False
+        # precomputed per resize / glyph toggle: tile -> attr, mood -> attr, and
+        # the static store layer as ready-made rows of cells
+        self.tile_attrs: Dict[str, int] = {}
+        self.mood_attrs: Dict[str, int] = {}
+        self._static: Frame = []
+        # the whole store is pre-rendered into a pad; each frame only restores the
+        # cells characters stood on and draws the characters inside the viewport
+        self.camera = Camera()
+        self._pad = None
+        self._overlay: List[Tuple[int, int]] = []
+        self._pad_view: Optional[Tuple[int, int, int, int]] = None
+        self._help_win = None
+        self._help_shown = False
+        self.show_hud = False  # perf HUD from sim.metrics in place of the mood line
+        # what is currently on screen, for damage tracking; None forces a full repaint
+        self._back: Optional[Frame] = None
 
     def resize(self, rows, cols):
         self.rows = rows
@@ -37,7 +71,9 @@ class Renderer:
         bottom = rows - top
         self.split = PanelSplit(top, bottom)
         self.sim.set_bounds(top_rows=top, total_cols=cols)
-        if curses.has_colors():
+        self.invalidate()
+        self._colors = curses.has_colors()
+        if self._colors:
             curses.start_color()
             curses.use_default_colors()
             # Basic tile colors
@@ -60,10 +96,61 @@ class Renderer:
             curses.init_pair(22, curses.COLOR_WHITE, -1)   # Neutral
             curses.init_pair(23, curses.COLOR_YELLOW, -1)  # Flat
             curses.init_pair(24, curses.COLOR_RED, -1)     # Irritated
+        self._configure_attrs()
         # configure glyphs (after resize for flexibility later)
         self._configure_glyphs()
 
+    def _configure_attrs(self):
+        if not self._colors:
+            self.tile_attrs = {}
+            self.mood_attrs = {}
+            return
+        self.tile_attrs = {
+            WALL: curses.color_pair(1),
+            SHELF: curses.color_pair(2),
+            REGISTER: curses.color_pair(3) | curses.A_BOLD,
+            QUEUE: curses.color_pair(4) | curses.A_DIM,
+            FRIDGE: curses.color_pair(5),
+            COFFEE: curses.color_pair(6) | curses.A_BOLD,
+            COUNTER: curses.color_pair(7),
+            DOOR: curses.color_pair(8) | curses.A_BOLD,
+            PRODUCE: curses.color_pair(9),
+            DRINKS: curses.color_pair(10),
+            FREEZER: curses.color_pair(11),
+            MAGAZINE: curses.color_pair(12),
+            TABLE: curses.color_pair(13),
+        }
+        # Mood-based character colors; Flat is dimmed, Irritated stands out
+        self.mood_attrs = {
+            'Happy': curses.color_pair(20) | curses.A_BOLD,
+            'Upbeat': curses.color_pair(21) | curses.A_BOLD,
+            'Neutral': curses.color_pair(22) | curses.A_BOLD,
+            'Flat': curses.color_pair(23) | curses.A_DIM,
+            'Irritated': curses.color_pair(24) | curses.A_BOLD | curses.A_STANDOUT,
+        }
+
+    def _build_static(self):
+        """Pre-render the whole store layout (tiles only) into the pad for the current glyphs."""
+        glyphs, attrs = self.tile_glyphs, self.tile_attrs
+        lines = self.sim.layout.render_lines()
+        self._static = [[(glyphs.get(ch, ch), attrs.get(ch, curses.A_NORMAL)) for ch in line] for line in lines]
+        self._overlay = []
+        self._help_win = None
+        # one spare column: curses refuses to advance past a pad's bottom-right cell
+        self._pad = curses.newpad(max(1, len(lines)), max(1, self.sim.layout.width + 1))
+        for r, row in enumerate(self._static):
+            c = 0
+            for attr, run in groupby(row, key=itemgetter(1)):
+                text = ''.join(cell[0] for cell in run)
+                self._pad.addstr(r, c, text, attr)
+                c += len(text)
+        self._pad_view = None
+
     def _configure_glyphs(self):
+        self._configure_tile_glyphs()
+        self._build_static()
+
+    def _configure_tile_glyphs(self):
         if not self.fancy:
             # fallback = identity (original chars)
             self.tile_glyphs = {
@@ -92,111 +179,215 @@ class Renderer:
         self.fancy = not self.fancy
         self._configure_glyphs()
 
-    def render(self, stdscr, show_help=False, paused=False, verbose_llm=False):
-        stdscr.erase()
-        store_lines = self.sim.render_store(self.split.top_height, self.cols)
-        for r, line in enumerate(store_lines[:self.split.top_height]):
-            for c, ch in enumerate(line[:self.cols]):
-                attr = curses.A_NORMAL
-                draw_ch = self.tile_glyphs.get(ch, ch)
-                if curses.has_colors():
-                    base_attr = curses.A_NORMAL
-                    if ch == WALL:
-                        base_attr = curses.color_pair(1)
-                    elif ch == SHELF:
-                        base_attr = curses.color_pair(2)
-                    elif ch == REGISTER:
-                        base_attr = curses.color_pair(3) | curses.A_BOLD
-                    elif ch == QUEUE:
-                        base_attr = curses.color_pair(4) | curses.A_DIM
-                    elif ch == FRIDGE:
-                        base_attr = curses.color_pair(5)
-                    elif ch == COFFEE:
-                        base_attr = curses.color_pair(6) | curses.A_BOLD
-                    elif ch == COUNTER:
-                        base_attr = curses.color_pair(7)
-                    elif ch == DOOR:
-                        base_attr = curses.color_pair(8) | curses.A_BOLD
-                    elif ch == PRODUCE:
-                        base_attr = curses.color_pair(9)
-                    elif ch == DRINKS:
-                        base_attr = curses.color_pair(10)
-                    elif ch == FREEZER:
-                        base_attr = curses.color_pair(11)
-                    elif ch == MAGAZINE:
-                        base_attr = curses.color_pair(12)
-                    elif ch == TABLE:
-                        base_attr = curses.color_pair(13)
-                    attr = base_attr
-                try:
-                    stdscr.addch(r, 0 + c, draw_ch, attr)
-                except curses.error:
-                    pass
-        # Overlay characters with mood-based colors
-        if curses.has_colors():
-            for ch in self.sim.characters:
-                if not getattr(ch, 'active', True) and not ch.is_owner:
-                    continue
-                y = ch.pos.y
-                x = ch.pos.x
-                if 0 <= y < self.split.top_height and 0 <= x < self.cols:
-                    mood = getattr(ch, 'mood_label', 'Neutral')
-                    pair = 22
-                    if mood == 'Happy':
-                        pair = 20
-                    elif mood == 'Upbeat':
-                        pair = 21
-                    elif mood == 'Flat':
-                        pair = 23
-                    elif mood == 'Irritated':
-                        pair = 24
-                    style = curses.A_BOLD
-                    # add mood-specific style tweaks
-                    if mood == 'Flat':
-                        style = curses.A_DIM
-                    elif mood == 'Irritated':
-                        style = curses.A_BOLD | curses.A_STANDOUT
-                    attr = curses.color_pair(pair) | style
-                    try:
-                        disp_symbol = self.mood_glyphs.get(mood, ch.symbol if len(ch.symbol) == 1 else '?')
-                        stdscr.addch(y, x, disp_symbol, attr)
-                    except curses.error:
-                        pass
+    def invalidate(self):
+        """Forget what is on screen; the next render repaints everything."""
+        self._back = None
+        self._pad_view = None
+
+    # ----------------- camera -----------------
+    def _view_size(self) -> Tuple[int, int]:
+        return (min(self.split.top_height, self.sim.layout.height), min(self.cols, self.sim.layout.width))
 
+    def pan(self, dy: int, dx: int):
+        self.camera.follow = None
+        self.camera.y += dy
+        self.camera.x += dx
+        self._clamp_camera()
+
+    def follow_next(self):
+        """Follow the next on-stage character after the current one (in cast order)."""
+        names = [c.name for c in self.sim.characters if getattr(c, 'active', True) or c.is_owner]
+        if not names:
+            return
+        cur = self.camera.follow
+        nxt = names[(names.index(cur) + 1) % len(names)] if cur in names else names[0]
+        self.camera.follow = nxt
+        self.sim.add_log(f"Camera follows {nxt}")
+
+    def free_camera(self):
+        self.camera.follow = None
+
+    def _clamp_camera(self):
+        vh, vw = self._view_size()
+        self.camera.y = max(0, min(self.camera.y, self.sim.layout.height - vh))
+        self.camera.x = max(0, min(self.camera.x, self.sim.layout.width - vw))
+
+    def _update_camera(self):
+        if self.camera.follow is not None:
+            target = self.sim.find(self.camera.follow)
+            if target is not None and (getattr(target, 'active', True) or target.is_owner):
+                vh, vw = self._view_size()
+                self.camera.y = target.pos.y - vh // 2
+                self.camera.x = target.pos.x - vw // 2
+        self._clamp_camera()
+
+    # ----------------- drawing -----------------
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+
+    def render(self, stdscr, show_help=False, paused=False, verbose_llm=False, speed=1):
+        started = time.perf_counter()
+        if self._help_shown and not show_help:
+            self.invalidate()  # the help box covered both panels; repaint from scratch
+        self._help_shown = show_help
+        self._update_camera()
+        visible = self._draw_store()
+        frame = self._compose(visible, paused=paused, verbose_llm=verbose_llm, speed=speed)
+        self._flush(stdscr, frame)
+        stdscr.noutrefresh()
+        self._refresh_pad()
+        if show_help:
+            self._refresh_help()
+        curses.doupdate()
+        metrics = getattr(self.sim, 'metrics', None)
+        if metrics is not None:
+            metrics.record('render', time.perf_counter() - started)
+
+    def _draw_store(self) -> list:
+        """Restore last frame's character cells on the pad, then draw the visible characters."""
+        pad = self._pad
+        static = self._static
+        for y, x in self._overlay:
+            glyph, attr = static[y][x]
+            pad.addstr(y, x, glyph, attr)
+        vh, vw = self._view_size()
+        if vh <= 0 or vw <= 0:
+            self._overlay = []
+            return []
+        visible = self.sim.visible_characters(self.camera.y, self.camera.x, vh, vw)
+        overlay = []
+        for ch in visible:
+            y, x = ch.pos.y, ch.pos.x
+            glyph, attr = self._mood_cell(ch) if self._colors else (ch.symbol, curses.A_NORMAL)
+            pad.addstr(y, x, glyph, attr)
+            overlay.append((y, x))
+        self._overlay = overlay
+        return visible
+
+    def _refresh_pad(self):
+        vh, vw = self._view_size()
+        if vh <= 0 or vw <= 0:
+            return
+        view = (self.camera.y, self.camera.x, vh, vw)
+        if view != self._pad_view:
+            # camera moved or screen repainted: copy the whole window, not just the changes
+            self._pad.touchwin()
+            self._pad_view = view
+        try:
+            self._pad.noutrefresh(self.camera.y, self.camera.x, 0, 0, vh - 1, vw - 1)
+        except curses.error:
+            pass  # terminal shrank mid-frame
+
+    # ----------------- frame composition -----------------
+    def _mood_cell(self, ch) -> Cell:
+        mood = getattr(ch, 'mood_label', 'Neutral')
+        disp_symbol = self.mood_glyphs.get(mood, ch.symbol if len(ch.symbol) == 1 else '?')
+        return (disp_symbol, self.mood_attrs.get(mood, self.mood_attrs['Neutral']))
+
+    def _put_text(self, frame: Frame, row: int, col: int, text: str, attr: int = curses.A_NORMAL):
+        if not 0 <= row < len(frame):
+            return
+        text = text[:max(0, self.cols - col)]
+        frame[row][col:col + len(text)] = [(ch, attr) for ch in text]
+
+    def _compose(self, visible, paused=False, verbose_llm=False, speed=1) -> Frame:
+        """Build the text panel as rows of (glyph, attr) cells without touching curses.
+
+        The store panel rows stay blank here; the pad is drawn over them.
+        """
+        blank = (' ', curses.A_NORMAL)
+        frame: Frame = [[blank] * self.cols for _ in range(self.rows)]
         info_start = self.split.top_height
         logs = self.sim.get_logs(self.split.bottom_height - 4)
-        active = sum(1 for c in self.sim.characters if getattr(c, 'active', True) or c.is_owner)
-        total = len(self.sim.characters)
+        stats = self.sim.stats()
+        active, total = stats['active'], stats['total']
         status = (
-            f"Tick:{self.sim.ticks} Act:{active}/{total} Paused:{paused} LLM:{'ON' if self.sim.dialogue_mgr.available else 'OFF'} "
-            f"Verbose:{verbose_llm} ?=help"
+            f"Tick:{self.sim.ticks} Act:{active}/{total} Speed:{speed}x Paused:{paused} LLM:{'ON' if self.sim.dialogue_mgr.available else 'OFF'} "
+            f"Verbose:{verbose_llm} View:{self.camera.y},{self.camera.x}"
+            f"{' Follow:' + self.camera.follow if self.camera.follow else ''} ?=help"
         )
-        try:
-            stdscr.addstr(info_start, 0, status[:self.cols])
-            stdscr.hline(info_start+1, 0, '-', self.cols)
-        except curses.error:
-            pass
-        # show a quick mood bar for visible active chars on first line after separator
-        mood_line = "Moods: " + ", ".join(
-            f"{c.symbol}:{getattr(c,'mood_label','-')}" for c in self.sim.characters if (getattr(c,'active', True) or c.is_owner)
-        )
-        try:
-            stdscr.addstr(info_start + 2, 0, mood_line[:self.cols])
-        except curses.error:
-            pass
-        log_offset = 1
+        self._put_text(frame, info_start, 0, status)
+        self._put_text(frame, info_start + 1, 0, '-' * self.cols)
+        if self.show_hud:
+            top_lines = self._hud_lines()
+        else:
+            # show a quick mood bar for visible active chars on first line after separator
+            top_lines = ["Moods: " + ", ".join(f"{c.symbol}:{getattr(c,'mood_label','-')}" for c in visible)]
+        for i, line in enumerate(top_lines):
+            self._put_text(frame, info_start + 2 + i, 0, line)
+        log_offset = len(top_lines)
         for i, log in enumerate(logs):
             if info_start + 2 + i >= self.rows - 1:
                 break
-            try:
-                stdscr.addstr(info_start + 2 + i + log_offset, 0, log[:self.cols])
-            except curses.error:
-                pass
-        if show_help:
-            self._render_help(stdscr)
-        stdscr.refresh()
+            self._put_text(frame, info_start + 2 + i + log_offset, 0, log)
+        return frame
+
+    def _hud_lines(self) -> List[str]:
+        metrics = getattr(self.sim, 'metrics', None)
+        if metrics is None:
+            return ["HUD: no metrics attached"]
+
+        def pct(label, name, scale=1, unit='us'):
+            h = metrics.hists.get(name)
+            if h is None or h.count == 0:
+                return f"{label} -"
+            return f"{label} {h.percentile(50) // scale}/{h.percentile(95) // scale}/{h.percentile(99) // scale}{unit}"
+
+        return [
+            "p50/p95/p99 " + " ".join(pct(*p) for p in (
+                ('tick', 'tick'), ('move', 'tick.movement'), ('talk', 'tick.conversation'),
+                ('checkout', 'tick.checkout'), ('render', 'render'))),
+            "LLM " + " ".join(pct(label, name, 1000, 'ms') for label, name in (('batch', 'llm.batch'), ('first line', 'llm.first_line'), ('single', 'llm.single')))
+            + f"  lines {metrics.counters.get('lines', 0)}"
+            f"  buffer hits {metrics.rate('lines.buffer', 'lines'):.0%}"
+            f"  first contact {metrics.rate('lines.first.buffer', 'lines.first'):.0%}"
+            f"  fallbacks {metrics.rate('lines.fallback', 'lines'):.0%}",
+            f"Prompt ~{metrics.rate('llm.prompt_tokens', 'llm.requests'):.0f} tok/request"
+            f"  static prefix {metrics.rate('llm.prefix_tokens', 'llm.prompt_tokens'):.0%}"
+            f"  prefix reused {metrics.rate('llm.prefix_reused', 'llm.requests'):.0%}"
+            f"  server cached {metrics.rate('llm.usage.cached_tokens', 'llm.usage.prompt_tokens'):.0%}",
+        ]
+
+    def _flush(self, stdscr, frame: Frame):
+        """Write only what differs from the screen, as runs of same-attribute text.
+
+        For each changed row the span from the first to the last differing
+        cell is rewritten with one addstr per attribute run.
+        """
+        back = self._back
+        if back is None or len(back) != len(frame) or (back and len(back[0]) != self.cols):
+            stdscr.erase()
+            blank = (' ', curses.A_NORMAL)
+            back = self._back = [[blank] * self.cols for _ in range(self.rows)]
+        for r, row in enumerate(frame):
+            old = back[r]
+            if old == row:
+                continue
+            lo = 0
+            while old[lo] == row[lo]:
+                lo += 1
+            hi = len(row) - 1
+            while old[hi] == row[hi]:
+                hi -= 1
+            c = lo
+            for attr, run in groupby(row[lo:hi + 1], key=itemgetter(1)):
+                text = ''.join(cell[0] for cell in run)
+                try:
+                    stdscr.addstr(r, c, text, attr)
+                except curses.error:
+                    pass  # bottom-right cell, or terminal shrank mid-frame
+                c += len(text)
+            back[r] = row
+
+    def _refresh_help(self):
+        if self._help_win is None:
+            self._help_win = self._build_help()
+        if self._help_win is None:
+            return
+        self._help_win.touchwin()  # keep it on top of the pad
+        self._help_win.noutrefresh()
 
-    def _render_help(self, stdscr):
+    def _build_help(self):
         # Build legend dynamically from glyph mapping for clarity
         def lg(sym, desc):
             glyph = self.tile_glyphs.get(sym, sym)
@@ -204,21 +395,23 @@ class Renderer:
         lines = [
             "Help:",
             " q quit  p pause  c force conversation  l toggle verbose LLM  ? toggle help",
+            " arrows pan the view  f follow next character  F free camera  +/- speed  h perf HUD",
             " Characters move, shop, converse. Bottom shows logs.",
             " Legend:" + lg(WALL, 'wall') + lg(SHELF, 'shelf') + lg(PRODUCE, 'produce') + lg(DRINKS, 'drinks'),
             "        " + lg(FRIDGE, 'fridge') + lg(FREEZER, 'freezer') + lg(COFFEE, 'coffee') + lg(MAGAZINE, 'magazine'),
             "        " + lg(REGISTER, 'register') + lg(COUNTER, 'counter') + lg(QUEUE, 'queue') + lg(DOOR, 'door') + lg(TABLE, 'table'),
         ]
-        maxw = max(len(l) for l in lines) + 4
-        maxh = len(lines) + 2
+        maxw = min(max(len(l) for l in lines) + 4, self.cols)
+        maxh = min(len(lines) + 2, self.rows - 1)
         r0 = 1
         c0 = max(0, self.cols - maxw - 2)
+        if maxw <= 0 or maxh <= 0:
+            return None
+        win = curses.newwin(maxh, maxw, r0, c0)
         try:
-            for dr in range(maxh):
-                for dc in range(maxw):
-                    stdscr.addch(r0+dr, c0+dc, ' ')
-            stdscr.addstr(r0, c0+2, "HELP")
+            win.addstr(0, 2, "HELP")
             for i, l in enumerate(lines):
-                stdscr.addstr(r0+1+i, c0+1, l)
+                win.addstr(1+i, 1, l[:maxw - 1])
         except curses.error:
             pass
+        return win
@@ -0,0 +1,34 @@
+import hashlib
+import random
+from typing import Dict, Optional
+
+
+class RandomStreams:
+    """Named, independently seeded random.Random streams.
+
+    Each subsystem draws from its own stream (e.g. 'sim', 'mood', 'dialogue',
+    'fallback'), derived from one master seed, so a change in how often one
+    subsystem draws does not perturb the others and a seeded run is exactly
+    reproducible. Without a seed a random master seed is chosen.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(63)
+        self.seed = seed
+        self._streams: Dict[str, random.Random] = {}
+
+    def stream(self, name: str) -> random.Random:
+        rng = self._streams.get(name)
+        if rng is None:
+            digest = hashlib.sha256(f"{self.seed}:{name}".encode()).digest()
+            rng = random.Random(int.from_bytes(digest[:8], 'big'))
+            self._streams[name] = rng
+        return rng
+
+    def getstate(self) -> Dict[str, tuple]:
+        return {name: rng.getstate() for name, rng in self._streams.items()}
+
+    def setstate(self, state: Dict[str, tuple]):
+        for name, st in state.items():
+            self.stream(name).setstate(st)
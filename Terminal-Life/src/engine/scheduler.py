@@ -0,0 +1,61 @@
+import heapq
+import itertools
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+
+class EventScheduler:
+    """Heap of future simulation events keyed by tick.
+
+    Events are (tick, kind, payload) triples; events due on the same tick fire
+    in the order they were scheduled. Cancelled events stay in the heap and are
+    skipped when they come due; cancelling an event that already fired (or
+    was cancelled) does nothing.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, str, Any]] = []
+        self._seq = itertools.count()
+        self._cancelled: Set[int] = set()
+        self._due: Dict[int, int] = {}  # handle -> tick, for events still pending
+
+    def __len__(self):
+        return len(self._due)
+
+    def schedule(self, tick: int, kind: str, payload: Any = None) -> int:
+        """Queue an event; returns a handle usable with cancel()."""
+        handle = next(self._seq)
+        heapq.heappush(self._heap, (tick, handle, kind, payload))
+        self._due[handle] = tick
+        return handle
+
+    def cancel(self, handle: int):
+        if self._due.pop(handle, None) is not None:
+            self._cancelled.add(handle)
+
+    def due(self, handle: int) -> Optional[int]:
+        """Tick a pending event will fire at, or None if it fired or was cancelled."""
+        return self._due.get(handle)
+
+    def next_tick(self):
+        """Tick of the earliest pending event, or None."""
+        while self._heap and self._heap[0][1] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(self._heap)[1])
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, tick: int) -> Iterator[Tuple[str, Any]]:
+        """Yield (kind, payload) for every event due at or before `tick`.
+
+        Events scheduled for `tick` while iterating are yielded as well.
+        """
+        heap = self._heap
+        while heap and heap[0][0] <= tick:
+            _, handle, kind, payload = heapq.heappop(heap)
+            if handle in self._cancelled:
+                self._cancelled.discard(handle)
+                continue
+            del self._due[handle]
+            yield kind, payload
+
+    def pending(self) -> List[Tuple[int, str, Any]]:
+        """Live events in firing order (for inspection and snapshots)."""
+        return [(t, k, p) for t, h, k, p in sorted(self._heap) if h not in self._cancelled]
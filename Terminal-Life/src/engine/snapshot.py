@@ -0,0 +1,199 @@
+"""Versioned binary snapshots of a running StoreSimulation.
+
+File layout (little-endian):
+
+    header    magic b'TLSNAP\\x00\\x00', u16 version, u16 section count
+    table     per section: 16-byte name, u64 offset, u64 length
+    sections  'agents'  fixed-size AGENT records, one per character
+              'names'   UTF-8 character names joined by '\\n'
+              'state'   zlib-compressed JSON: sim runtime (including checkout
+                        lanes), routes, personalities, persona table and baskets
+              'memory'  zlib-compressed JSON: CharacterMemory contents
+              'dialogue' zlib-compressed JSON: DialogueManager state
+
+Loading reads the file once and decodes every section into fresh objects;
+the agent table is unpacked with a single Struct.iter_unpack pass. Writes go
+to a temporary file that is atomically renamed over the target.
+"""
+import json
+import os
+import struct
+import zlib
+from typing import Dict, List, Optional
+
+from src.characters.character import Character, PersonaTemplate
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.rng import RandomStreams
+from src.engine.soa import MOOD_LABELS as MOODS, TARGET_KINDS
+from src.engine.state import Position
+from src.memory.memory import CharacterMemory
+from src.store.simulation import StoreSimulation
+
+MAGIC = b'TLSNAP\x00\x00'
+VERSION = 3
+HEADER = struct.Struct('<8sHH')
+SECTION = struct.Struct('<16sQQ')
+# y, x, waiting_ticks, return_tick (-1 = none), mood_score, active, is_owner, target code, mood code
+AGENT = struct.Struct('<iiiqdBBbb')
+
+TARGETS = sorted(TARGET_KINDS, key=TARGET_KINDS.__getitem__)  # code -> target_kind
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# ----------------- encoding helpers -----------------
+def _pack_json(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8'), 6)
+
+
+def _unpack_json(buf) -> object:
+    return json.loads(zlib.decompress(buf).decode('utf-8'))
+
+
+def _rng_state(obj):
+    """JSON round-trips random.Random state tuples as lists; convert back."""
+    version, internal, gauss = obj
+    return (version, tuple(internal), gauss)
+
+
+def _flow_key(c) -> Optional[object]:
+    flow = c.flow
+    if flow is None:
+        return None
+    return list(flow.key) if isinstance(flow.key, tuple) else flow.key
+
+
+# ----------------- save -----------------
+def save_snapshot(sim: StoreSimulation, path: str):
+    """Write the full simulation state to `path` atomically."""
+    agents = bytearray()
+    for c in sim.characters:
+        agents += AGENT.pack(
+            c.pos.y, c.pos.x, c.waiting_ticks,
+            -1 if c.return_tick is None else c.return_tick,
+            c.mood_score, c.active, c.is_owner,
+            TARGET_KINDS[c.target_kind], MOODS.index(c.mood_label),
+        )
+    names = "\n".join(c.name for c in sim.characters).encode('utf-8')
+    personas: List[PersonaTemplate] = []
+    persona_idx: Dict[PersonaTemplate, int] = {}
+    for c in sim.characters:
+        if c.persona is not None and c.persona not in persona_idx:
+            persona_idx[c.persona] = len(personas)
+            personas.append(c.persona)
+    state = {
+        'engine': sim.engine,
+        'layout': [sim.layout.height, sim.layout.width],
+        'service_ticks': [lane.service_ticks for lane in sim.checkout.lanes],
+        'seed': sim.streams.seed,
+        'runtime': sim.runtime_state(),
+        'personalities': [c.personality for c in sim.characters],
+        'flows': [_flow_key(c) for c in sim.characters],
+        'paths': [[[p.y, p.x] for p in c.path] for c in sim.characters],
+        'persona_table': [[p.label, p.personality, p.arrival_rate, list(p.basket_size), p.weight] for p in personas],
+        'personas': [persona_idx.get(c.persona) if c.persona is not None else None for c in sim.characters],
+        'baskets': [c.basket for c in sim.characters],
+    }
+    memory = [
+        [c.memory.capacity, c.memory.export()] if c.memory is not None else None
+        for c in sim.characters
+    ]
+    sections = [
+        (b'agents', bytes(agents)),
+        (b'names', names),
+        (b'state', _pack_json(state)),
+        (b'memory', _pack_json(memory)),
+        (b'dialogue', _pack_json(sim.dialogue_mgr.export_state())),
+    ]
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = bytearray()
+    for name, blob in sections:
+        table += SECTION.pack(name, offset, len(blob))
+        offset += len(blob)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        fh.write(table)
+        for _, blob in sections:
+            fh.write(blob)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+# ----------------- load -----------------
+def _sections(buf) -> Dict[str, memoryview]:
+    if len(buf) < HEADER.size:
+        raise SnapshotError("file too short for a snapshot header")
+    magic, version, count = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise SnapshotError("not a Terminal Life snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"unsupported snapshot version {version} (expected {VERSION})")
+    view = memoryview(buf)
+    out: Dict[str, memoryview] = {}
+    for n in range(count):
+        name, off, length = SECTION.unpack_from(buf, HEADER.size + n * SECTION.size)
+        if off + length > len(buf):
+            raise SnapshotError(f"section {name!r} is truncated")
+        out[name.rstrip(b'\x00').decode('ascii')] = view[off:off + length]
+    return out
+
+
+def load_snapshot(path: str, dialogue_mgr: DialogueManager) -> StoreSimulation:
+    """Rebuild a StoreSimulation (and restore `dialogue_mgr`) from a snapshot file."""
+    with open(path, 'rb') as fh:
+        secs = _sections(fh.read())
+    names = bytes(secs['names']).decode('utf-8').split('\n')
+    state = _unpack_json(secs['state'])
+    memory = _unpack_json(secs['memory'])
+    dialogue = _unpack_json(secs['dialogue'])
+    records = list(AGENT.iter_unpack(secs['agents']))
+    if len(records) != len(names):
+        raise SnapshotError("agent table and name table disagree")
+    personas = [
+        PersonaTemplate(label, personality, rate, (bmin, bmax), weight)
+        for label, personality, rate, (bmin, bmax), weight in state['persona_table']
+    ]
+    characters: List[Character] = []
+    for i, (y, x, waiting, ret, mood, active, owner, target, mood_code) in enumerate(records):
+        cm = CharacterMemory.restore(*memory[i]) if memory[i] is not None else None
+        pidx = state['personas'][i]
+        characters.append(Character(
+            names[i], Position(y, x), is_owner=bool(owner),
+            path=[Position(py, px) for py, px in state['paths'][i]],
+            waiting_ticks=waiting, memory=cm, personality=state['personalities'][i],
+            target_kind=TARGETS[target], active=bool(active),
+            return_tick=None if ret < 0 else ret, mood_score=mood, mood_label=MOODS[mood_code],
+            persona=personas[pidx] if pidx is not None else None, basket=state['baskets'][i],
+        ))
+    runtime = state['runtime']
+    runtime['rng'] = {name: _rng_state(st) for name, st in runtime['rng'].items()}
+    dialogue['rng'] = _rng_state(dialogue['rng'])
+    sim = StoreSimulation(dialogue_mgr=dialogue_mgr, engine=state['engine'],
+                          streams=RandomStreams(state['seed']), characters=characters,
+                          lanes=len(state['service_ticks']), service_ticks=state['service_ticks'])
+    if [sim.layout.height, sim.layout.width] != state['layout']:
+        raise SnapshotError(f"snapshot layout {state['layout']} does not match the current store")
+    for c, key in zip(sim.characters, state['flows']):
+        if key is None:
+            continue
+        flow = sim.planner.field_to(tuple(key)) if isinstance(key, list) else sim.planner.field(key)
+        c.follow(flow, c.target_kind)
+    sim.restore_runtime(runtime)
+    dialogue_mgr.import_state(dialogue)
+    return sim
+
+
+class AutoCheckpoint:
+    """Saves a snapshot every `every` ticks; attach as `sim.checkpoint`."""
+
+    def __init__(self, path: str, every: int):
+        self.path = path
+        self.every = every
+
+    def maybe_save(self, sim: StoreSimulation):
+        if self.every > 0 and sim.ticks % self.every == 0:
+            save_snapshot(sim, self.path)
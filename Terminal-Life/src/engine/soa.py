@@ -0,0 +1,410 @@
+"""Structure-of-arrays agent engine (optional, requires NumPy).
+
+Positions, waiting_ticks, mood, active flags, return ticks and route state for
+every agent live in NumPy arrays, and movement, mood drift/labeling and
+offstage respawn are applied as batched array operations once per tick. The
+simulation keeps a list of `AgentView` objects that expose the familiar
+Character attributes on top of the arrays for dialogue, queueing and rendering.
+"""
+from typing import Dict, List, Optional, Sequence, Set
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from src.engine.state import Position
+from src.memory.memory import CharacterMemory
+from src.store.pathfinding import FlowField, PathPlanner, STEPS, UNREACHABLE
+
+NO_TICK = -1
+NO_FIELD = -1
+
+# target_kind codes
+TARGET_NONE = 0
+TARGET_SHELF = 1
+TARGET_REGISTER = 2
+TARGET_KINDS = {None: TARGET_NONE, 'shelf': TARGET_SHELF, 'register': TARGET_REGISTER}
+TARGET_NAMES = {v: k for k, v in TARGET_KINDS.items()}
+
+# Same thresholds as Character.update_mood, lowest band first
+MOOD_LABELS = ("Irritated", "Flat", "Neutral", "Upbeat", "Happy")
+MOOD_CODES = {label: i for i, label in enumerate(MOOD_LABELS)}
+
+
+def available() -> bool:
+    return np is not None
+
+
+def mood_codes(score):
+    """Vectorized mood label index for an array of mood scores."""
+    return np.select(
+        [score > 0.4, score > 0.1, score < -0.4, score < -0.1],
+        [MOOD_CODES["Happy"], MOOD_CODES["Upbeat"], MOOD_CODES["Irritated"], MOOD_CODES["Flat"]],
+        default=MOOD_CODES["Neutral"],
+    ).astype(np.int8)
+
+
+class _PosView:
+    """Position-compatible view of one agent's coordinates."""
+
+    __slots__ = ('_a', '_i')
+
+    def __init__(self, arrays: "SoAEngine", i: int):
+        self._a = arrays
+        self._i = i
+
+    @property
+    def y(self) -> int:
+        return int(self._a.y[self._i])
+
+    @y.setter
+    def y(self, v: int):
+        self._a.y[self._i] = v
+
+    @property
+    def x(self) -> int:
+        return int(self._a.x[self._i])
+
+    @x.setter
+    def x(self, v: int):
+        self._a.x[self._i] = v
+
+    def copy(self):
+        return Position(self.y, self.x)
+
+
+class AgentView:
+    """Thin Character-compatible view over one row of the SoA arrays."""
+
+    def __init__(self, engine: "SoAEngine", i: int, name: str, is_owner: bool, personality: str,
+                 memory: Optional[CharacterMemory], persona=None):
+        self._e = engine
+        self._i = i
+        self.name = name
+        self.is_owner = is_owner
+        self.personality = personality
+        self.memory = memory
+        self.persona = persona
+        self.spatial = None
+        self.pos = _PosView(engine, i)
+
+    def materialize(self):
+        if self.memory is None:
+            self.memory = CharacterMemory()
+        if not self.personality and self.persona is not None:
+            self.personality = self.persona.personality
+
+    def release(self):
+        if self.persona is not None:
+            self.memory = None
+            self.personality = ""
+
+    @property
+    def symbol(self):
+        return self.name[0].upper()
+
+    @property
+    def active(self) -> bool:
+        return bool(self._e.active[self._i])
+
+    @active.setter
+    def active(self, v: bool):
+        self._e.active[self._i] = v
+
+    @property
+    def return_tick(self) -> Optional[int]:
+        t = int(self._e.return_tick[self._i])
+        return None if t == NO_TICK else t
+
+    @return_tick.setter
+    def return_tick(self, v: Optional[int]):
+        self._e.return_tick[self._i] = NO_TICK if v is None else v
+
+    @property
+    def waiting_ticks(self) -> int:
+        return int(self._e.waiting[self._i])
+
+    @waiting_ticks.setter
+    def waiting_ticks(self, v: int):
+        self._e.waiting[self._i] = v
+
+    @property
+    def mood_score(self) -> float:
+        return float(self._e.mood[self._i])
+
+    @mood_score.setter
+    def mood_score(self, v: float):
+        self._e.mood[self._i] = v
+        self._e.mood_code[self._i] = mood_codes(np.array([v]))[0]
+
+    @property
+    def mood_label(self) -> str:
+        return MOOD_LABELS[self._e.mood_code[self._i]]
+
+    @property
+    def basket(self) -> int:
+        return int(self._e.basket[self._i])
+
+    @basket.setter
+    def basket(self, v: int):
+        self._e.basket[self._i] = v
+
+    @property
+    def target_kind(self) -> Optional[str]:
+        return TARGET_NAMES[int(self._e.target[self._i])]
+
+    @target_kind.setter
+    def target_kind(self, v: Optional[str]):
+        self._e.target[self._i] = TARGET_KINDS[v]
+
+    @property
+    def flow(self) -> Optional[FlowField]:
+        row = int(self._e.field[self._i])
+        return None if row == NO_FIELD else self._e.fields[row]
+
+    @property
+    def path(self) -> List[Position]:
+        return []  # routes are always flow fields in the SoA engine
+
+    @property
+    def has_route(self) -> bool:
+        return self._e.field[self._i] != NO_FIELD
+
+    def follow(self, flow: FlowField, target_kind: str):
+        self._e.field[self._i] = self._e.field_row(flow)
+        self.target_kind = target_kind
+
+    def clear_route(self):
+        self._e.field[self._i] = NO_FIELD
+
+    def move_to(self, y: int, x: int):
+        self._e.y[self._i] = y
+        self._e.x[self._i] = x
+        if self.spatial is not None and self.active:
+            self.spatial.update(self)
+
+
+class SoAEngine:
+    """Owns the agent arrays and applies one tick of batched updates."""
+
+    def __init__(self, characters: Sequence, planner: PathPlanner, seed: Optional[int] = None):
+        if np is None:
+            raise RuntimeError("the SoA engine requires numpy (pip install numpy)")
+        self.planner = planner
+        self.layout = planner.layout
+        self.rng = np.random.default_rng(seed)
+        n = len(characters)
+        self.y = np.array([c.pos.y for c in characters], dtype=np.int32)
+        self.x = np.array([c.pos.x for c in characters], dtype=np.int32)
+        self.waiting = np.array([c.waiting_ticks for c in characters], dtype=np.int32)
+        self.mood = np.array([c.mood_score for c in characters], dtype=np.float64)
+        self.mood_code = mood_codes(self.mood)
+        self.active = np.array([c.active for c in characters], dtype=bool)
+        self.owner = np.array([c.is_owner for c in characters], dtype=bool)
+        self.return_tick = np.array([NO_TICK if c.return_tick is None else c.return_tick for c in characters], dtype=np.int64)
+        self.target = np.array([TARGET_KINDS[c.target_kind] for c in characters], dtype=np.int8)
+        # basket: shelves left this trip (-1 = none); refilled from [bmin, bmax] on each entry
+        self.basket = np.array([c.basket for c in characters], dtype=np.int32)
+        self.bmin = np.array([c.persona.basket_size[0] if c.persona else -1 for c in characters], dtype=np.int32)
+        self.bmax = np.array([c.persona.basket_size[1] if c.persona else -1 for c in characters], dtype=np.int32)
+        # route tables: one row per flow field key, allocated in doubling chunks; rows of
+        # fields the planner evicted are reused once no agent follows them any more
+        self.fields: List[FlowField] = []
+        self._rows: Dict[object, int] = {}
+        self._retired: Set[int] = set()
+        self._free: List[int] = []
+        self._hops = np.empty((max(16, 2 * len(planner.fields)), self.layout.width * self.layout.height),
+                              dtype=np.int32)
+        self._dist = np.empty_like(self._hops)
+        for ff in planner.fields.values():
+            self.field_row(ff)
+        self.field = np.full(n, NO_FIELD, dtype=np.int32)
+        for i, c in enumerate(characters):
+            if c.flow is not None:
+                self.field[i] = self.field_row(c.flow)
+        browse = planner.layout.shelf_positions()
+        self._browse_rows = np.array([self.field_row(planner.field_for_browse(p)) for p in browse], dtype=np.int32)
+        self._queue_row = self.field_row(planner.field('queue'))
+        planner.on_evict = self._retire
+        self.views: List[AgentView] = [
+            AgentView(self, i, c.name, c.is_owner, c.personality, c.memory, c.persona) for i, c in enumerate(characters)
+        ]
+        # last state pushed into the spatial index
+        self._sy = self.y.copy()
+        self._sx = self.x.copy()
+        self._sactive = self.active | self.owner
+        self.spatial = None
+
+    # ----------------- route tables -----------------
+    def field_row(self, ff: FlowField) -> int:
+        """Table row for `ff`; a field rebuilt after LRU eviction reuses its key's row."""
+        row = self._rows.get(ff.key)
+        if row is not None:
+            if self.fields[row] is not ff:
+                # same key, same goals: only the FlowField object is new
+                self.fields[row] = ff
+            self._retired.discard(row)
+            return row
+        hops, dist = self._tables(ff)
+        row = self._free_row()
+        if row is None:
+            row = len(self.fields)
+            if row == len(self._hops):
+                self._hops = self._grow(self._hops)
+                self._dist = self._grow(self._dist)
+            self.fields.append(ff)
+        else:
+            self.fields[row] = ff
+        self._rows[ff.key] = row
+        self._hops[row] = hops
+        self._dist[row] = dist
+        return row
+
+    def _retire(self, ff: FlowField):
+        """The planner dropped `ff`: its row may be reused once nobody follows it."""
+        row = self._rows.get(ff.key)
+        if row is not None and self.fields[row] is ff:
+            self._retired.add(row)
+
+    def _free_row(self) -> Optional[int]:
+        if not self._free and self._retired:
+            in_use = np.zeros(len(self.fields), dtype=bool)
+            in_use[self.field[self.field != NO_FIELD]] = True
+            free = [row for row in sorted(self._retired) if not in_use[row]]
+            for row in free:
+                self._retired.discard(row)
+                del self._rows[self.fields[row].key]
+            self._free = free[::-1]
+        return self._free.pop() if self._free else None
+
+    @staticmethod
+    def _grow(table):
+        out = np.empty((2 * len(table), table.shape[1]), dtype=table.dtype)
+        out[:len(table)] = table
+        return out
+
+    def _tables(self, ff: FlowField):
+        """Next-hop cell index per cell (-1 = stay), matching FlowField.next_step."""
+        h, w = ff.height, ff.width
+        dist = np.array(ff.dist, dtype=np.int32)
+        grid = dist.reshape(h, w)
+        big = np.iinfo(np.int32).max
+        padded = np.full((h + 2, w + 2), big, dtype=np.int64)
+        padded[1:-1, 1:-1] = np.where(grid == UNREACHABLE, big, grid)
+        neigh = np.stack([padded[1 + dy:h + 1 + dy, 1 + dx:w + 1 + dx].ravel() for dy, dx in STEPS])
+        best = neigh.argmin(axis=0)  # first minimum, same tie-break as next_step
+        best_d = neigh[best, np.arange(h * w)]
+        here = dist.astype(np.int64)
+        ok = (best_d < big) & (here != 0) & ((here == UNREACHABLE) | (best_d < here))
+        offsets = np.array([dy * w + dx for dy, dx in STEPS], dtype=np.int64)
+        hops = np.where(ok, np.arange(h * w) + offsets[best], -1).astype(np.int32)
+        return hops, dist
+
+    def _nearest_browse(self, cells):
+        """Browse row with the shortest walk from each cell (FlowField.steps_from), NO_FIELD if none."""
+        rows = np.unique(self._browse_rows)[:, None]
+        here = self._dist[rows, cells]
+        hop = self._hops[rows, cells]
+        big = np.iinfo(np.int32).max
+        steps = np.where(here >= 0, here, np.where(hop >= 0, self._dist[rows, np.maximum(hop, 0)] + 1, big))
+        best = steps.argmin(axis=0)
+        out = rows[best, 0]
+        out[steps[best, np.arange(len(cells))] == big] = NO_FIELD
+        return out
+
+    # ----------------- per-tick update -----------------
+    def tick(self, tick: int):
+        """Respawn, route, move and drift moods for every customer.
+
+        Returns (spawned, queued): indices of customers that re-entered the
+        store this tick, and of those that reached the checkout queue.
+        """
+        rng = self.rng
+        w = self.layout.width
+        customers = ~self.owner
+        due = customers & ~self.active & (self.return_tick != NO_TICK) & (self.return_tick <= tick)
+        spawned = np.nonzero(due)[0]
+        if spawned.size:
+            dy, dx = self.layout.door_position()
+            self.active[spawned] = True
+            self.return_tick[spawned] = NO_TICK
+            self.y[spawned] = dy
+            self.x[spawned] = dx
+            self.waiting[spawned] = rng.integers(1, 5, size=spawned.size)
+            shoppers = spawned[self.bmax[spawned] >= 0]
+            if shoppers.size:
+                self.basket[shoppers] = rng.integers(self.bmin[shoppers], self.bmax[shoppers] + 1)
+        live = customers & self.active
+        # route agents that have nowhere to go
+        need = np.nonzero(live & (self.field == NO_FIELD) & (self.target != TARGET_REGISTER))[0]
+        if need.size:
+            basket = self.basket[need]
+            to_queue = np.where(basket >= 0, basket == 0, rng.random(need.size) < 0.15)
+            q = need[to_queue]
+            self.field[q] = self._queue_row
+            self.target[q] = TARGET_REGISTER
+            s = need[~to_queue]
+            if s.size and self._browse_rows.size:
+                rows = self._browse_rows[rng.integers(0, self._browse_rows.size, size=s.size)]
+                cells = self.y[s] * w + self.x[s]
+                walled = (self._hops[rows, cells] < 0) & (self._dist[rows, cells] != 0)
+                if walled.any():
+                    rows[walled] = self._nearest_browse(cells[walled])
+                self.field[s] = rows
+                self.target[s] = TARGET_SHELF
+                self.waiting[s] = rng.integers(1, 5, size=s.size)
+                self.basket[s[self.basket[s] > 0]] -= 1
+                # no shelf reachable at all: give up and check out
+                lost = s[rows == NO_FIELD]
+                self.field[lost] = self._queue_row
+                self.target[lost] = TARGET_REGISTER
+        # wait or step
+        waiting = live & (self.waiting > 0)
+        self.waiting[waiting] -= 1
+        mv = np.nonzero(live & ~waiting & (self.field != NO_FIELD))[0]
+        queued = mv[:0]
+        if mv.size:
+            rows = self.field[mv]
+            nxt = self._hops[rows, self.y[mv] * w + self.x[mv]]
+            ok = nxt >= 0
+            stopped = mv[~ok]
+            self.field[stopped] = NO_FIELD
+            mv, rows, nxt = mv[ok], rows[ok], nxt[ok]
+            self.y[mv] = nxt // w
+            self.x[mv] = nxt % w
+            arrived = mv[self._dist[rows, nxt] == 0]
+            self.field[arrived] = NO_FIELD
+            ended = np.sort(np.concatenate([stopped, arrived]))
+            queued = ended[self.target[ended] == TARGET_REGISTER]
+        # mood drift and labels
+        live_idx = np.nonzero(live)[0]
+        if live_idx.size:
+            drift = rng.uniform(-0.05, 0.05, size=live_idx.size)
+            self.mood[live_idx] = np.clip(self.mood[live_idx] * 0.9 + drift, -1.0, 1.0)
+            self.mood_code[live_idx] = mood_codes(self.mood[live_idx])
+        return spawned, queued
+
+    # ----------------- queries -----------------
+    def sync_spatial(self):
+        """Push agents whose tile or on-stage status changed into the spatial index."""
+        if self.spatial is None:
+            return
+        onstage = self.active | self.owner
+        changed = np.nonzero((self.y != self._sy) | (self.x != self._sx) | (onstage != self._sactive))[0]
+        if not changed.size:
+            return
+        # one conversion per array instead of a NumPy scalar read per agent and coordinate
+        views, move, remove = self.views, self.spatial.move, self.spatial.remove
+        for i, y, x, on in zip(changed.tolist(), self.y[changed].tolist(), self.x[changed].tolist(),
+                               onstage[changed].tolist()):
+            if on:
+                move(views[i], y, x)
+            else:
+                remove(views[i])
+        self._sy[changed] = self.y[changed]
+        self._sx[changed] = self.x[changed]
+        self._sactive[changed] = onstage[changed]
+
+    def onstage_count(self) -> int:
+        return int(np.count_nonzero(self.active | self.owner))
@@ -0,0 +1,172 @@
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterator, Set, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from src.characters.character import Character
+
+
+class SpatialHash:
+    """Uniform-grid index of on-stage character positions.
+
+    Characters are bucketed by name into `cell_size` x `cell_size` cells, so a
+    radius query only visits the buckets overlapping the query square. Per-tile
+    occupancy counts are kept alongside for collision checks, and per-cell
+    neighbour counts for `random_pair`. The index is updated incrementally via
+    `update` whenever a character moves.
+    """
+
+    def __init__(self, cell_size: int = 4, radius: int = 1):
+        if not 0 < radius <= cell_size:
+            raise ValueError("pairing radius must be between 1 and cell_size")
+        self.cell_size = cell_size
+        self.radius = radius
+        # cell -> name -> (character, y, x); coordinates cached so queries never touch c.pos
+        self._cells: Dict[Tuple[int, int], Dict[str, Tuple["Character", int, int]]] = defaultdict(dict)
+        self._where: Dict[str, Tuple[int, int]] = {}
+        self._occupancy: Dict[Tuple[int, int], int] = defaultdict(int)
+        # cell -> sum over its characters of the others within `radius` (twice the pairs in all);
+        # moves only mark cells stale, random_pair recounts them from the tile occupancy
+        self._weights: Dict[Tuple[int, int], int] = {}
+        self._stale: Set[Tuple[int, int]] = set()
+        self._offsets = [(dy, dx) for dy in range(-radius, radius + 1) for dx in range(-radius, radius + 1)]
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, name: str):
+        return name in self._where
+
+    def _cell(self, y: int, x: int) -> Tuple[int, int]:
+        return (y // self.cell_size, x // self.cell_size)
+
+    # ----------------- maintenance -----------------
+    def update(self, c: "Character"):
+        """Insert `c` or move it to its current position."""
+        self.move(c, c.pos.y, c.pos.x)
+
+    def move(self, c: "Character", y: int, x: int):
+        """Insert `c` or move it to (y, x), for callers that already hold the coordinates."""
+        old = self._where.get(c.name)
+        if old == (y, x):
+            return
+        if old is not None:
+            self._detach(c.name, old)
+        self._where[c.name] = (y, x)
+        cell = self._cell(y, x)
+        self._cells[cell][c.name] = (c, y, x)
+        self._occupancy[(y, x)] += 1
+        self._stale.add(cell)
+
+    def remove(self, c: "Character"):
+        old = self._where.pop(c.name, None)
+        if old is not None:
+            self._detach(c.name, old)
+
+    def _detach(self, name: str, at: Tuple[int, int]):
+        cell = self._cell(*at)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(name, None)
+            if not bucket:
+                del self._cells[cell]
+        self._stale.add(cell)
+        n = self._occupancy.get(at, 0) - 1
+        if n > 0:
+            self._occupancy[at] = n
+        else:
+            self._occupancy.pop(at, None)
+
+    def clear(self):
+        self._cells.clear()
+        self._where.clear()
+        self._occupancy.clear()
+        self._weights.clear()
+        self._stale.clear()
+
+    # ----------------- queries -----------------
+    def occupancy(self, y: int, x: int) -> int:
+        return self._occupancy.get((y, x), 0)
+
+    def near(self, y: int, x: int, radius: int = 1) -> Iterator["Character"]:
+        """Characters within Chebyshev distance `radius` of (y, x)."""
+        cy0, cx0 = self._cell(y - radius, x - radius)
+        cy1, cx1 = self._cell(y + radius, x + radius)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                bucket = self._cells.get((cy, cx))
+                if not bucket:
+                    continue
+                for c, cy_, cx_ in bucket.values():
+                    if -radius <= cy_ - y <= radius and -radius <= cx_ - x <= radius:
+                        yield c
+
+    def within(self, y0: int, x0: int, y1: int, x1: int) -> Iterator["Character"]:
+        """Characters inside the rectangle (y0, x0)-(y1, x1), inclusive."""
+        cy0, cx0 = self._cell(y0, x0)
+        cy1, cx1 = self._cell(y1, x1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                bucket = self._cells.get((cy, cx))
+                if not bucket:
+                    continue
+                for c, cy_, cx_ in bucket.values():
+                    if y0 <= cy_ <= y1 and x0 <= cx_ <= x1:
+                        yield c
+
+    def _around(self, y: int, x: int) -> int:
+        """Characters within `radius` of tile (y, x), including those on it."""
+        occupancy = self._occupancy
+        return sum(occupancy.get((y + dy, x + dx), 0) for dy, dx in self._offsets)
+
+    def _tile_weights(self, cell: Tuple[int, int]) -> Iterator[Tuple[int, int, int]]:
+        """(y, x, neighbours of everyone standing there) for each occupied tile of `cell`, row-major."""
+        occupancy, size = self._occupancy, self.cell_size
+        cy, cx = cell
+        for y in range(cy * size, (cy + 1) * size):
+            for x in range(cx * size, (cx + 1) * size):
+                n = occupancy.get((y, x), 0)
+                if n:
+                    yield y, x, n * (self._around(y, x) - 1)
+
+    def _refresh(self):
+        """Recount the cells a move could have affected (radius <= cell_size: the 3x3 block around each)."""
+        stale = {(cy + dy, cx + dx) for cy, cx in self._stale for dy in (-1, 0, 1) for dx in (-1, 0, 1)}
+        self._stale.clear()
+        weights = self._weights
+        for cell in stale:
+            w = sum(t[2] for t in self._tile_weights(cell)) if cell in self._cells else 0
+            if w:
+                weights[cell] = w
+            else:
+                weights.pop(cell, None)
+
+    def random_pair(self, rng):
+        """A pair drawn uniformly from all characters within `radius` of each other, or None.
+
+        A character is drawn weighted by its neighbour count (a cell from the
+        per-cell totals, then a tile inside it, then a name on that tile) and
+        paired with a uniformly chosen neighbour, so every pair is equally
+        likely. The cost follows the occupied floor area around recent moves,
+        not the number of characters.
+        """
+        if self._stale:
+            self._refresh()
+        weights = self._weights
+        total = sum(weights.values())
+        if total == 0:
+            return None
+        k = rng.randrange(total)
+        for cell in sorted(weights):
+            if k < weights[cell]:
+                break
+            k -= weights[cell]
+        for y, x, w in self._tile_weights(cell):
+            if k < w:
+                break
+            k -= w
+        bucket = self._cells[cell]
+        # sorted by name, so the draw does not depend on insertion order (which differs after a snapshot restore)
+        here = sorted(name for name, (_, cy, cx) in bucket.items() if cy == y and cx == x)
+        name = here[k * len(here) // w]
+        others = sorted((b for b in self.near(y, x, self.radius) if b.name != name), key=lambda b: b.name)
+        return bucket[name][0], rng.choice(others)
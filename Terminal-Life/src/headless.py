@@ -0,0 +1,171 @@
+"""Headless batch runner.
+
+Drives StoreSimulation as fast as the CPU allows, without curses or a Renderer.
+Run from the Terminal-Life directory:
+
+    python -m src.headless --ticks 1_000_000 --seed 42 --stats-every 10000
+
+With --record, every LLM response is written to a JSONL file; --replay feeds
+that file back instead of contacting the server, so a seeded run can be
+re-executed offline and produce identical logs.
+
+--checkpoint PATH --checkpoint-every N saves a snapshot every N ticks, and
+--resume PATH continues a run from one (see src.engine.snapshot).
+
+--spectate ADDR publishes frames on a socket for `python -m src.spectate`.
+"""
+import argparse
+import sys
+import time
+from typing import Optional, TextIO
+
+from src.store.simulation import StoreSimulation
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.rng import RandomStreams
+from src.lm_integration.client import LocalLLMClient
+from src.lm_integration.recording import RecordingClient, ReplayClient
+from src.engine.snapshot import AutoCheckpoint, load_snapshot, save_snapshot
+from src.characters.cast import generate_cast
+from src.engine.broadcast import FrameBroadcaster
+from src.engine.metrics import Metrics
+from src.dialogue.prefetch import DialoguePrefetcher
+from src.dialogue.line_cache import LineCache
+
+
+def _service_ticks(text: str):
+    try:
+        values = [int(v) for v in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated tick counts, got {text!r}")
+    if any(v < 1 for v in values):
+        raise argparse.ArgumentTypeError("service times must be at least 1 tick")
+    return values
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m src.headless", description="Run the store simulation without a terminal UI.")
+    p.add_argument("--ticks", type=int, default=10_000, help="number of simulation ticks to run")
+    p.add_argument("--seed", type=int, default=None, help="master seed for all simulation random streams")
+    p.add_argument("--stats-every", type=int, default=0, metavar="N", help="print stats every N ticks (0 = only at the end)")
+    p.add_argument("--engine", choices=("objects", "soa"), default="objects", help="agent engine ('soa' needs numpy)")
+    p.add_argument("--customers", type=int, default=0, metavar="N", help="add N generated customers to the named cast")
+    p.add_argument("--lanes", type=int, default=1, metavar="N", help="number of checkout lanes")
+    p.add_argument("--service-ticks", type=_service_ticks, default=[15], metavar="T[,T...]",
+                   help="checkout service time in ticks, one value for all lanes or one per lane")
+    p.add_argument("--field-cache", type=int, default=64, metavar="N",
+                   help="ad-hoc flow fields kept in memory (each is 4 bytes per store tile)")
+    p.add_argument("--llm", action="store_true", help="allow LLM calls (off by default; templates are used instead)")
+    p.add_argument("--llm-concurrency", type=int, default=None, metavar="N",
+                   help="LLM requests kept in flight at once (default LM_STUDIO_CONCURRENCY or 4)")
+    p.add_argument("--pack-pairs", type=int, default=4, metavar="N",
+                   help="pack up to N waiting pairs' dialogue batches into one LLM request (1 = no packing)")
+    p.add_argument("--prefetch-budget", type=int, default=4, metavar="N",
+                   help="speculative LLM batches queued per prefetch pass for pairs about to meet (0 = off)")
+    p.add_argument("--line-cache", metavar="PATH",
+                   help="SQLite file of generated lines reused across runs (works with the LLM off)")
+    p.add_argument("--record", metavar="PATH", help="record LLM responses to PATH (implies --llm)")
+    p.add_argument("--replay", metavar="PATH", help="answer LLM requests from a recording instead of the server")
+    p.add_argument("--checkpoint", metavar="PATH", help="snapshot file for periodic checkpoints")
+    p.add_argument("--checkpoint-every", type=int, default=10_000, metavar="N", help="ticks between checkpoints")
+    p.add_argument("--resume", metavar="PATH", help="continue from a snapshot instead of starting at tick 0")
+    p.add_argument("--spectate", metavar="ADDR", help="publish frames for spectators on unix:PATH or HOST:PORT")
+    p.add_argument("--metrics", metavar="PATH", help="write tick/LLM latency histograms and counters as JSON at the end")
+    p.add_argument("--print-logs", action="store_true", help="echo simulation log lines to stdout")
+    return p
+
+
+def _format_stats(stats: dict, elapsed: float, ran: int) -> str:
+    tps = ran / elapsed if elapsed > 0 else float('inf')
+    return (
+        f"tick={stats['ticks']} elapsed={elapsed:.2f}s ticks/s={tps:,.0f} "
+        f"active={stats['active']}/{stats['total']} queue={stats['queue']} logs={stats['logs']}"
+    )
+
+
+def run(ticks: int, seed: Optional[int] = None, stats_every: int = 0, llm: bool = False,
+        print_logs: bool = False, engine: str = "objects", customers: int = 0, lanes: int = 1,
+        service_ticks=15, llm_concurrency: Optional[int] = None,
+        pack_pairs: int = 4, prefetch_budget: int = 4, line_cache: Optional[str] = None,
+        record: Optional[str] = None,
+        replay: Optional[str] = None, checkpoint: Optional[str] = None, checkpoint_every: int = 10_000,
+        resume: Optional[str] = None, spectate: Optional[str] = None,
+        metrics: Optional[str] = None, field_cache: int = 64, out: TextIO = sys.stdout) -> dict:
+    """Run `ticks` simulation ticks back-to-back and return the final stats dict."""
+    streams = RandomStreams(seed)
+    client = None
+    if replay:
+        client = ReplayClient(replay)
+    elif record:
+        client = RecordingClient(LocalLLMClient(), record)
+    recorder = Metrics() if metrics else None
+    cache = LineCache(line_cache) if line_cache else None
+    dialogue_mgr = DialogueManager(client=client, rng=streams.stream('dialogue'), inline_batches=client is not None,
+                                   metrics=recorder, llm_concurrency=llm_concurrency, pack_pairs=pack_pairs,
+                                   cache=cache, llm=llm or client is not None)
+    if resume:
+        sim = load_snapshot(resume, dialogue_mgr)
+        print(f"resumed from {resume} at tick {sim.ticks}", file=out)
+    else:
+        cast = generate_cast(customers, rng=streams.stream('cast')) if customers else None
+        if not isinstance(service_ticks, int) and len(service_ticks) == 1:
+            service_ticks = service_ticks[0]
+        sim = StoreSimulation(dialogue_mgr=dialogue_mgr, engine=engine, streams=streams, characters=cast,
+                              lanes=lanes, service_ticks=service_ticks, field_cache=field_cache)
+    sim.metrics = recorder
+    if prefetch_budget > 0:
+        sim.prefetcher = DialoguePrefetcher(budget=prefetch_budget)
+    if checkpoint:
+        sim.checkpoint = AutoCheckpoint(checkpoint, checkpoint_every)
+    broadcaster = FrameBroadcaster(spectate) if spectate else None
+    printed_logs = sim.total_logs
+    first_tick = sim.ticks
+    start = time.perf_counter()
+    try:
+        for _ in range(ticks):
+            sim.tick()
+            if broadcaster is not None:
+                broadcaster.publish(sim)
+            if print_logs:
+                # logs is a bounded deque; only the tail is new
+                fresh = sim.total_logs - printed_logs
+                if fresh:
+                    for line in list(sim.logs)[-min(fresh, len(sim.logs)):]:
+                        print(line, file=out)
+                    printed_logs = sim.total_logs
+            if stats_every and sim.ticks % stats_every == 0:
+                print(_format_stats(sim.stats(), time.perf_counter() - start, sim.ticks - first_tick), file=out)
+    finally:
+        if broadcaster is not None:
+            broadcaster.close()
+        dialogue_mgr.shutdown()
+        if client is not None:
+            client.close()
+        if cache is not None:
+            cache.close()
+    elapsed = time.perf_counter() - start
+    if checkpoint:
+        save_snapshot(sim, checkpoint)
+    if recorder is not None:
+        recorder.dump(metrics)
+    stats = sim.stats()
+    stats['elapsed'] = elapsed
+    stats['ticks_per_sec'] = (sim.ticks - first_tick) / elapsed if elapsed > 0 else float('inf')
+    if isinstance(client, ReplayClient):
+        stats['replay_misses'] = client.misses
+    print("done: " + _format_stats(stats, elapsed, sim.ticks - first_tick), file=out)
+    return stats
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run(args.ticks, seed=args.seed, stats_every=args.stats_every, llm=args.llm, print_logs=args.print_logs,
+        engine=args.engine, customers=args.customers, lanes=args.lanes,
+        service_ticks=args.service_ticks, llm_concurrency=args.llm_concurrency,
+        pack_pairs=args.pack_pairs, prefetch_budget=args.prefetch_budget, line_cache=args.line_cache,
+        record=args.record, replay=args.replay, checkpoint=args.checkpoint,
+        checkpoint_every=args.checkpoint_every, resume=args.resume, spectate=args.spectate,
+        metrics=args.metrics, field_cache=args.field_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,34 @@
+import asyncio
 import os
+import threading
 import time
 import random
-from typing import List, Optional, Any, Iterable
+from concurrent.futures import Future
+from typing import Callable, Iterator, List, Optional, Any, Iterable
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
 except ImportError:  # pragma: no cover
-    OpenAI = None
+    AsyncOpenAI = OpenAI = None
+
+START_TIMEOUT = 5.0  # seconds AsyncLocalLLMClient waits for its loop thread to come up
+
 
 class LocalLLMClient:
-    def __init__(self):
+    """Blocking client for an OpenAI-compatible local server (LM Studio, llama.cpp).
+
+    If `on_usage` is set, it is called with the server's token counts
+    (prompt_tokens, completion_tokens, cached_tokens) for every completion
+    that reports them.
+    """
+
+    def __init__(self, enabled: bool = True):
         self.base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
         self.model = os.getenv("LM_STUDIO_MODEL", "openai/gpt-oss-20b")
         # If OpenAI import failed, disable client
-        self.enabled = OpenAI is not None
+        self.enabled = enabled and OpenAI is not None
         self._client = None
+        self.on_usage: Optional[Callable[[dict], None]] = None
         if self.enabled and OpenAI is not None:  # runtime guard
             try:
                 self._client = OpenAI(base_url=self.base_url, api_key=os.getenv("LM_STUDIO_API_KEY","not-needed"))
@@ -36,23 +50,244 @@ class LocalLLMClient:
                 messages=payload_messages,  # type: ignore[arg-type]
                 max_tokens=max_tokens,
                 temperature=temperature,
+                timeout=timeout,
             )
+            _report_usage(self.on_usage, resp)
             if time.time() - start > timeout:
                 return None
-            choice = resp.choices[0]
-            content = getattr(choice.message, 'content', None)
-            if isinstance(content, str):
-                return content.strip()
+            return _content(resp)
+        except Exception:
             return None
+
+    def stream(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6) -> Iterator[str]:
+        """Yield the completion text as it arrives; stops quietly on errors or after `timeout`."""
+        if not self.enabled or not self._client:
+            return
+        try:
+            start = time.time()
+            payload_messages: Iterable[Any] = [{"role": "system", "content": system}] + messages
+            chunks = self._client.chat.completions.create(
+                model=self.model,
+                messages=payload_messages,  # type: ignore[arg-type]
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+            for chunk in chunks:
+                _report_usage(self.on_usage, chunk)
+                text = _delta(chunk)
+                if text:
+                    yield text
+                if time.time() - start > timeout:
+                    chunks.close()
+                    return
         except Exception:
+            return
+
+    def fallback(self, speaker, listener, context, rng: Optional[random.Random] = None):
+        return fallback_line(speaker, listener, context, rng=rng)
+
+
+class AsyncLocalLLMClient:
+    """LocalLLMClient counterpart that keeps several requests in flight.
+
+    An asyncio event loop runs in a daemon thread; at most `max_concurrency`
+    completions (default LM_STUDIO_CONCURRENCY or 4) are sent to the server
+    at once and the rest wait their turn on a semaphore. submit() returns a
+    concurrent.futures.Future immediately; generate() is the blocking form,
+    so the client can stand in for LocalLLMClient anywhere. Passing
+    `on_chunk` streams the completion and hands each piece of text to it as
+    it arrives. `on_usage` works as on LocalLLMClient and is called on the
+    loop thread.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.base_url = os.getenv("LM_STUDIO_BASE_URL", "http://localhost:1234/v1")
+        self.model = os.getenv("LM_STUDIO_MODEL", "openai/gpt-oss-20b")
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("LM_STUDIO_CONCURRENCY", "4"))
+        self.max_concurrency = max(1, max_concurrency)
+        self.enabled = AsyncOpenAI is not None
+        self._client = None
+        self.on_usage: Optional[Callable[[dict], None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        if self.enabled:
+            try:
+                self._start()
+            except Exception:
+                self.enabled = False
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        failed: List[BaseException] = []
+
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                # the client and semaphore must be created inside the loop that uses them
+                self._client = AsyncOpenAI(base_url=self.base_url,
+                                           api_key=os.getenv("LM_STUDIO_API_KEY", "not-needed"))
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            except BaseException as e:
+                failed.append(e)
+                return
+            finally:
+                ready.set()
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="llm-loop", daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout=START_TIMEOUT):
+            loop.call_soon_threadsafe(loop.stop)
+            raise RuntimeError("LLM event loop did not start")
+        if failed:
+            self._thread.join()
+            loop.close()
+            raise failed[0]
+        self._loop = loop
+
+    def is_available(self):
+        return self.enabled
+
+    async def agenerate(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6,
+                        on_chunk: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Coroutine form of generate(); must run on this client's loop."""
+        payload_messages: Iterable[Any] = [{"role": "system", "content": system}] + messages
+        try:
+            async with self._slots:
+                if on_chunk is not None:
+                    return await asyncio.wait_for(
+                        self._stream(payload_messages, max_tokens, temperature, on_chunk), timeout)
+                resp = await asyncio.wait_for(self._client.chat.completions.create(  # type: ignore[union-attr]
+                    model=self.model,
+                    messages=payload_messages,  # type: ignore[arg-type]
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                ), timeout)
+            _report_usage(self.on_usage, resp)
+            return _content(resp)
+        except Exception:
+            return None
+
+    async def _stream(self, payload_messages, max_tokens, temperature, on_chunk) -> Optional[str]:
+        chunks = await self._client.chat.completions.create(  # type: ignore[union-attr]
+            model=self.model,
+            messages=payload_messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parts: List[str] = []
+        async for chunk in chunks:
+            _report_usage(self.on_usage, chunk)
+            text = _delta(chunk)
+            if text:
+                parts.append(text)
+                on_chunk(text)
+        return "".join(parts).strip() or None
+
+    def submit(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6,
+               callback: Optional[Callable[[Optional[str]], None]] = None,
+               on_chunk: Optional[Callable[[str], None]] = None) -> Future:
+        """Start a request without waiting; the Future resolves to the text or None.
+
+        `callback`, if given, is called with the result and `on_chunk` with
+        each streamed piece of text, both on the loop thread.
+        """
+        if not self.enabled or self._loop is None:
+            fut: Future = Future()
+            fut.set_result(None)
+            if callback is not None:
+                callback(None)
+            return fut
+        fut = asyncio.run_coroutine_threadsafe(
+            self.agenerate(system, messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout,
+                           on_chunk=on_chunk),
+            self._loop)
+        if callback is not None:
+            fut.add_done_callback(lambda f: callback(None if f.cancelled() or f.exception() else f.result()))
+        return fut
+
+    def generate(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6) -> Optional[str]:
+        if not self.enabled:
             return None
+        return self.submit(system, messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout).result()
+
+    def fallback(self, speaker, listener, context, rng: Optional[random.Random] = None):
+        return fallback_line(speaker, listener, context, rng=rng)
+
+    def close(self):
+        """Cancel outstanding requests and stop the loop thread."""
+        loop = self._loop
+        if loop is None:
+            return
+        self._loop = None
+        self.enabled = False
+
+        async def drain():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._client is not None:
+                await self._client.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(timeout=2)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            if not self._thread.is_alive():
+                loop.close()
+
+
+def _delta(chunk) -> Optional[str]:
+    if not chunk.choices:
+        return None
+    return getattr(chunk.choices[0].delta, 'content', None)
+
+
+def _report_usage(on_usage: Optional[Callable[[dict], None]], resp):
+    """Pass the token counts of a response (or final stream chunk) to `on_usage`, if it has any."""
+    if on_usage is None:
+        return
+    usage = getattr(resp, 'usage', None)
+    timings = getattr(resp, 'timings', None)  # llama.cpp server extension
+    if usage is None and not isinstance(timings, dict):
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None)
+    if cached is None and isinstance(timings, dict):
+        cached = timings.get('cache_n')
+    on_usage({
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', None) or 0,
+        'cached_tokens': cached or 0,
+    })
+
+
+def _content(resp) -> Optional[str]:
+    choice = resp.choices[0]
+    content = getattr(choice.message, 'content', None)
+    if isinstance(content, str):
+        return content.strip()
+    return None
+
 
-    def fallback(self, speaker, listener, context):
-        templates = [
-            f"{listener}, have you noticed {context}?",
-            f"Thinking about {context} lately.",
-            f"{listener}, any opinion on {context}?",
-            f"I might buy something else related to {context}.",
-            f"Not sure about these prices today."
-        ]
-        return random.choice(templates)
+def fallback_line(speaker, listener, context, rng: Optional[random.Random] = None):
+    """Template line used whenever no LLM output is available."""
+    templates = [
+        f"{listener}, have you noticed {context}?",
+        f"Thinking about {context} lately.",
+        f"{listener}, any opinion on {context}?",
+        f"I might buy something else related to {context}.",
+        f"Not sure about these prices today."
+    ]
+    return (rng or random).choice(templates)
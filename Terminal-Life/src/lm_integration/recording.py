@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional
+
+from src.lm_integration.client import fallback_line
+
+
+def request_key(system: str, messages: List[dict], max_tokens, temperature) -> str:
+    """Stable digest of everything that determines a generate() request."""
+    blob = json.dumps([system, messages, int(max_tokens), float(temperature)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+
+class RecordingClient:
+    """Wraps an LLM client and appends every generate() response to a JSONL file.
+
+    The first line records whether the wrapped client was available; every
+    following line is {"key": request_key(...), "response": str | null}.
+    """
+
+    def __init__(self, inner, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        self._fh = open(path, 'w', encoding='utf-8')
+        self._write({"available": bool(inner.is_available())})
+
+    def _write(self, obj: dict):
+        with self._lock:
+            self._fh.write(json.dumps(obj, ensure_ascii=False) + "\n")
+            self._fh.flush()
+
+    def is_available(self):
+        return self.inner.is_available()
+
+    def generate(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6) -> Optional[str]:
+        resp = self.inner.generate(system, messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
+        self._write({"key": request_key(system, messages, max_tokens, temperature), "response": resp})
+        return resp
+
+    def fallback(self, speaker, listener, context, rng=None):
+        return self.inner.fallback(speaker, listener, context, rng=rng)
+
+    def close(self):
+        with self._lock:
+            self._fh.close()
+
+
+class ReplayClient:
+    """Serves responses captured by RecordingClient instead of calling a server.
+
+    Identical requests are answered in the order they were recorded. Requests
+    that were never recorded count as misses and return None.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.available = False
+        self.misses = 0
+        self._responses: Dict[str, Deque[Optional[str]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+        with open(path, encoding='utf-8') as fh:
+            for n, line in enumerate(fh):
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                if n == 0 and 'available' in rec:
+                    self.available = bool(rec['available'])
+                    continue
+                self._responses[rec['key']].append(rec.get('response'))
+
+    def is_available(self):
+        return self.available
+
+    def generate(self, system: str, messages: List[dict], max_tokens=60, temperature=0.8, timeout=6) -> Optional[str]:
+        key = request_key(system, messages, max_tokens, temperature)
+        with self._lock:
+            dq = self._responses.get(key)
+            if not dq:
+                self.misses += 1
+                return None
+            return dq.popleft()
+
+    def fallback(self, speaker, listener, context, rng=None):
+        return fallback_line(speaker, listener, context, rng=rng)
+
+    def close(self):
+        pass
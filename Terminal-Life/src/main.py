@@ -1,3 +1,4 @@
+import argparse
 import curses
 import time
 import traceback
@@ -5,18 +6,40 @@ import traceback
 from src.store.simulation import StoreSimulation
 from src.engine.render import Renderer
 from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.broadcast import FrameBroadcaster
+from src.engine.metrics import Metrics
+from src.dialogue.prefetch import DialoguePrefetcher
+from src.dialogue.line_cache import LineCache
 
-TICK_SECONDS = 0.5
+TICK_SECONDS = 0.5        # one simulation tick at 1x speed
+RENDER_FPS = 20           # cap on displayed frames per second
+SPEEDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MAX_SIM_SECONDS = 0.25    # wall time the sim may use between two frames before ticks are dropped
+PAN_KEYS = {
+    curses.KEY_UP: (-1, 0), curses.KEY_DOWN: (1, 0),
+    curses.KEY_LEFT: (0, -1), curses.KEY_RIGHT: (0, 1),
+}
 
 
-def main(stdscr):
+def main(stdscr, spectate=None, metrics_path=None, line_cache=None, llm=True):
+    """Fixed-timestep loop: the simulation ticks every TICK_SECONDS / speed,
+    independently of rendering, which is capped at RENDER_FPS. When ticks are
+    due faster than one frame, several run per frame; frames that come due
+    while the sim is busy are skipped. If the sim cannot keep up with the
+    chosen speed, the backlog is dropped rather than freezing the screen.
+    """
     curses.curs_set(0)
     stdscr.nodelay(True)
-    stdscr.timeout(int(TICK_SECONDS * 1000))
+    stdscr.keypad(True)
 
-    dialogue_mgr = DialogueManager()
+    metrics = Metrics()
+    cache = LineCache(line_cache) if line_cache else None
+    dialogue_mgr = DialogueManager(metrics=metrics, cache=cache, llm=llm)
     sim = StoreSimulation(dialogue_mgr=dialogue_mgr)
+    sim.metrics = metrics
+    sim.prefetcher = DialoguePrefetcher()
     renderer = Renderer(simulation=sim)
+    broadcaster = FrameBroadcaster(spectate) if spectate else None
 
     paused = False
     running = True
@@ -24,6 +47,9 @@ def main(stdscr):
     show_help = False
     verbose_llm = False
     last_resize = None
+    speed_idx = 0
+    frame_seconds = 1.0 / RENDER_FPS
+    next_tick = next_frame = time.perf_counter()
 
     try:
         while running:
@@ -33,8 +59,14 @@ def main(stdscr):
                     renderer.resize(rows, cols)
                     last_resize = (rows, cols)
 
+                # block for input until the next tick or frame is due
+                now = time.perf_counter()
+                wake = next_frame if paused else min(next_tick, next_frame)
+                stdscr.timeout(max(0, int((wake - now) * 1000)))
                 key = stdscr.getch()
-                if key != -1:
+                if key in PAN_KEYS:
+                    renderer.pan(*PAN_KEYS[key])
+                elif key != -1:
                     ch = chr(key) if 0 <= key < 256 else ''
                     if ch == 'q':
                         running = False
@@ -50,12 +82,40 @@ def main(stdscr):
                     elif ch == 'g':
                         renderer.toggle_fancy()
                         sim.add_log(f"Fancy graphics: {renderer.fancy}")
+                    elif ch == 'f':
+                        renderer.follow_next()
+                    elif ch == 'F':
+                        renderer.free_camera()
+                    elif ch in '+=':
+                        speed_idx = min(speed_idx + 1, len(SPEEDS) - 1)
+                    elif ch == '-':
+                        speed_idx = max(speed_idx - 1, 0)
+                    elif ch == 'h':
+                        renderer.toggle_hud()
 
-                if not paused:
-                    sim.tick(force_conversation=force_convo, verbose_llm=verbose_llm)
-                    force_convo = False
+                now = time.perf_counter()
+                if paused:
+                    next_tick = now
+                else:
+                    tick_seconds = TICK_SECONDS / SPEEDS[speed_idx]
+                    budget = now + MAX_SIM_SECONDS
+                    while next_tick <= now:
+                        sim.tick(force_conversation=force_convo, verbose_llm=verbose_llm)
+                        force_convo = False
+                        next_tick += tick_seconds
+                        if time.perf_counter() > budget:
+                            next_tick = max(next_tick, time.perf_counter())  # can't keep up: drop the backlog
+                            break
+                if broadcaster is not None:
+                    # also while paused, so viewers that connect now get their keyframe
+                    broadcaster.publish(sim)
 
-                renderer.render(stdscr, show_help=show_help, paused=paused, verbose_llm=verbose_llm)
+                now = time.perf_counter()
+                if now >= next_frame:
+                    renderer.render(stdscr, show_help=show_help, paused=paused, verbose_llm=verbose_llm,
+                                    speed=SPEEDS[speed_idx])
+                    # skip frames that came due while we were busy
+                    next_frame = max(next_frame + frame_seconds, now)
 
             except KeyboardInterrupt:
                 running = False
@@ -64,10 +124,23 @@ def main(stdscr):
                 sim.add_log(traceback.format_exc())
                 time.sleep(1)
     finally:
+        if broadcaster is not None:
+            broadcaster.close()
         dialogue_mgr.shutdown()
+        if cache is not None:
+            cache.close()
+        if metrics_path:
+            metrics.dump(metrics_path)
 
     curses.endwin()
 
 
 if __name__ == "__main__":
-    curses.wrapper(main)
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog="python -m src.main")
+    parser.add_argument("--spectate", metavar="ADDR", help="publish frames for spectators on unix:PATH or HOST:PORT")
+    parser.add_argument("--metrics", metavar="PATH", help="write latency histograms and counters as JSON on exit")
+    parser.add_argument("--line-cache", metavar="PATH", help="SQLite file of generated lines reused across runs")
+    parser.add_argument("--no-llm", action="store_true", help="use template dialogue only; no LLM client is started")
+    args = parser.parse_args()
+    curses.wrapper(main, spectate=args.spectate, metrics_path=args.metrics, line_cache=args.line_cache,
+                   llm=not args.no_llm)
\ No newline at end of file
@@ -24,3 +24,13 @@ class CharacterMemory:
 
     def dump_all(self, limit_each: int = 5):
         return {k: list(dq)[-limit_each:] for k, dq in self._mem.items()}
+
+    def export(self) -> Dict[str, List[str]]:
+        return {k: list(dq) for k, dq in self._mem.items()}
+
+    @classmethod
+    def restore(cls, capacity_per_person: int, data: Dict[str, List[str]]) -> "CharacterMemory":
+        mem = cls(capacity_per_person)
+        for speaker, lines in data.items():
+            mem._mem[speaker].extend(lines)
+        return mem
@@ -0,0 +1,151 @@
+"""Spectator client for a run started with --spectate ADDR.
+
+    python -m src.spectate unix:/tmp/store.sock
+    python -m src.spectate 127.0.0.1:7777 --text
+
+Rebuilds the store from the keyframe + delta stream published by
+src.engine.broadcast and draws it with curses (or, with --text, prints the
+log lines and a status line per frame to stdout).
+"""
+import argparse
+import curses
+import json
+import select
+import socket
+import sys
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from src.engine.broadcast import parse_address
+from src.engine.soa import MOOD_LABELS
+
+MOOD_GLYPHS = {'Happy': '☺', 'Upbeat': '♣', 'Neutral': '•', 'Flat': '·', 'Irritated': '✖'}
+
+
+class SpectatorState:
+    """The store as last described by the stream."""
+
+    def __init__(self, log_limit: int = 200):
+        self.tick = 0
+        self.layout: List[str] = []
+        self.names: List[str] = []
+        self.chars: Dict[int, Tuple[int, int, int]] = {}
+        self.queue: List[int] = []
+        self.logs = deque(maxlen=log_limit)
+        self.synced = False
+
+    def apply(self, msg: dict) -> List[str]:
+        """Apply one message; returns its new log lines."""
+        if msg['t'] == 'key':
+            self.layout = msg['layout']
+            self.names = msg['names']
+            self.chars = {i: (y, x, m) for i, y, x, m in msg['chars']}
+            self.queue = msg['queue']
+            self.logs.clear()
+            self.synced = True
+        elif not self.synced:
+            return []
+        else:
+            for i, y, x, m in msg['set']:
+                self.chars[i] = (y, x, m)
+            for i in msg['del']:
+                self.chars.pop(i, None)
+            if 'queue' in msg:
+                self.queue = msg['queue']
+        self.tick = msg['tick']
+        self.logs.extend(msg['logs'])
+        return msg['logs']
+
+    def compose(self, rows: int, cols: int) -> List[str]:
+        area = [list(line[:cols].ljust(cols)) for line in self.layout[:rows]]
+        for y, x, m in self.chars.values():
+            if 0 <= y < len(area) and 0 <= x < cols:
+                area[y][x] = MOOD_GLYPHS.get(MOOD_LABELS[m], '?')
+        return ["".join(row) for row in area]
+
+    def status(self) -> str:
+        return f"Tick:{self.tick} On stage:{len(self.chars)}/{len(self.names)} Queue:{len(self.queue)}"
+
+
+def messages(sock: socket.socket, idle: Optional[float] = None):
+    """Decoded messages from the stream until it closes.
+
+    With `idle`, None is yielded whenever nothing arrives for that many
+    seconds, so the caller can poll for input while the sim is paused.
+    """
+    buf = b''
+    while True:
+        if idle is not None and not select.select([sock], [], [], idle)[0]:
+            yield None
+            continue
+        chunk = sock.recv(65536)
+        if not chunk:
+            return
+        buf += chunk
+        *lines, buf = buf.split(b'\n')
+        for line in lines:
+            if line:
+                yield json.loads(line)
+
+
+def connect(address: str) -> socket.socket:
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(addr)
+    return sock
+
+
+def run_text(sock: socket.socket, out=sys.stdout):
+    state = SpectatorState()
+    for msg in messages(sock):
+        for line in state.apply(msg):
+            print(line, file=out)
+        print(state.status(), file=out)
+        out.flush()
+
+
+def run_curses(stdscr, sock: socket.socket):
+    curses.curs_set(0)
+    stdscr.nodelay(True)
+    state = SpectatorState()
+    for msg in messages(sock, idle=0.1):
+        if stdscr.getch() == ord('q'):
+            break
+        if msg is None:
+            continue
+        state.apply(msg)
+        rows, cols = stdscr.getmaxyx()
+        top = int(rows * 2 / 3)
+        stdscr.erase()  # curses only sends the cells that differ from the last refresh
+        try:
+            for r, line in enumerate(state.compose(top, cols)):
+                stdscr.addstr(r, 0, line)
+            stdscr.addstr(top, 0, state.status()[:cols - 1])
+            logs = list(state.logs)[-(rows - top - 2):] if rows - top > 2 else []
+            for i, line in enumerate(logs):
+                stdscr.addstr(top + 1 + i, 0, line[:cols - 1])
+        except curses.error:
+            pass
+        stdscr.noutrefresh()
+        curses.doupdate()
+
+
+def main(argv: Optional[List[str]] = None):
+    p = argparse.ArgumentParser(prog="python -m src.spectate", description="Watch a running simulation.")
+    p.add_argument("address", help="unix:PATH or HOST:PORT given to --spectate")
+    p.add_argument("--text", action="store_true", help="print logs and status lines instead of drawing the store")
+    args = p.parse_args(argv)
+    sock = connect(args.address)
+    try:
+        if args.text:
+            run_text(sock)
+        else:
+            curses.wrapper(run_curses, sock)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
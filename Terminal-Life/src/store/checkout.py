@@ -0,0 +1,133 @@
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+Place = Callable[[str, int, int], None]
+OnServe = Callable[["CheckoutLane", str], None]
+
+
+class CheckoutLane:
+    """One register lane: the customer at the till plus a FIFO line behind it.
+
+    `slots` are the tiles the lane occupies, till first. Customers further
+    back than the last slot wait on it.
+    """
+
+    def __init__(self, index: int, slots: Sequence[Tuple[int, int]], service_ticks: int):
+        self.index = index
+        self.slots = tuple(slots)
+        self.service_ticks = service_ticks
+        self.serving: Optional[str] = None
+        self.line: Deque[str] = deque()
+
+    def __len__(self):
+        return len(self.line) + (self.serving is not None)
+
+    def slot(self, n: int) -> Tuple[int, int]:
+        """Tile for the n-th customer in the lane (0 = at the till)."""
+        return self.slots[min(n, len(self.slots) - 1)]
+
+
+class CheckoutQueues:
+    """Checkout lanes maintained incrementally by join/leave events.
+
+    A joining customer picks the shortest lane (lowest index on ties). When a
+    till frees up, the next customer in that lane steps forward and `on_serve`
+    is called so the simulation can schedule the end of service. Each event
+    touches only its own lane, and repositions at most the lane's visible
+    slots, so the cost is independent of how many customers are in the store.
+    Customers are moved through `place(name, y, x)`.
+    """
+
+    def __init__(self, lanes: Sequence[Sequence[Tuple[int, int]]], service_ticks: Sequence[int],
+                 place: Place, on_serve: OnServe):
+        if len(service_ticks) != len(lanes):
+            raise ValueError(f"got {len(service_ticks)} service times for {len(lanes)} checkout lanes")
+        self.lanes: List[CheckoutLane] = [
+            CheckoutLane(i, slots, ticks) for i, (slots, ticks) in enumerate(zip(lanes, service_ticks))
+        ]
+        self.place = place
+        self.on_serve = on_serve
+        self._lane_of: Dict[str, CheckoutLane] = {}
+
+    def __len__(self):
+        return len(self._lane_of)
+
+    def __contains__(self, name: str):
+        return name in self._lane_of
+
+    def lane_of(self, name: str) -> Optional[CheckoutLane]:
+        return self._lane_of.get(name)
+
+    def is_serving(self, name: str) -> bool:
+        lane = self._lane_of.get(name)
+        return lane is not None and lane.serving == name
+
+    def names(self) -> List[str]:
+        """Everyone queued, lane by lane, front first."""
+        out: List[str] = []
+        for lane in self.lanes:
+            if lane.serving is not None:
+                out.append(lane.serving)
+            out.extend(lane.line)
+        return out
+
+    # ----------------- events -----------------
+    def join(self, name: str) -> CheckoutLane:
+        """Put `name` at the back of the shortest lane."""
+        lane = self._lane_of.get(name)
+        if lane is not None:
+            return lane
+        lane = min(self.lanes, key=len)
+        self._lane_of[name] = lane
+        lane.line.append(name)
+        if lane.serving is None:
+            self._advance(lane)
+        else:
+            self.place(name, *lane.slot(len(lane.line)))
+        return lane
+
+    def leave(self, name: str) -> Optional[CheckoutLane]:
+        """Remove `name` from its lane (served or not); those behind move up."""
+        lane = self._lane_of.pop(name, None)
+        if lane is None:
+            return None
+        if lane.serving == name:
+            lane.serving = None
+            self._advance(lane)
+        else:
+            pos = lane.line.index(name)
+            del lane.line[pos]
+            self._shift(lane, pos)
+        return lane
+
+    def _advance(self, lane: CheckoutLane):
+        if not lane.line:
+            return
+        name = lane.line.popleft()
+        lane.serving = name
+        self.place(name, *lane.slot(0))
+        self._shift(lane, 0)
+        self.on_serve(lane, name)
+
+    def _shift(self, lane: CheckoutLane, start: int):
+        # line[i] stands on slot i + 1; only the visible slots change
+        end = min(len(lane.line), len(lane.slots) - 1)
+        for i in range(start, end):
+            self.place(lane.line[i], *lane.slot(i + 1))
+
+    # ----------------- snapshot support -----------------
+    def export(self) -> List[list]:
+        return [[lane.serving, list(lane.line)] for lane in self.lanes]
+
+    def restore(self, state: Sequence[Sequence]):
+        """Inverse of export(); positions are assumed to be restored already."""
+        if len(state) != len(self.lanes):
+            raise ValueError(f"queue state has {len(state)} lanes, store has {len(self.lanes)}")
+        self._lane_of.clear()
+        for lane, (serving, line) in zip(self.lanes, state):
+            lane.serving = serving
+            lane.line = deque(line)
+            if serving is not None:
+                self._lane_of[serving] = lane
+            for name in line:
+                self._lane_of[name] = lane
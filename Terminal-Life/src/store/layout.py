@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 # Core structural tiles
 WALL = '#'
@@ -18,6 +18,10 @@ COFFEE = 'C'           # coffee station / hot drinks
 MAGAZINE = 'm'         # magazine / impulse rack
 TABLE = 't'            # small seating table (non-passable)
 
+# Tile groups
+PASSABLE_TILES = (EMPTY, QUEUE, COUNTER, DOOR, REGISTER)
+BROWSE_TILES = (SHELF, PRODUCE, DRINKS)  # tiles customers pick as shopping targets
+
 class StoreLayout:
     """Defines a richer store layout with multiple themed zones.
 
@@ -25,13 +29,24 @@ class StoreLayout:
       = snack shelves   p produce   b drinks   F fridge   f freezer
       C coffee bar      m magazine  R register r counter  : queue
       D door            t table
+
+    `grid` is the authoring form. After building, the layout is compiled into
+    flat byte arrays (`cells`, `passable_map`, indexed y * width + x) plus
+    per-tile-kind position indexes and zone bounding boxes, so lookups on the
+    simulation hot path never rescan the grid. Call `compile()` again after
+    editing `grid` directly.
+
+    `lanes` checkout lanes are laid out as queue columns under the register
+    counter, two tiles apart.
     """
 
-    def __init__(self, height=26, width=78):
+    def __init__(self, height=26, width=78, lanes=1):
         self.height = height
         self.width = width
+        self.lanes = lanes
         self.grid = [[EMPTY for _ in range(width)] for _ in range(height)]
         self._build()
+        self.compile()
 
     def _hline(self, y: int, x0: int, x1: int, ch: str):
         for x in range(max(0, x0), min(self.width, x1+1)):
@@ -63,10 +78,16 @@ class StoreLayout:
         for x in range(reg_left, reg_right):
             self.grid[6][x] = COUNTER  # counter lip
 
-        # Queue channel leading downward from counter
+        # Queue channels leading downward from counter, one per checkout lane
         qx = reg_left + 4  # slight inset
-        for y in range(7, 18):
-            self.grid[y][qx] = QUEUE
+        max_lanes = (reg_right - 1 - reg_left) // 2 + 1
+        if not 1 <= self.lanes <= max_lanes:
+            raise ValueError(f"the register counter fits 1-{max_lanes} checkout lanes, got {self.lanes}")
+        first_x = max(reg_left, min(qx - 2 * ((self.lanes - 1) // 2), reg_right - 1 - 2 * (self.lanes - 1)))
+        lane_xs = [first_x + 2 * i for i in range(self.lanes)]
+        for lx in lane_xs:
+            for y in range(7, 18):
+                self.grid[y][lx] = QUEUE
 
         # Long snack shelf aisles (center region)
         shelf_rows = [4, 7, 10, 13, 16]
@@ -98,7 +119,7 @@ class StoreLayout:
             self.grid[2][x] = COFFEE
 
         # Magazine / impulse rack near queue entrance
-        for x in range(qx-2, qx):
+        for x in range(lane_xs[0]-2, lane_xs[0]):
             self.grid[8][x] = MAGAZINE
 
         # Small seating (tables) near door area (bottom center)
@@ -107,42 +128,99 @@ class StoreLayout:
         for x in range(door_x+4, door_x+9, 2):
             self.grid[self.height-5][x] = TABLE
 
+    # ----------------- compiled form -----------------
+    def compile(self):
+        """Flatten `grid` into byte arrays and rebuild the tile indexes."""
+        w = self.width
+        self.cells = bytearray(ord(ch) for row in self.grid for ch in row)
+        passable_codes = {ord(ch) for ch in PASSABLE_TILES}
+        self.passable_map = bytearray(1 if b in passable_codes else 0 for b in self.cells)
+        index: Dict[str, List[Tuple[int, int]]] = {}
+        for i, b in enumerate(self.cells):
+            index.setdefault(chr(b), []).append(divmod(i, w))
+        # row-major position tuples per tile kind
+        self.tiles: Dict[str, Tuple[Tuple[int, int], ...]] = {k: tuple(v) for k, v in index.items()}
+        # (min_y, min_x, max_y, max_x) per tile kind
+        self.zones: Dict[str, Tuple[int, int, int, int]] = {}
+        for kind, pts in self.tiles.items():
+            ys = [y for y, _ in pts]
+            xs = [x for _, x in pts]
+            self.zones[kind] = (min(ys), min(xs), max(ys), max(xs))
+        self._browse = tuple(sorted(p for kind in BROWSE_TILES for p in self.tiles.get(kind, ())))
+        self._lines = ["".join(row) for row in self.grid]
+        self._checkout_lanes = self._find_checkout_lanes()
+        self._queue_entry = self._find_queue_entry()
+        self._door = self._find_door()
+
+    def _find_checkout_lanes(self) -> Tuple[Tuple[Tuple[int, int], ...], ...]:
+        """Per queue column, left to right: the counter tile above it, then the column top-down."""
+        columns: Dict[int, List[Tuple[int, int]]] = {}
+        for y, x in self.tiles.get(QUEUE, ()):
+            columns.setdefault(x, []).append((y, x))
+        lanes = []
+        for x in sorted(columns):
+            slots = columns[x]
+            top = slots[0][0] - 1
+            if self.tile_at(top, x) == COUNTER:
+                slots.insert(0, (top, x))
+            lanes.append(tuple(slots))
+        return tuple(lanes)
+
+    def _find_queue_entry(self) -> Tuple[int, int]:
+        if self._checkout_lanes:
+            return self._checkout_lanes[0][-1]
+        for y in range(self.height):
+            if self.grid[y][self.width-8] == QUEUE:
+                return (y, self.width-8)
+        return (6, self.width-8)
+
+    def _find_door(self) -> Tuple[int, int]:
+        for x in range(self.width):
+            if self.grid[self.height-1][x] == DOOR:
+                return (self.height-1, x)
+        return (self.height-1, self.width//2)
+
+    # ----------------- queries -----------------
     def render_lines(self) -> List[str]:
-        return ["".join(row) for row in self.grid]
+        return list(self._lines)
 
     def in_bounds(self, y, x):
         return 0 <= y < self.height and 0 <= x < self.width
 
     def passable(self, y, x):
-        if not self.in_bounds(y, x):
-            return False
         # Only walk through open floor / queue / counter zone / door.
-        return self.grid[y][x] in (EMPTY, QUEUE, COUNTER, DOOR, REGISTER)
+        return 0 <= y < self.height and 0 <= x < self.width and self.passable_map[y * self.width + x] == 1
 
-    def shelf_positions(self) -> List[Tuple[int,int]]:
-        out: List[Tuple[int,int]] = []
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.grid[y][x] in (SHELF, PRODUCE, DRINKS):
-                    out.append((y, x))
-        return out
+    def tile_at(self, y, x) -> str:
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return chr(self.cells[y * self.width + x])
+        return EMPTY
+
+    def positions_of(self, kind: str) -> Sequence[Tuple[int, int]]:
+        return self.tiles.get(kind, ())
+
+    def zone_bounds(self, kind: str) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box (min_y, min_x, max_y, max_x) of all tiles of `kind`."""
+        return self.zones.get(kind)
+
+    def shelf_positions(self) -> Sequence[Tuple[int,int]]:
+        return self._browse
 
     def queue_entry(self):
-        for y in range(self.height):
-            if self.grid[y][self.width-8] == QUEUE:
-                return (y, self.width-8)
-        return (6, self.width-8)
+        return self._queue_entry
+
+    def queue_entries(self) -> List[Tuple[int, int]]:
+        """Back tile of every checkout lane, where customers join the line."""
+        if not self._checkout_lanes:
+            return [self._queue_entry]
+        return [lane[-1] for lane in self._checkout_lanes]
+
+    def checkout_lanes(self) -> Tuple[Tuple[Tuple[int, int], ...], ...]:
+        """Tiles of each checkout lane, till (counter) first."""
+        return self._checkout_lanes
 
     def register_positions(self):
-        pos=[]
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.grid[y][x] == REGISTER:
-                    pos.append((y,x))
-        return pos
+        return self.tiles.get(REGISTER, ())
 
     def door_position(self):
-        for x in range(self.width):
-            if self.grid[self.height-1][x] == DOOR:
-                return (self.height-1, x)
-        return (self.height-1, self.width//2)
+        return self._door
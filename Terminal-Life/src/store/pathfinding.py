@@ -0,0 +1,186 @@
+from array import array
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.store.layout import StoreLayout
+
+UNREACHABLE = -1
+# 4-connected moves, tried in this order when following a field
+STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class FlowField:
+    """BFS distance field toward a set of goal tiles.
+
+    `dist` holds, for every tile (indexed y * width + x), the number of passable
+    steps to the nearest goal, or UNREACHABLE. Any number of agents can share a
+    field; following it costs O(1) per step.
+    """
+
+    __slots__ = ('key', 'width', 'height', 'dist')
+
+    def __init__(self, layout: StoreLayout, goals: Iterable[Tuple[int, int]], key=None):
+        self.key = key
+        self.width = w = layout.width
+        self.height = h = layout.height
+        passable = layout.passable_map
+        dist = array('i', [UNREACHABLE]) * (w * h)
+        frontier = deque()
+        for y, x in goals:
+            i = y * w + x
+            if layout.in_bounds(y, x) and passable[i] and dist[i] == UNREACHABLE:
+                dist[i] = 0
+                frontier.append(i)
+        while frontier:
+            i = frontier.popleft()
+            d = dist[i] + 1
+            y, x = divmod(i, w)
+            for dy, dx in STEPS:
+                ny, nx = y + dy, x + dx
+                if 0 <= ny < h and 0 <= nx < w:
+                    j = ny * w + nx
+                    if passable[j] and dist[j] == UNREACHABLE:
+                        dist[j] = d
+                        frontier.append(j)
+        self.dist = dist
+
+    def distance(self, y: int, x: int) -> int:
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return self.dist[y * self.width + x]
+        return UNREACHABLE
+
+    def next_step(self, y: int, x: int) -> Optional[Tuple[int, int]]:
+        """Neighbouring tile one step closer to the goal, or None at/without a goal.
+
+        Agents standing on an unreachable tile (e.g. spawned on a shelf) step
+        onto the best reachable neighbour instead.
+        """
+        d = self.distance(y, x)
+        if d == 0:
+            return None
+        best = None
+        best_d = d if d != UNREACHABLE else None
+        for dy, dx in STEPS:
+            nd = self.distance(y + dy, x + dx)
+            if nd == UNREACHABLE:
+                continue
+            if best_d is None or nd < best_d:
+                best, best_d = (y + dy, x + dx), nd
+        return best
+
+    def steps_from(self, y: int, x: int) -> int:
+        """Walking distance to the goal from (y, x), stepping off an unreachable tile first; or UNREACHABLE."""
+        d = self.distance(y, x)
+        if d != UNREACHABLE:
+            return d
+        nxt = self.next_step(y, x)
+        return UNREACHABLE if nxt is None else self.distance(*nxt) + 1
+
+    def path_from(self, y: int, x: int, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Tiles an agent at (y, x) would visit, up to `limit` steps."""
+        out: List[Tuple[int, int]] = []
+        while limit is None or len(out) < limit:
+            nxt = self.next_step(y, x)
+            if nxt is None:
+                break
+            out.append(nxt)
+            y, x = nxt
+        return out
+
+
+class PathPlanner:
+    """Shared flow fields for one layout.
+
+    Fields toward every point of interest are built once up front: one per
+    connected group of browse tiles (targeting the walkable tiles beside it),
+    plus 'queue'. Ad-hoc targets go through an LRU cache of at
+    most `cache_size` fields.
+
+    Every field holds a 4-byte distance per tile, so memory is about
+    (fixed fields + cache_size) * width * height * 4 bytes: roughly 8 KB a
+    field and 0.8 MB in all for the default 78x26 store, growing with the
+    floor area for larger layouts. Lower `cache_size`
+    (StoreSimulation(field_cache=...), headless --field-cache) to trade
+    memory for rebuilding evicted fields.
+    """
+
+    def __init__(self, layout: StoreLayout, cache_size: int = 64):
+        self.layout = layout
+        self.cache_size = cache_size
+        self._adhoc: "OrderedDict[Tuple[int, int], FlowField]" = OrderedDict()
+        self.on_evict: Optional[Callable[[FlowField], None]] = None  # told about each ad-hoc field dropped
+        self.fields: Dict[str, FlowField] = {
+            'queue': FlowField(layout, layout.queue_entries(), key='queue'),
+        }
+        self._browse_fields: List[FlowField] = []
+        # browse tile -> field of the group it belongs to
+        self._browse_field: Dict[Tuple[int, int], FlowField] = {}
+        for n, group in enumerate(self._browse_groups()):
+            key = f'browse:{n}'
+            goals = {
+                (y + dy, x + dx)
+                for y, x in group for dy, dx in STEPS
+                if layout.passable(y + dy, x + dx)
+            }
+            ff = FlowField(layout, sorted(goals), key=key)
+            self.fields[key] = ff
+            self._browse_fields.append(ff)
+            for p in group:
+                self._browse_field[p] = ff
+
+    def _browse_groups(self) -> List[List[Tuple[int, int]]]:
+        """4-connected components of same-kind browse tiles, in row-major order."""
+        layout = self.layout
+        seen = set()
+        groups = []
+        for start in layout.shelf_positions():
+            if start in seen:
+                continue
+            kind = layout.tile_at(*start)
+            seen.add(start)
+            group = [start]
+            stack = [start]
+            while stack:
+                y, x = stack.pop()
+                for dy, dx in STEPS:
+                    p = (y + dy, x + dx)
+                    if p not in seen and layout.tile_at(*p) == kind:
+                        seen.add(p)
+                        group.append(p)
+                        stack.append(p)
+            groups.append(sorted(group))
+        return groups
+
+    def field(self, key: str) -> FlowField:
+        return self.fields[key]
+
+    def field_for_browse(self, tile: Tuple[int, int]) -> FlowField:
+        """Field toward the shelf group containing `tile`."""
+        ff = self._browse_field.get(tile)
+        return ff if ff is not None else self.field_to(tile)
+
+    def nearest_browse(self, y: int, x: int) -> Optional[FlowField]:
+        """The shelf group field with the shortest walk from (y, x), or None if no shelf is reachable."""
+        best, best_d = None, UNREACHABLE
+        for ff in self._browse_fields:
+            d = ff.steps_from(y, x)
+            if d != UNREACHABLE and (best is None or d < best_d):
+                best, best_d = ff, d
+        return best
+
+    def field_to(self, target: Tuple[int, int]) -> FlowField:
+        """Field toward an arbitrary tile, cached LRU."""
+        ff = self._adhoc.get(target)
+        if ff is not None:
+            self._adhoc.move_to_end(target)
+            return ff
+        goals = [target]
+        if not self.layout.passable(*target):
+            goals = [(target[0] + dy, target[1] + dx) for dy, dx in STEPS]
+        ff = FlowField(self.layout, goals, key=target)
+        self._adhoc[target] = ff
+        if len(self._adhoc) > self.cache_size:
+            _, dropped = self._adhoc.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(dropped)
+        return ff
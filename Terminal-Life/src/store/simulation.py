@@ -1,25 +1,109 @@
-import random
-from typing import List, Optional
+import time
+from typing import Dict, List, Optional
 from collections import deque
-from src.store.layout import StoreLayout
-from src.characters.cast import create_cast
+from src.store.layout import StoreLayout, REGISTER
+from src.characters.cast import create_cast, next_arrival
 from src.engine.state import Position
 from src.characters.character import Character
 from src.dialogue.dialogue_manager import DialogueManager
+from src.dialogue.batch_worker import PRIORITY_CHECKOUT
+from src.engine.spatial import SpatialHash
+from src.engine.scheduler import EventScheduler
+from src.store.pathfinding import UNREACHABLE, PathPlanner
+from src.store.checkout import CheckoutLane, CheckoutQueues
+from src.engine import soa
+from src.engine.rng import RandomStreams
 
 LOG_LIMIT = 400
+BOB_IDLE_EVERY = 20
+CONVERSE_EVERY = 7
+CHECKOUT_LINE_EVERY = 9
+CHECKOUT_DONE_EVERY = 15
+# metrics phase per world event kind
+EVENT_PHASES = {
+    'bob_idle': 'tick.movement',
+    'converse': 'tick.conversation',
+    'checkout_line': 'tick.checkout',
+    'checkout_done': 'tick.checkout',
+}
 
 class StoreSimulation:
-    def __init__(self, dialogue_mgr: DialogueManager):
-        self.layout = StoreLayout()
+    """Store state and per-tick behaviour.
+
+    engine='objects' (default) steps each Character in Python; engine='soa'
+    moves agent state into NumPy arrays (see src.engine.soa) and replaces
+    `characters` with array-backed views.
+
+    Anything that happens on a known future tick (offstage returns, wait
+    expiries, Bob's idle move, conversation attempts, checkout steps) is an
+    event on `scheduler`, so the per-tick loop only visits customers that are
+    actually walking.
+
+    All randomness comes from `streams` ('sim' for movement, spawning and
+    conversation choice, 'mood' for mood drift, 'soa' for the array engine),
+    so a seeded simulation is reproducible.
+
+    Checkout runs through `lanes` register lanes (see src.store.checkout);
+    `service_ticks` is one service time for all lanes or a list with one per
+    lane.
+    """
+
+    def __init__(self, dialogue_mgr: DialogueManager, engine: str = 'objects', streams: Optional[RandomStreams] = None,
+                 characters: Optional[List[Character]] = None, lanes: int = 1, service_ticks=CHECKOUT_DONE_EVERY,
+                 field_cache: int = 64):
+        self.streams = streams if streams is not None else RandomStreams()
+        self.rng = self.streams.stream('sim')
+        self.mood_rng = self.streams.stream('mood')
+        self.layout = StoreLayout(lanes=lanes)
+        self.planner = PathPlanner(self.layout, cache_size=field_cache)
         self.origin = (0, 0)
-        self.characters: List[Character] = create_cast(self.origin)
+        self.characters: List[Character] = characters if characters is not None else create_cast(self.origin)
+        self.engine = engine
+        self.soa: Optional[soa.SoAEngine] = None
+        if engine == 'soa':
+            self.soa = soa.SoAEngine(self.characters, self.planner, seed=self.streams.stream('soa').getrandbits(64))
+            self.characters = self.soa.views  # type: ignore[assignment]
+        elif engine != 'objects':
+            raise ValueError(f"unknown engine: {engine!r}")
         self.dialogue_mgr = dialogue_mgr
         self.logs = deque(maxlen=LOG_LIMIT)
+        self.total_logs = 0  # monotonically increasing; lets consumers spot new lines
         self.ticks = 0
         self.top_rows = self.layout.height
         self.total_cols = self.layout.width
-        self._queue: List[str] = []
+        # on-stage characters indexed by position; kept current by Character.move_to
+        self.spatial = SpatialHash()
+        for c in self.characters:
+            c.spatial = self.spatial
+            if c.active or c.is_owner:
+                self.spatial.update(c)
+        if self.soa is not None:
+            self.soa.spatial = self.spatial
+        self._by_name: Dict[str, Character] = {c.name: c for c in self.characters}
+        self._owner = next(c for c in self.characters if c.is_owner)
+        # objects engine bookkeeping: on-stage customers, and the subset that walks this tick
+        self._onstage: Dict[str, Character] = {}
+        self._awake: Dict[str, Character] = {}
+        self._sleeping: Dict[str, int] = {}  # name -> wake event handle
+        if isinstance(service_ticks, int):
+            service_ticks = [service_ticks] * lanes
+        self.checkout = CheckoutQueues(self.layout.checkout_lanes(), service_ticks,
+                                       place=self._place, on_serve=self._on_serve)
+        self.checkpoint = None  # optional AutoCheckpoint (src.engine.snapshot), called after each tick
+        self.metrics = None  # optional Metrics (src.engine.metrics): per-phase tick durations
+        self.prefetcher = None  # optional DialoguePrefetcher (src.dialogue.prefetch), run after each tick
+        self.scheduler = EventScheduler()
+        self.scheduler.schedule(BOB_IDLE_EVERY, 'bob_idle')
+        self.scheduler.schedule(CONVERSE_EVERY, 'converse')
+        if self.soa is None:
+            for c in self.characters:
+                if c.is_owner:
+                    continue
+                if c.active:
+                    self._onstage[c.name] = c
+                    self._awake[c.name] = c
+                elif c.return_tick is not None:
+                    self.scheduler.schedule(c.return_tick, 'return', c.name)
         self.add_log("Simulation started.")
 
     def set_bounds(self, top_rows, total_cols):
@@ -28,111 +112,264 @@ class StoreSimulation:
 
     def add_log(self, msg):
         self.logs.append(f"[{self.ticks:05d}] {msg}")
+        self.total_logs += 1
 
     def get_logs(self, max_lines):
         return list(self.logs)[-max_lines:]
 
-    def render_store(self, max_rows, max_cols):
+    def stats(self):
+        if self.soa is not None:
+            active = self.soa.onstage_count()
+        else:
+            active = len(self._onstage) + 1  # the owner never leaves
+        return {
+            'ticks': self.ticks,
+            'active': active,
+            'total': len(self.characters),
+            'queue': len(self.checkout),
+            'logs': self.total_logs,
+        }
+
+    def find(self, name: str) -> Optional[Character]:
+        return self._by_name.get(name)
+
+    def remaining_wait(self, c: Character) -> int:
+        """Ticks before `c` moves again; a sleeping customer's waiting_ticks is only reset when it wakes."""
+        handle = self._sleeping.get(c.name)
+        if handle is not None:
+            due = self.scheduler.due(handle)
+            if due is not None:
+                return max(0, due - self.ticks)
+        return c.waiting_ticks
+
+    def visible_characters(self, top: int, left: int, rows: int, cols: int) -> List[Character]:
+        """On-stage characters inside the window, found through the spatial index."""
+        return list(self._index().within(top, left, top + rows - 1, left + cols - 1))
+
+    def render_store(self, max_rows, max_cols, top=0, left=0):
+        """Plain-text view of the store window starting at (top, left)."""
         base = self.layout.render_lines()
-        area = [list(line[:max_cols].ljust(max_cols)) for line in base[:max_rows]]
-        for c in self.characters:
-            if 0 <= c.pos.y < len(area) and 0 <= c.pos.x < len(area[0]):
-                area[c.pos.y][c.pos.x] = c.symbol
+        area = [list(line[left:left + max_cols].ljust(max_cols)) for line in base[top:top + max_rows]]
+        if not area:
+            return []
+        for c in self.visible_characters(top, left, len(area), max_cols):
+            area[c.pos.y - top][c.pos.x - left] = c.symbol
         return ["".join(row) for row in area]
 
     def tick(self, force_conversation=False, verbose_llm=False):
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+            spent = {'tick.movement': 0.0, 'tick.conversation': 0.0, 'tick.checkout': 0.0}
         self.ticks += 1
-        for c in self.characters:
-            if c.is_owner:
-                continue
-            # handle offstage comeback
-            if not c.active and c.return_tick is not None and self.ticks >= c.return_tick:
-                self._spawn_customer(c)
-            if not c.active:
-                continue
-            if not c.path:
+        # agent events fire before movement (a returning customer walks this tick);
+        # world events fire after it, in scheduling order
+        world = []
+        for kind, payload in self.scheduler.pop_due(self.ticks):
+            if kind == 'return':
+                self._on_return(payload)
+            elif kind == 'wake':
+                self._on_wake(payload)
+            else:
+                world.append((kind, payload))
+        if self.soa is not None:
+            spawned, queued = self.soa.tick(self.ticks)
+            for i in spawned:
+                c = self.characters[i]
+                c.materialize()
+                self.add_log(f"{c.name} enters the store.")
+            for i in queued:
+                self.checkout.join(self.characters[i].name)
+        else:
+            self._tick_objects()
+        if metrics is not None:
+            mark = time.perf_counter()
+            spent['tick.movement'] = mark - started
+        conversed = False
+        for kind, payload in world:
+            if kind == 'bob_idle':
+                self._bob_idle_move(self._bob())
+                self.scheduler.schedule(self.ticks + BOB_IDLE_EVERY, 'bob_idle')
+            elif kind == 'converse':
+                self._attempt_conversations(verbose_llm=verbose_llm)
+                conversed = True
+                self.scheduler.schedule(self.ticks + CONVERSE_EVERY, 'converse')
+            elif kind == 'checkout_line':
+                self._on_checkout_line(payload)
+            elif kind == 'checkout_done':
+                self._on_checkout_done(payload)
+            if metrics is not None:
+                now = time.perf_counter()
+                spent[EVENT_PHASES.get(kind, 'tick.movement')] += now - mark
+                mark = now
+        if force_conversation and not conversed:
+            self._attempt_conversations(verbose_llm=verbose_llm)
+            if metrics is not None:
+                spent['tick.conversation'] += time.perf_counter() - mark
+        if self.prefetcher is not None:
+            if metrics is not None:
+                mark = time.perf_counter()
+            self.prefetcher.maybe_run(self)
+            if metrics is not None:
+                spent['tick.prefetch'] = time.perf_counter() - mark
+        if self.checkpoint is not None:
+            self.checkpoint.maybe_save(self)
+        if metrics is not None:
+            now = time.perf_counter()
+            for phase, seconds in spent.items():
+                metrics.record(phase, seconds)
+            metrics.record('tick', now - started)
+
+    # ----------------- snapshot support -----------------
+    def runtime_state(self) -> dict:
+        """Tick counter, logs, queue and pending events (everything not stored on characters)."""
+        return {
+            'ticks': self.ticks,
+            'logs': list(self.logs),
+            'total_logs': self.total_logs,
+            'checkout': self.checkout.export(),
+            'events': self.scheduler.pending(),
+            'rng': self.streams.getstate(),
+            'soa_rng': self.soa.rng.bit_generator.state if self.soa is not None else None,
+            # iteration order drives rng draw order, so it is saved rather than rebuilt
+            'onstage': list(self._onstage),
+            'awake': list(self._awake),
+        }
+
+    def restore_runtime(self, state: dict):
+        """Inverse of runtime_state(); characters must already hold their restored state."""
+        self.ticks = state['ticks']
+        self.logs.clear()
+        self.logs.extend(state['logs'])
+        self.total_logs = state['total_logs']
+        self.checkout.restore(state['checkout'])
+        self.streams.setstate(state['rng'])
+        if self.soa is not None and state.get('soa_rng') is not None:
+            self.soa.rng.bit_generator.state = state['soa_rng']
+        self.scheduler = EventScheduler()
+        self._sleeping.clear()
+        for at, kind, payload in state['events']:
+            handle = self.scheduler.schedule(at, kind, payload)
+            if kind == 'wake':
+                self._sleeping[payload] = handle
+        if self.soa is None:
+            self._onstage = {name: self._by_name[name] for name in state['onstage']}
+            self._awake = {name: self._by_name[name] for name in state['awake']}
+
+    def _tick_objects(self):
+        for c in list(self._awake.values()):
+            if not c.has_route:
+                if c.target_kind == 'register':
+                    # reached the queue; the checkout lanes move it from here on
+                    del self._awake[c.name]
+                    self.checkout.join(c.name)
+                    continue
                 self._maybe_assign_path(c)
+            if c.waiting_ticks > 0:
+                self._sleep(c)
+                continue
             c.step()
-            c.update_mood()
-        bob = self._bob()
-        if self.ticks % 20 == 0:
-            self._bob_idle_move(bob)
-        if self.ticks % 7 == 0 or force_conversation:
-            self._attempt_conversations(verbose_llm=verbose_llm)
-        self._update_queue()
+        for c in self._onstage.values():
+            c.update_mood(self.mood_rng)
+
+    def _sleep(self, c: Character):
+        """Park a waiting customer until its wait is over instead of counting down every tick."""
+        del self._awake[c.name]
+        self._sleeping[c.name] = self.scheduler.schedule(self.ticks + c.waiting_ticks, 'wake', c.name)
+
+    def _on_wake(self, name: str):
+        if self._sleeping.pop(name, None) is None:
+            return
+        c = self._by_name[name]
+        c.waiting_ticks = 0
+        self._awake[name] = c
+
+    def _on_return(self, name: str):
+        c = self._by_name[name]
+        if c.active:
+            return
+        self._spawn_customer(c)
+
+    def _schedule_aligned(self, every: int, kind: str, payload):
+        """Schedule on the next tick that is a multiple of `every` (this one included)."""
+        at = -(-self.ticks // every) * every
+        if at == self.ticks:
+            at += every
+            self._dispatch_now(kind, payload)
+        self.scheduler.schedule(at, kind, payload)
+
+    def _dispatch_now(self, kind: str, payload):
+        if kind == 'checkout_line':
+            self._on_checkout_line(payload, reschedule=False)
+
+    def _index(self) -> SpatialHash:
+        """The spatial index, brought up to date with batched (SoA) movement."""
+        if self.soa is not None:
+            self.soa.sync_spatial()
+        return self.spatial
 
     def _bob(self):
-        return next(c for c in self.characters if c.is_owner)
+        return self._owner
 
     def _bob_idle_move(self, bob: Character):
         # Keep Bob constrained to register area small jitter
-        register_tiles = self.layout.register_positions()
-        if not register_tiles:
+        bounds = self.layout.zone_bounds(REGISTER)
+        if bounds is None:
             return
-        miny = min(y for y, _ in register_tiles)
-        maxy = max(y for y, _ in register_tiles)
-        minx = min(x for _, x in register_tiles)
-        maxx = max(x for _, x in register_tiles)
+        miny, minx, maxy, maxx = bounds
         choices = [(0,0),(0,1),(0,-1),(1,0),(-1,0)]
-        random.shuffle(choices)
+        self.rng.shuffle(choices)
         for dy, dx in choices:
             ny, nx = bob.pos.y + dy, bob.pos.x + dx
             if miny <= ny <= maxy and minx <= nx <= maxx:
-                bob.pos.y, bob.pos.x = ny, nx
+                bob.move_to(ny, nx)
                 break
 
     def _maybe_assign_path(self, c: Character):
         if c.target_kind == 'register':
             return
-        if random.random() < 0.15:
+        if c.basket >= 0:
+            # generated customers shop their basket, then check out
+            if c.basket == 0:
+                self._assign_queue_path(c)
+            else:
+                c.basket -= 1
+                self._assign_shelf_path(c)
+        elif self.rng.random() < 0.15:
             self._assign_queue_path(c)
         else:
             self._assign_shelf_path(c)
 
     def _assign_shelf_path(self, c: Character):
         shelf_positions = self.layout.shelf_positions()
-        tgt = random.choice(shelf_positions)
-        path = self._straight_path(c.pos, Position(*tgt))
-        c.set_path(path, 'shelf')
-        c.waiting_ticks = random.randint(1, 4)
+        tgt = self.rng.choice(shelf_positions)
+        flow = self.planner.field_for_browse(tgt)
+        if flow.steps_from(c.pos.y, c.pos.x) == UNREACHABLE:
+            # walled off from that shelf: browse the closest one instead, or give up and check out
+            flow = self.planner.nearest_browse(c.pos.y, c.pos.x)
+            if flow is None:
+                self._assign_queue_path(c)
+                return
+        c.follow(flow, 'shelf')
+        c.waiting_ticks = self.rng.randint(1, 4)
 
     def _assign_queue_path(self, c: Character):
-        qy, qx = self.layout.queue_entry()
-        path = self._straight_path(c.pos, Position(qy, qx))
-        c.set_path(path, 'register')
-
-    def _straight_path(self, start: Position, end: Position):
-        path = []
-        y, x = start.y, start.x
-        dy = 1 if end.y > y else -1
-        dx = 1 if end.x > x else -1
-        while x != end.x:
-            x += dx
-            if self.layout.passable(y, x):
-                path.append(Position(y, x))
-        while y != end.y:
-            y += dy
-            if self.layout.passable(y, x):
-                path.append(Position(y, x))
-        return path
+        c.follow(self.planner.field('queue'), 'register')
 
     def _attempt_conversations(self, verbose_llm=False):
-        active_chars = [c for c in self.characters if (c.is_owner or c.active)]
-        pairs = []
-        for i, a in enumerate(active_chars):
-            for b in active_chars[i+1:]:
-                if abs(a.pos.y - b.pos.y) <= 1 and abs(a.pos.x - b.pos.x) <= 1:
-                    pairs.append((a, b))
-        if not pairs:
+        index = self._index()
+        pair = index.random_pair(self.rng)
+        if pair is None:
             return
-        a, b = random.choice(pairs)
-        speaker, listener = (a, b) if random.random() < 0.5 else (b, a)
-        situational = self._situational_context(speaker, listener)
-        active_names = [c.name for c in active_chars]
-        line = self.dialogue_mgr.generate_line(speaker, listener, situational, verbose=verbose_llm, tick=self.ticks, active_names=active_names)
+        a, b = pair
+        speaker, listener = (a, b) if self.rng.random() < 0.5 else (b, a)
+        if self.dialogue_mgr.next_speaker(a, b) == listener.name:
+            speaker, listener = listener, speaker  # follow the buffered exchange
+        situational = self.situational_context(speaker, listener)
+        line = self.dialogue_mgr.generate_line(speaker, listener, situational, verbose=verbose_llm, tick=self.ticks)
         self.add_log(f"{speaker.name}->{listener.name}: {line}")
 
-    def _situational_context(self, a: Character, b: Character):
+    def situational_context(self, a: Character, b: Character):
         tile_a = self._tile_at(a.pos)
         tile_b = self._tile_at(b.pos)
         focused = {tile_a, tile_b}
@@ -150,7 +387,7 @@ class StoreSimulation:
             return "at the coffee station"
         if 'm' in focused:
             return "near the magazine rack"
-        if 'R' in focused:
+        if 'R' in focused or 'r' in focused:
             return "near the register"
         if ':' in focused:
             return "standing in the checkout line"
@@ -159,48 +396,55 @@ class StoreSimulation:
         return "inside the general aisles"
 
     def _tile_at(self, pos: Position):
-        if self.layout.in_bounds(pos.y, pos.x):
-            return self.layout.grid[pos.y][pos.x]
-        return ' '
+        return self.layout.tile_at(pos.y, pos.x)
 
-    def _update_queue(self):
-        qy, qx = self.layout.queue_entry()
-        queue_chars = []
-        for c in self.characters:
-            if c.is_owner:
-                continue
-            if c.target_kind == 'register':
-                if c.pos.x == qx:
-                    queue_chars.append(c)
-        queue_chars.sort(key=lambda cc: cc.pos.y)
-        self._queue = [c.name for c in queue_chars]
-        register_positions = self.layout.register_positions()
-        if not register_positions:
+    # ----------------- checkout -----------------
+    def _place(self, name: str, y: int, x: int):
+        self._by_name[name].move_to(y, x)
+
+    def _on_serve(self, lane: CheckoutLane, name: str):
+        """`name` stepped up to the till of `lane`: start its checkout."""
+        self._schedule_aligned(CHECKOUT_LINE_EVERY, 'checkout_line', name)
+        self.scheduler.schedule(self.ticks + lane.service_ticks, 'checkout_done', name)
+
+    def _on_checkout_line(self, name: str, reschedule: bool = True):
+        if not self.checkout.is_serving(name):
             return
-        front_reg = min(register_positions)
-        bob = self._bob()
-        if queue_chars:
-            first = queue_chars[0]
-            if first.pos.y > front_reg[0] + 1:
-                ny = first.pos.y - 1
-                if self.layout.passable(ny, first.pos.x):
-                    first.pos.y = ny
-            else:
-                if self.ticks % 9 == 0:
-                    situ = "completing a purchase"
-                    active_names = [cc.name for cc in self.characters if cc.is_owner or cc.active]
-                    line = self.dialogue_mgr.generate_line(bob, first, situ, tick=self.ticks, active_names=active_names)
-                    self.add_log(f"{bob.name}->{first.name}: {line}")
-                if self.ticks % 15 == 0:
-                    self.add_log(f"{first.name} leaves after checkout.")
-                    self._offstage_customer(first)
+        speaker, listener = self._bob(), self._by_name[name]
+        if self.dialogue_mgr.next_speaker(speaker, listener) == listener.name:
+            speaker, listener = listener, speaker
+        situ = "completing a purchase"
+        line = self.dialogue_mgr.generate_line(speaker, listener, situ, tick=self.ticks, priority=PRIORITY_CHECKOUT)
+        self.add_log(f"{speaker.name}->{listener.name}: {line}")
+        if reschedule:
+            self.scheduler.schedule(self.ticks + CHECKOUT_LINE_EVERY, 'checkout_line', name)
+
+    def _on_checkout_done(self, name: str):
+        if not self.checkout.is_serving(name):
+            return
+        first = self._by_name[name]
+        self.add_log(f"{first.name} leaves after checkout.")
+        self._offstage_customer(first)
 
     # Offstage / spawn logic
     def _offstage_customer(self, c: Character):
         c.active = False
-        c.return_tick = self.ticks + random.randint(80, 260)  # several minutes sim time
-        c.path = []
+        self.spatial.remove(c)
+        if c.persona is not None:
+            c.return_tick = next_arrival(c.persona, self.ticks, self.rng)
+        else:
+            c.return_tick = self.ticks + self.rng.randint(80, 260)  # several minutes sim time
+        c.clear_route()
         c.target_kind = None
+        c.release()
+        self.checkout.leave(c.name)
+        if self.soa is None:
+            self._onstage.pop(c.name, None)
+            self._awake.pop(c.name, None)
+            handle = self._sleeping.pop(c.name, None)
+            if handle is not None:
+                self.scheduler.cancel(handle)
+            self.scheduler.schedule(c.return_tick, 'return', c.name)
         self.add_log(f"{c.name} exits (will return later).")
         # drop any conversation threads involving this character
         self.dialogue_mgr.drop_threads_involving(c.name)
@@ -208,13 +452,19 @@ class StoreSimulation:
     def _spawn_customer(self, c: Character):
         c.active = True
         c.return_tick = None
+        c.materialize()
+        if c.persona is not None:
+            c.basket = self.rng.randint(*c.persona.basket_size)
         # spawn at door (or fallback to lower area)
         door = getattr(self.layout, 'door_position', None)
         if door:
             dy, dx = self.layout.door_position()
-            c.pos.y, c.pos.x = dy, dx
+            c.move_to(dy, dx)
         else:
-            c.pos.y = random.randint(self.layout.height//2, self.layout.height-3)
-            c.pos.x = random.randint(2, self.layout.width-3)
-        c.waiting_ticks = random.randint(1, 4)
+            c.move_to(self.rng.randint(self.layout.height//2, self.layout.height-3),
+                      self.rng.randint(2, self.layout.width-3))
+        self.spatial.update(c)
+        c.waiting_ticks = self.rng.randint(1, 4)
+        self._onstage[c.name] = c
+        self._awake[c.name] = c
         self.add_log(f"{c.name} enters the store.")
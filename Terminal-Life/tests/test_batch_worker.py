@@ -0,0 +1,265 @@
+import threading
+import time
+
+from src.dialogue.batch_worker import (
+    PRIORITY_ADJACENT, PRIORITY_CHECKOUT, PRIORITY_SPECULATIVE, DialogueBatchWorker, LineAssembler, _BatchJob,
+    exchange_turn, pack_prompt,
+)
+from src.engine.metrics import Metrics
+
+
+# ----------------- LineAssembler -----------------
+def test_assembler_joins_lines_split_across_chunks():
+    a = LineAssembler(limit=5)
+    assert a.feed("1. Hello th") == []
+    assert a.feed("ere.\n2. Nice ") == ["Hello there."]
+    assert a.feed("day.\n\n\"Quoted\"\n- Bullet\n") == ["Nice day.", "Quoted", "Bullet"]
+    assert a.finish() == []
+
+
+def test_assembler_flushes_tail_and_honours_limit():
+    a = LineAssembler(limit=2)
+    assert a.feed("one\ntwo\nthree\n") == ["one", "two"]
+    assert a.feed("four\n") == []
+    assert a.emitted == 2
+    b = LineAssembler(limit=3)
+    b.feed("first\nsecond")
+    assert b.finish() == ["second"]
+
+
+# ----------------- _BatchJob.route -----------------
+def _payload(a, b, speakers=False, count=3):
+    p = {'system': 'pair', 'pack_system': 'base', 'prompt': 'p', 'count': count,
+         'pair_block': f"Speaker: {a}, talking to {b}"}
+    if speakers:
+        p['speakers'] = [a, b]
+    return p
+
+
+def test_route_fans_tagged_lines_out_to_pairs():
+    job = _BatchJob([(('A', 'B'), _payload('A', 'B'), 1), (('C', 'D'), _payload('C', 'D', count=1), 1)], 5)
+    assert job.packed
+    routed = job.route(["[P1] one", "P2: two", "[P2] extra", "[P3] out of range", "untagged", "[P1] 1. three"])
+    assert routed == {('A', 'B'): ["one", "three"], ('C', 'D'): ["two"]}
+
+
+def test_packed_prompt_keeps_rules_in_the_static_system_message():
+    items = [(('A', 'B'), _payload('A', 'B', speakers=True), 1), (('C', 'D'), _payload('C', 'D', speakers=True), 1)]
+    job = _BatchJob(items, 5)
+    assert job.system.startswith('base\n\n')
+    assert '[P1]' in job.messages[0]['content'] and '[P2]' in job.messages[0]['content']
+    assert job.system == _BatchJob(list(reversed(items)), 5).system
+    assert pack_prompt([p for _, p, _ in items]).endswith("Write 3 turns for each of these 2 conversations.")
+
+
+def test_pack_prompt_tags_every_pair():
+    prompt = pack_prompt([_payload('A', 'B'), _payload('C', 'D', count=5)])
+    assert "[P1]\nSpeaker: A, talking to B" in prompt and "[P2]\nSpeaker: C, talking to D" in prompt
+    assert prompt.endswith("Write 5 lines for each of these 2 conversations.")
+
+
+def test_route_normalises_exchange_turns():
+    job = _BatchJob([(('Alice', 'Ben'), _payload('Alice', 'Ben', speakers=True, count=4), 1)], 5)
+    routed = job.route(['**alice:** "Hi there."', "Ben: Hey.", "Narrator: no.", "no label"])
+    assert routed == {('Alice', 'Ben'): ["Alice: Hi there.", "Ben: Hey."]}
+
+
+def test_exchange_turn_rejects_other_speakers():
+    assert exchange_turn("Cara: hello", ["Alice", "Ben"]) == ''
+    assert exchange_turn("BEN:  fine.", ["Alice", "Ben"]) == "Ben: fine."
+
+
+# ----------------- worker -----------------
+class _StreamingClient:
+    """Streams `chunks`, noting how full the pair's buffer was after each one."""
+
+    def __init__(self, chunks, key):
+        self.chunks = chunks
+        self.key = key
+        self.worker = None
+        self.seen = []
+
+    def is_available(self):
+        return True
+
+    def stream(self, system, messages, **kw):
+        for chunk in self.chunks:
+            yield chunk
+            self.seen.append(self.worker.size(self.key))
+
+
+def test_streamed_lines_reach_the_buffer_as_they_complete():
+    key = ('Alice', 'Ben')
+    client = _StreamingClient(["1. Hel", "lo.\n2. Th", "ere.\n3. Bye"], key)
+    w = client.worker = DialogueBatchWorker(client, threading.Event(), inline=True)
+    w.enqueue(key, {'system': 's', 'prompt': 'p', 'count': 3})
+    assert client.seen == [0, 1, 2]
+    assert [w.pop(key) for _ in range(3)] == ["Hello.", "There.", "Bye"]
+
+
+class _GatedClient:
+    """Answers requests one at a time, holding each until `gate` is set."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.prompts = []
+        self.reply = lambda prompt: "a line."
+
+    def is_available(self):
+        return True
+
+    def generate(self, system, messages, timeout=6, **kw):
+        self.prompts.append(messages[0]['content'])
+        self.started.set()
+        if not self.gate.wait(min(timeout, 5)):
+            return None  # gave up, as a real client does at its timeout
+        return self.reply(messages[0]['content'])
+
+
+def _wait_idle(w):
+    for _ in range(500):
+        if not w.pending():
+            return
+        time.sleep(0.01)
+    raise AssertionError("worker did not drain")
+
+
+def test_pending_requests_coalesce_and_run_by_priority():
+    client = _GatedClient()
+    stop = threading.Event()
+    w = DialogueBatchWorker(client, stop)
+    try:
+        def ask(a, b, priority=PRIORITY_ADJACENT):
+            return w.enqueue((a, b), {'system': 's', 'prompt': a + b, 'count': 1}, priority)
+
+        assert ask('A', 'B')
+        assert client.started.wait(5)  # A-B is now in flight
+        assert ask('C', 'D', PRIORITY_SPECULATIVE)
+        assert ask('E', 'F')
+        assert ask('G', 'H', PRIORITY_CHECKOUT)
+        assert ask('I', 'Zed')
+        # duplicates reuse the pending request; C-D moves up behind E-F
+        assert not ask('A', 'B')
+        assert not ask('C', 'D')
+        w.drop_involving('Zed')
+        client.gate.set()
+        _wait_idle(w)
+        assert client.prompts == ['AB', 'GH', 'EF', 'CD']
+        assert w.size(('C', 'D')) == 1 and w.size(('I', 'Zed')) == 0
+    finally:
+        stop.set()
+
+
+def test_waiting_requests_are_packed_into_one_call():
+    client = _GatedClient()
+    client.reply = lambda prompt: "[P1] one.\n[P2] two." if '[P2]' in prompt else "solo."
+    stop = threading.Event()
+    w = DialogueBatchWorker(client, stop, pack_pairs=4, stream=False)
+    try:
+        w.enqueue(('A', 'B'), _payload('A', 'B', count=1))
+        assert client.started.wait(5)
+        w.enqueue(('C', 'D'), _payload('C', 'D', count=1))
+        w.enqueue(('E', 'F'), _payload('E', 'F', count=1))
+        client.gate.set()
+        _wait_idle(w)
+        assert len(client.prompts) == 2
+        assert [w.pop(k) for k in (('A', 'B'), ('C', 'D'), ('E', 'F'))] == ["solo.", "one.", "two."]
+    finally:
+        stop.set()
+
+
+def test_queued_requests_past_their_deadline_expire():
+    client = _GatedClient()
+    stop = threading.Event()
+    metrics = Metrics()
+    w = DialogueBatchWorker(client, stop, metrics=metrics)
+    try:
+        w.enqueue(('A', 'B'), {'system': 's', 'prompt': 'AB', 'count': 1})
+        assert client.started.wait(5)
+        w.enqueue(('C', 'D'), {'system': 's', 'prompt': 'CD', 'count': 1, 'deadline': time.monotonic() + 0.05})
+        time.sleep(0.1)
+        client.gate.set()
+        _wait_idle(w)
+        assert client.prompts == ['AB']
+        assert metrics.counters['llm.expired'] == 1
+        assert w.size(('C', 'D')) == 0
+    finally:
+        stop.set()
+
+
+def test_late_completion_still_fills_the_buffer():
+    client = _GatedClient()
+    stop = threading.Event()
+    metrics = Metrics()
+    w = DialogueBatchWorker(client, stop, metrics=metrics, stream=False)
+    try:
+        w.enqueue(('A', 'B'), {'system': 's', 'prompt': 'AB', 'count': 1, 'deadline': time.monotonic() + 0.05})
+        assert client.started.wait(5)
+        time.sleep(0.1)  # the server answers after the deadline
+        client.gate.set()
+        _wait_idle(w)
+        assert w.pop(('A', 'B')) == "a line."
+        assert metrics.counters['llm.late'] == 1 and 'llm.expired' not in metrics.counters
+    finally:
+        stop.set()
+
+
+class _ScriptedClient:
+    """Answers every request with `reply`; generate() runs inline."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def is_available(self):
+        return True
+
+    def generate(self, system, messages, **kw):
+        self.requests.append(messages[0]['content'])
+        return self.reply(messages[0]['content']) if callable(self.reply) else self.reply
+
+
+def test_inline_worker_fills_buffer_and_drop_clears_it():
+    w = DialogueBatchWorker(_ScriptedClient("one.\ntwo.\n"), threading.Event(), inline=True, stream=False)
+    w.enqueue(('Alice', 'Ben'), _payload('Alice', 'Ben'))
+    assert w.size(('Alice', 'Ben')) == 2
+    w.drop_involving('Ben')
+    assert w.size(('Alice', 'Ben')) == 0
+    assert not w.is_pending(('Alice', 'Ben'))
+
+
+def test_lines_for_a_dropped_pair_are_discarded():
+    w = DialogueBatchWorker(_ScriptedClient(None), threading.Event(), inline=True)
+    key = ('Alice', 'Ben')
+    job = _BatchJob([(key, _payload('Alice', 'Ben'), 1)], 5)
+    w._inflight[key] = None
+    w._push(job, ["first."])
+    w.drop_involving('Alice')
+    w._push(job, ["late."])
+    assert w.size(key) == 0
+
+
+def test_packed_retry_gets_a_fresh_deadline():
+    client = _ScriptedClient(lambda prompt: "[P1] only the first pair.")
+    stop = threading.Event()
+    w = DialogueBatchWorker(client, stop, pack_pairs=4, stream=False)
+    try:
+        # long enough for both to queue behind the first dispatch, short enough to lapse during it
+        deadline = time.monotonic() + 0.3
+        items = [(k, dict(_payload(*k), deadline=deadline), 1) for k in (('A', 'B'), ('C', 'D'))]
+        for key, _, _ in items:
+            w._inflight[key] = None
+        job = _BatchJob(items, 0.3)
+        time.sleep(0.35)
+        w._complete(job, "[P1] only the first pair.")
+        for _ in range(100):
+            if w.size(('C', 'D')):
+                break
+            time.sleep(0.01)
+        assert w.pop(('A', 'B')) == "only the first pair."
+        # retried on its own (not expired) and answered by the scripted client
+        assert len(client.requests) == 1
+        assert w.size(('C', 'D')) == 1
+    finally:
+        stop.set()
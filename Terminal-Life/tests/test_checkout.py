@@ -0,0 +1,60 @@
+import pytest
+
+from src.store.checkout import CheckoutQueues
+
+LANES = [[(10, 5), (10, 6), (10, 7)], [(12, 5), (12, 6), (12, 7)]]
+
+
+def _queues(service=(15, 15)):
+    placed, served = {}, []
+    q = CheckoutQueues(LANES, list(service), place=lambda name, y, x: placed.__setitem__(name, (y, x)),
+                       on_serve=lambda lane, name: served.append((lane.index, name)))
+    return q, placed, served
+
+
+def test_join_picks_the_shortest_lane():
+    q, placed, served = _queues()
+    for name in 'abcde':
+        q.join(name)
+    assert [lane.index for lane in map(q.lane_of, 'abcde')] == [0, 1, 0, 1, 0]
+    assert served == [(0, 'a'), (1, 'b')]
+    assert q.is_serving('a') and not q.is_serving('c')
+    assert placed['a'] == (10, 5) and placed['c'] == (10, 6)
+    # past the last slot, customers wait on it
+    assert placed['e'] == (10, 7)
+    assert q.names() == ['a', 'c', 'e', 'b', 'd']
+    assert q.join('c') is q.lane_of('c') and len(q) == 5
+
+
+def test_leave_advances_the_lane():
+    q, placed, served = _queues()
+    for name in 'abcdefg':
+        q.join(name)
+    q.leave('a')
+    assert served[-1] == (0, 'c')
+    assert placed['c'] == (10, 5) and placed['e'] == (10, 6) and placed['g'] == (10, 7)
+    q.leave('e')
+    assert placed['g'] == (10, 6)
+    assert q.leave('nobody') is None
+    assert q.names() == ['c', 'g', 'b', 'd', 'f']
+    assert 'e' not in q
+
+
+def test_export_restore_round_trip():
+    q, _, _ = _queues()
+    for name in 'abcde':
+        q.join(name)
+    state = q.export()
+    assert state == [['a', ['c', 'e']], ['b', ['d']]]
+    fresh, _, served = _queues()
+    fresh.restore(state)
+    assert fresh.names() == q.names()
+    assert fresh.is_serving('b') and fresh.lane_of('e').index == 0
+    assert served == []
+    with pytest.raises(ValueError):
+        fresh.restore(state[:1])
+
+
+def test_needs_one_service_time_per_lane():
+    with pytest.raises(ValueError):
+        _queues(service=(15,))
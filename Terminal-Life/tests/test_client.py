@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.lm_integration import client as client_mod
+from src.lm_integration.client import START_TIMEOUT, AsyncLocalLLMClient
+
+
+def _response(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+class _FakeAsyncOpenAI:
+    """Stands in for openai.AsyncOpenAI; each completion takes `delay` seconds."""
+
+    delay = 0.05
+    instances = []
+
+    def __init__(self, base_url, api_key):
+        self.chat = SimpleNamespace(completions=self)
+        self.active = 0
+        self.peak = 0
+        self.closed = False
+        _FakeAsyncOpenAI.instances.append(self)
+
+    async def create(self, messages, **kw):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return _response(f" re: {messages[-1]['content']} ")
+
+    async def close(self):
+        self.closed = True
+
+
+class _BrokenAsyncOpenAI:
+    def __init__(self, base_url, api_key):
+        raise RuntimeError("no server config")
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    _FakeAsyncOpenAI.instances.clear()
+    monkeypatch.setattr(client_mod, 'AsyncOpenAI', _FakeAsyncOpenAI)
+    return _FakeAsyncOpenAI
+
+
+def _ask(text):
+    return [{"role": "user", "content": text}]
+
+
+def test_semaphore_caps_requests_in_flight(fake_openai):
+    c = AsyncLocalLLMClient(max_concurrency=2)
+    try:
+        futures = [c.submit('s', _ask(str(i))) for i in range(6)]
+        assert [f.result(timeout=5) for f in futures] == [f"re: {i}" for i in range(6)]
+        assert fake_openai.instances[0].peak == 2
+    finally:
+        c.close()
+
+
+def test_submit_callback_gets_the_completion(fake_openai):
+    c = AsyncLocalLLMClient(max_concurrency=1)
+    got = []
+    done = threading.Event()
+    try:
+        c.submit('s', _ask('hello'), callback=lambda text: (got.append(text), done.set()))
+        assert done.wait(5)
+        assert got == ["re: hello"]
+        assert c.generate('s', _ask('again')) == "re: again"
+    finally:
+        c.close()
+
+
+def test_constructor_failure_disables_the_client(monkeypatch):
+    monkeypatch.setattr(client_mod, 'AsyncOpenAI', _BrokenAsyncOpenAI)
+    started = time.perf_counter()
+    c = AsyncLocalLLMClient()
+    assert time.perf_counter() - started < START_TIMEOUT
+    assert not c.enabled and not c.is_available()
+    assert c.generate('s', _ask('x')) is None
+    got = []
+    c.submit('s', _ask('x'), callback=got.append)
+    assert got == [None]
+    c.close()
+
+
+def test_close_stops_the_loop_thread(fake_openai):
+    c = AsyncLocalLLMClient(max_concurrency=1)
+    thread = c._thread
+    pending = c.submit('s', _ask('slow'), timeout=30)
+    c.close()
+    assert not thread.is_alive()
+    assert pending.done()
+    assert fake_openai.instances[0].closed
+    assert not c.enabled
@@ -0,0 +1,64 @@
+import io
+
+import pytest
+
+from src.headless import run
+from src.engine import soa
+from src.lm_integration.recording import RecordingClient, ReplayClient
+
+
+def _logs(**kw) -> list:
+    out = io.StringIO()
+    run(print_logs=True, out=out, **kw)
+    return [line for line in out.getvalue().splitlines() if not line.startswith("done:")]
+
+
+def test_same_seed_same_logs():
+    a = _logs(ticks=1500, seed=11)
+    b = _logs(ticks=1500, seed=11)
+    assert a and a == b
+
+
+def test_different_seed_different_logs():
+    assert _logs(ticks=1500, seed=11) != _logs(ticks=1500, seed=12)
+
+
+def test_generated_cast_and_lanes_are_reproducible():
+    kw = dict(ticks=1000, seed=5, customers=40, lanes=2, service_ticks=[10, 20])
+    assert _logs(**kw) == _logs(**kw)
+
+
+@pytest.mark.skipif(not soa.available(), reason="numpy not installed")
+def test_soa_engine_is_reproducible():
+    kw = dict(ticks=1000, seed=5, engine='soa', customers=40)
+    assert _logs(**kw) == _logs(**kw)
+
+
+class _CountingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def is_available(self):
+        return True
+
+    def generate(self, system, messages, max_tokens=60, temperature=0.8, timeout=6):
+        self.calls += 1
+        return f"reply {self.calls}"
+
+
+def test_replay_serves_recorded_responses_in_order(tmp_path):
+    path = str(tmp_path / 'llm.jsonl')
+    rec = RecordingClient(_CountingClient(), path)
+    msgs = [{'role': 'user', 'content': 'hi'}]
+    assert [rec.generate('sys', msgs) for _ in range(2)] == ["reply 1", "reply 2"]
+    assert rec.generate('sys', [{'role': 'user', 'content': 'other'}]) == "reply 3"
+    rec.close()
+
+    replay = ReplayClient(path)
+    assert replay.is_available()
+    assert replay.generate('sys', msgs) == "reply 1"
+    assert replay.generate('sys', msgs) == "reply 2"
+    assert replay.generate('sys', msgs) is None
+    # temperature is part of the request key
+    assert replay.generate('sys', [{'role': 'user', 'content': 'other'}], temperature=0.2) is None
+    assert replay.misses == 2
@@ -0,0 +1,45 @@
+import threading
+
+from src.characters.character import Character
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.metrics import Metrics
+from src.engine.rng import RandomStreams
+from src.engine.state import Position
+from src.lm_integration.client import fallback_line
+
+
+class _SlowClient:
+    """Holds every generate() call until `gate` is set, noting the calling thread."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.callers = []
+
+    def is_available(self):
+        return True
+
+    def generate(self, system, messages, **kw):
+        self.callers.append(threading.current_thread())
+        self.gate.wait(5)
+        return "Alice: Hello.\nBen: Hi."
+
+    def fallback(self, speaker, listener, context, rng=None):
+        return fallback_line(speaker, listener, context, rng=rng)
+
+
+def test_nonblocking_miss_returns_a_template_without_calling_the_llm():
+    client = _SlowClient()
+    metrics = Metrics()
+    mgr = DialogueManager(client=client, rng=RandomStreams(4).stream('dialogue'), nonblocking=True,
+                          stream_batches=False, metrics=metrics)
+    try:
+        alice, ben = Character('Alice', Position(1, 1)), Character('Ben', Position(1, 2))
+        line = mgr.generate_line(alice, ben, "in the produce section", tick=1)
+        assert line
+        # the only LLM call is the batch on the worker thread, still waiting on the server
+        assert threading.main_thread() not in client.callers
+        assert mgr.batch_worker.is_pending(('Alice', 'Ben'))
+        assert metrics.counters['lines.fallback'] == 1
+    finally:
+        client.gate.set()
+        mgr.shutdown()
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from src.dialogue.line_cache import LineCache
+
+KEY = ('Alice', 'Ben', 'snack brands', 'shelf')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = LineCache(str(tmp_path / 'lines.sqlite3'), no_repeat=2)
+    yield c
+    c.close()
+
+
+def test_take_matches_the_whole_key(cache):
+    cache.put(*KEY, ['hi.', 'hey.'])
+    assert cache.take('Ben', 'Alice', 'snack brands', 'shelf') is None
+    assert cache.take(*KEY, exchange=True) is None
+    assert cache.take(*KEY) == ['hi.', 'hey.']
+
+
+def test_no_repeat_window(cache):
+    for n in range(3):
+        cache.put(*KEY, [f'batch {n}'])
+    served = [cache.take(*KEY)[0] for _ in range(3)]
+    assert served == ['batch 0', 'batch 1', 'batch 2']
+    # the last two served are held back, so the oldest comes round again
+    assert cache.take(*KEY) == ['batch 0']
+
+
+def test_no_repeat_window_blocks_small_pools(cache):
+    cache.put(*KEY, ['only one'])
+    assert cache.take(*KEY) == ['only one']
+    assert cache.take(*KEY) is None
+
+
+def test_ttl(tmp_path):
+    c = LineCache(str(tmp_path / 'ttl.sqlite3'), ttl_seconds=0.05)
+    c.put(*KEY, ['soon stale.'])
+    time.sleep(0.1)
+    assert c.take(*KEY) is None
+    c.prune()
+    assert len(c) == 0
+    c.close()
+
+
+def test_prune_keeps_new_batches_over_stale_served_ones(tmp_path):
+    c = LineCache(str(tmp_path / 'lru.sqlite3'), max_rows=2)
+    c.put(*KEY, ['old'])
+    assert c.take(*KEY) == ['old']
+    time.sleep(0.01)
+    c.put(*KEY, ['new 1'])
+    time.sleep(0.01)
+    c.put(*KEY, ['new 2'])
+    c.prune()
+    assert len(c) == 2
+    assert sorted(c.take(*KEY) for _ in range(2)) == [['new 1'], ['new 2']]
+    c.close()
+
+
+def test_persists_across_reopen(tmp_path):
+    path = str(tmp_path / 'keep.sqlite3')
+    c = LineCache(path)
+    c.put(*KEY, ['still here.'], exchange=True)
+    c.close()
+    c = LineCache(path)
+    assert c.take(*KEY, exchange=True) == ['still here.']
+    c.close()
@@ -0,0 +1,55 @@
+import json
+
+from src.engine.metrics import SUB_BITS, Histogram, Metrics
+
+
+def test_small_values_get_exact_buckets():
+    for v in range(2 << SUB_BITS):
+        assert Histogram._index(v) == v
+        assert Histogram._upper(v) == v
+
+
+def test_bucket_bounds_cover_every_value():
+    prev_upper = (2 << SUB_BITS) - 1
+    for idx in range(2 << SUB_BITS, Histogram._index(1 << 20) + 1):
+        upper = Histogram._upper(idx)
+        # buckets tile the integers with no gaps or overlaps
+        assert Histogram._index(prev_upper + 1) == idx
+        assert Histogram._index(upper) == idx
+        assert upper > prev_upper
+        prev_upper = upper
+    for v in (64, 65, 1000, 123_456, 10 ** 9):
+        upper = Histogram._upper(Histogram._index(v))
+        assert v <= upper <= v * (1 + 2 ** -SUB_BITS)
+
+
+def test_percentiles():
+    h = Histogram()
+    for v in range(1, 1001):
+        h.record(v)
+    assert (h.count, h.min, h.max) == (1000, 1, 1000)
+    for q, exact in ((50, 500), (90, 900), (99, 990)):
+        assert exact <= h.percentile(q) <= exact * (1 + 2 ** -SUB_BITS)
+    assert h.percentile(100) == 1000
+    assert h.to_dict()['mean'] == 500.5
+
+
+def test_empty_and_negative():
+    h = Histogram()
+    assert h.percentile(99) == 0
+    h.record(-5)
+    assert (h.min, h.max, h.percentile(50)) == (0, 0, 0)
+
+
+def test_metrics_summary(tmp_path):
+    m = Metrics()
+    m.record('tick', 0.0015)
+    m.count('llm.requests', 4)
+    m.count('llm.hits')
+    assert m.rate('llm.hits', 'llm.requests') == 0.25
+    assert m.rate('llm.hits', 'nothing') == 0.0
+    path = tmp_path / 'metrics.json'
+    m.dump(str(path))
+    data = json.loads(path.read_text())
+    assert data['histograms_us']['tick']['max'] == 1500
+    assert data['counters'] == {'llm.hits': 1, 'llm.requests': 4}
@@ -0,0 +1,43 @@
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.rng import RandomStreams
+from src.store.layout import WALL, StoreLayout
+from src.store.pathfinding import STEPS, UNREACHABLE, PathPlanner
+from src.store.simulation import StoreSimulation
+
+
+def _wall_in(layout: StoreLayout):
+    """Wall off a walkable tile on all four sides and return it."""
+    spot = next((y, x) for y in range(layout.height) for x in range(layout.width)
+                if layout.passable(y, x) and all(layout.passable(y + dy, x + dx) for dy, dx in STEPS))
+    for dy, dx in STEPS:
+        layout.grid[spot[0] + dy][spot[1] + dx] = WALL
+    layout.compile()
+    return spot
+
+
+def test_nearest_browse_is_the_shortest_walk():
+    layout = StoreLayout()
+    planner = PathPlanner(layout)
+    y, x = layout.door_position()
+    nearest = planner.nearest_browse(y, x)
+    assert nearest is not None
+    walks = [planner.field_for_browse(p).steps_from(y, x) for p in layout.shelf_positions()]
+    assert nearest.steps_from(y, x) == min(walks)
+
+
+def test_walled_in_tile_reaches_nothing():
+    layout = StoreLayout()
+    spot = _wall_in(layout)
+    planner = PathPlanner(layout)
+    assert planner.field('queue').steps_from(*spot) == UNREACHABLE
+    assert planner.nearest_browse(*spot) is None
+
+
+def test_customer_cut_off_from_shelves_heads_for_checkout():
+    sim = StoreSimulation(dialogue_mgr=DialogueManager(rng=RandomStreams(1).stream('dialogue'), llm=False))
+    spot = _wall_in(sim.layout)
+    sim.planner = PathPlanner(sim.layout)
+    c = next(c for c in sim.characters if not c.is_owner)
+    c.move_to(*spot)
+    sim._assign_shelf_path(c)
+    assert c.target_kind == 'register' and c.flow is sim.planner.field('queue')
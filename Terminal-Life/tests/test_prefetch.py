@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from src.characters.character import Character
+from src.dialogue.prefetch import DialoguePrefetcher
+from src.engine.state import Position
+
+
+def _walker(name, y, x, *steps):
+    return Character(name, Position(y, x), path=[Position(sy, sx) for sy, sx in steps])
+
+
+def _pairs(meetings):
+    return [(t, a.name, b.name) for t, a, b in meetings]
+
+
+def test_converging_paths_meet_at_the_right_tick():
+    a = _walker('A', 5, 0, (5, 1), (5, 2), (5, 3))
+    b = _walker('B', 5, 9, (5, 8), (5, 7), (5, 6), (5, 5), (5, 4))
+    assert _pairs(DialoguePrefetcher().meetings([a, b])) == [(5, 'A', 'B')]
+    assert _pairs(DialoguePrefetcher(horizon=4).meetings([a, b])) == []
+
+
+def test_waiting_character_is_projected_standing_still():
+    a = _walker('A', 5, 0, (5, 1), (5, 2))
+    b = _walker('B', 5, 3)
+    prefetcher = DialoguePrefetcher()
+    assert _pairs(prefetcher.meetings([a, b])) == [(2, 'A', 'B')]
+    # still for ticks 1-3, then two steps
+    assert _pairs(prefetcher.meetings([a, b], wait=lambda c: 3 if c is a else 0)) == [(5, 'A', 'B')]
+
+
+def test_crowded_characters_are_skipped():
+    crowd = [_walker(f'C{y}{x}', y, x) for y in (2, 3) for x in (2, 3)]  # three neighbours each
+    pair = [_walker('P', 9, 9), _walker('Q', 9, 10)]
+    assert _pairs(DialoguePrefetcher(max_crowd=2).meetings(crowd + pair)) == [(0, 'P', 'Q')]
+    assert len(list(DialoguePrefetcher(max_crowd=3).meetings(crowd + pair))) == 7
+
+
+def test_unwanted_pairs_are_passed_over():
+    pairs = [_walker('P', 1, 1), _walker('Q', 1, 2), _walker('R', 9, 9), _walker('S', 9, 10)]
+    meetings = DialoguePrefetcher().meetings(pairs, want=lambda a, b: a.name != 'P')
+    assert _pairs(meetings) == [(0, 'R', 'S')]
+
+
+class _Manager:
+    def __init__(self, pending):
+        self.available = True
+        self.batch_worker = SimpleNamespace(pending=lambda: pending)
+        self.asked = []
+
+    def wants_batch(self, a, b):
+        return True
+
+    def prefetch(self, a, b, situational, tick):
+        self.asked.append((a.name, b.name))
+        return True
+
+
+def _sim(pending):
+    # five pairs standing side by side, three rows apart
+    chars = [_walker(f'{n}{i}', 3 * i, x) for i in range(5) for n, x in (('A', 0), ('B', 1))]
+    return SimpleNamespace(
+        dialogue_mgr=_Manager(pending), layout=SimpleNamespace(height=20, width=20), ticks=3,
+        visible_characters=lambda *_: chars, remaining_wait=lambda c: 0, situational_context=lambda a, b: "here",
+    )
+
+
+def test_run_stops_at_budget_and_max_pending():
+    sim = _sim(pending=0)
+    assert DialoguePrefetcher(budget=2).run(sim) == 2
+    assert len(sim.dialogue_mgr.asked) == 2
+    assert DialoguePrefetcher(budget=4, max_pending=8).run(_sim(pending=7)) == 1
+    sim = _sim(pending=8)
+    assert DialoguePrefetcher(budget=4, max_pending=8).run(sim) == 0
+    assert sim.dialogue_mgr.asked == []
@@ -0,0 +1,41 @@
+from src.engine.scheduler import EventScheduler
+
+
+def test_fires_in_tick_then_schedule_order():
+    s = EventScheduler()
+    s.schedule(5, 'b')
+    s.schedule(3, 'a')
+    s.schedule(5, 'c')
+    assert list(s.pop_due(4)) == [('a', None)]
+    assert list(s.pop_due(5)) == [('b', None), ('c', None)]
+    assert len(s) == 0
+
+
+def test_cancel_pending_event():
+    s = EventScheduler()
+    h = s.schedule(2, 'wake', 'Alice')
+    s.schedule(3, 'wake', 'Ben')
+    s.cancel(h)
+    assert len(s) == 1
+    assert s.due(h) is None
+    assert s.next_tick() == 3
+    assert list(s.pop_due(10)) == [('wake', 'Ben')]
+    assert not s._cancelled
+
+
+def test_cancel_after_fire_is_a_no_op():
+    s = EventScheduler()
+    h = s.schedule(1, 'return', 'Cara')
+    assert list(s.pop_due(1)) == [('return', 'Cara')]
+    s.cancel(h)
+    s.cancel(h)
+    assert not s._cancelled
+    assert len(s) == 0
+
+
+def test_due_and_pending():
+    s = EventScheduler()
+    h = s.schedule(7, 'checkout_done', 'Drew')
+    s.cancel(s.schedule(4, 'wake', 'Eve'))
+    assert s.due(h) == 7
+    assert s.pending() == [(7, 'checkout_done', 'Drew')]
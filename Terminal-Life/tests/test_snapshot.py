@@ -0,0 +1,48 @@
+import pytest
+
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine import soa
+from src.engine.rng import RandomStreams
+from src.engine.snapshot import SnapshotError, load_snapshot, save_snapshot
+from src.store.simulation import StoreSimulation
+
+ENGINES = ['objects', pytest.param('soa', marks=pytest.mark.skipif(not soa.available(), reason="numpy not installed"))]
+
+
+def _manager(seed: int) -> DialogueManager:
+    return DialogueManager(rng=RandomStreams(seed).stream('dialogue'), llm=False)
+
+
+def _state(sim: StoreSimulation):
+    return (
+        sim.ticks, list(sim.logs),
+        [(c.name, c.pos.y, c.pos.x, c.active, c.waiting_ticks, c.mood_label) for c in sim.characters],
+    )
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_resume_matches_uninterrupted_run(tmp_path, engine):
+    path = str(tmp_path / 'run.snap')
+    mgr = _manager(3)
+    sim = StoreSimulation(mgr, engine=engine, streams=RandomStreams(3), lanes=2)
+    for _ in range(700):
+        sim.tick()
+    save_snapshot(sim, path)
+    for _ in range(900):
+        sim.tick()
+
+    mgr2 = _manager(3)
+    resumed = load_snapshot(path, mgr2)
+    assert resumed.ticks == 700
+    for _ in range(900):
+        resumed.tick()
+    assert _state(resumed) == _state(sim)
+    mgr.shutdown()
+    mgr2.shutdown()
+
+
+def test_rejects_foreign_file(tmp_path):
+    path = tmp_path / 'junk.snap'
+    path.write_bytes(b'not a snapshot at all')
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(path), _manager(1))
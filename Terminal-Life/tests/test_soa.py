@@ -0,0 +1,35 @@
+import pytest
+
+from src.engine import soa
+from src.store.simulation import StoreSimulation
+
+pytestmark = pytest.mark.skipif(not soa.available(), reason="numpy not installed")
+
+
+def _sim(field_cache):
+    return StoreSimulation(dialogue_mgr=None, engine='soa', field_cache=field_cache)
+
+
+def test_evicted_fields_give_their_rows_back():
+    sim = _sim(field_cache=2)
+    engine = sim.soa
+    fixed = len(engine.fields)
+    walkable = [(y, x) for y in range(sim.layout.height) for x in range(sim.layout.width)
+                if sim.layout.passable(y, x)][:20]
+    for tile in walkable:
+        engine.field_row(sim.planner.field_to(tile))
+    # two cached fields plus at most one row waiting to be reclaimed
+    assert len(engine.fields) <= fixed + 3
+
+
+def test_rows_in_use_are_not_recycled():
+    sim = _sim(field_cache=1)
+    engine = sim.soa
+    agent = next(c for c in sim.characters if not c.is_owner)
+    first = sim.planner.field_to((agent.pos.y, agent.pos.x + 1))
+    agent.follow(first, 'shelf')
+    row = engine.field[agent._i]
+    sim.planner.field_to((agent.pos.y, agent.pos.x + 2))
+    sim.planner.field_to((agent.pos.y, agent.pos.x + 3))
+    engine.field_row(sim.planner.field_to((agent.pos.y, agent.pos.x + 4)))
+    assert engine.field[agent._i] == row and agent.flow is first
@@ -0,0 +1,101 @@
+import random
+from collections import Counter
+
+from src.characters.character import Character
+from src.engine.spatial import SpatialHash
+from src.engine.state import Position
+
+
+def _index(spots):
+    index = SpatialHash()
+    chars = [Character(name, Position(y, x), memory=None) for name, (y, x) in spots.items()]
+    for c in chars:
+        index.update(c)
+    return index, chars
+
+
+def _near(index, y, x):
+    return sorted(c.name for c in index.near(y, x))
+
+
+def test_near_crosses_cell_borders():
+    # (3, 3) and (4, 4) sit in different 4x4 cells
+    index, _ = _index({'a': (3, 3), 'b': (4, 4), 'c': (3, 5), 'd': (8, 8)})
+    assert _near(index, 3, 3) == ['a', 'b']
+    assert _near(index, 4, 4) == ['a', 'b', 'c']
+    assert _near(index, 8, 8) == ['d']
+
+
+def test_moves_and_removals_keep_occupancy_current():
+    index, (a, b) = _index({'a': (0, 0), 'b': (0, 0)})
+    assert index.occupancy(0, 0) == 2
+    b.spatial = index
+    b.move_to(5, 5)
+    assert index.occupancy(0, 0) == 1
+    assert index.occupancy(5, 5) == 1
+    assert _near(index, 0, 0) == ['a']
+    index.remove(a)
+    assert index.occupancy(0, 0) == 0
+    assert len(index) == 1 and 'a' not in index
+
+
+def test_random_pair_draws_neighbours():
+    index, _ = _index({'a': (0, 0), 'b': (0, 1), 'c': (6, 6), 'd': (12, 12)})
+    rng = random.Random(3)
+    for _ in range(50):
+        assert sorted(c.name for c in index.random_pair(rng)) == ['a', 'b']
+
+
+def test_random_pair_is_uniform_over_adjacent_pairs():
+    # a-b-c in a row (two pairs sharing b), d-e apart: three pairs in all
+    index, _ = _index({'a': (0, 0), 'b': (0, 1), 'c': (0, 2), 'd': (10, 10), 'e': (10, 11)})
+    rng = random.Random(7)
+    counts = Counter(tuple(sorted((a.name, b.name))) for a, b in (index.random_pair(rng) for _ in range(6000)))
+    assert set(counts) == {('a', 'b'), ('b', 'c'), ('d', 'e')}
+    assert all(1700 < n < 2300 for n in counts.values())
+
+
+def test_random_pair_is_uniform_with_stacked_tiles():
+    # a, b, c share a tile, d stands next to it and e two tiles away: seven pairs
+    index, chars = _index({'a': (3, 3), 'b': (3, 3), 'c': (3, 3), 'd': (4, 4), 'e': (5, 5), 'f': (9, 9)})
+    rng = random.Random(5)
+    counts = Counter(tuple(sorted((a.name, b.name))) for a, b in (index.random_pair(rng) for _ in range(6000)))
+    assert set(counts) == {('a', 'b'), ('a', 'c'), ('b', 'c'), ('a', 'd'), ('b', 'd'), ('c', 'd'), ('d', 'e')}
+    assert all(700 < n < 1050 for n in counts.values())
+    for c in chars:
+        index.remove(c)
+    assert index.random_pair(rng) is None and not index._weights
+
+
+def test_random_pair_ignores_insertion_order():
+    spots = {'a': (0, 0), 'b': (0, 1), 'c': (0, 2), 'd': (1, 1)}
+    forward, _ = _index(spots)
+    backward, _ = _index(dict(reversed(list(spots.items()))))
+    draw = lambda index: [tuple(c.name for c in index.random_pair(random.Random(s))) for s in range(20)]
+    assert draw(forward) == draw(backward)
+
+
+def test_random_pair_none_without_neighbours():
+    index, chars = _index({'a': (0, 0), 'b': (5, 5)})
+    assert index.random_pair(random.Random(1)) is None
+    index.remove(chars[1])
+    assert index.random_pair(random.Random(1)) is None
+    assert len(index) == 1
+
+
+def test_neighbour_counts_follow_moves():
+    rng = random.Random(2)
+    index, chars = _index({f'c{i}': (rng.randrange(12), rng.randrange(12)) for i in range(40)})
+    for c in chars:
+        c.spatial = index
+    for _ in range(300):
+        c = rng.choice(chars)
+        if c.name in index and rng.random() < 0.2:
+            index.remove(c)
+        else:
+            c.move_to(rng.randrange(12), rng.randrange(12))
+            index.update(c)
+    placed = [c for c in chars if c.name in index]
+    pairs = sum(1 for a in placed for b in index.near(a.pos.y, a.pos.x) if a.name < b.name)
+    index._refresh()
+    assert sum(index._weights.values()) == 2 * pairs
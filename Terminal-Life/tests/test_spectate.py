@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from src.dialogue.dialogue_manager import DialogueManager
+from src.engine.broadcast import FrameBroadcaster, parse_address
+from src.engine.rng import RandomStreams
+from src.spectate import SpectatorState, connect, messages
+from src.store.simulation import StoreSimulation
+
+
+@pytest.fixture
+def sim():
+    mgr = DialogueManager(rng=RandomStreams(2).stream('dialogue'), llm=False)
+    yield StoreSimulation(mgr, streams=RandomStreams(2), lanes=2)
+    mgr.shutdown()
+
+
+@pytest.fixture
+def viewer(tmp_path):
+    address = str(tmp_path / 'store.sock')
+    broadcaster = FrameBroadcaster(address, max_fps=0)
+    sock = connect(address)
+    sock.settimeout(5)
+    for _ in range(500):
+        if broadcaster.viewers:
+            break
+        time.sleep(0.01)
+    yield broadcaster, messages(sock)
+    sock.close()
+    broadcaster.close()
+
+
+def _on_stage(sim):
+    index = {c.name: i for i, c in enumerate(sim.characters)}
+    h, w = sim.layout.height, sim.layout.width
+    return {index[c.name]: (c.pos.y, c.pos.x) for c in sim.visible_characters(0, 0, h, w)}
+
+
+def test_keyframe_then_deltas_rebuild_the_store(sim, viewer):
+    broadcaster, stream = viewer
+    state = SpectatorState()
+    broadcaster.publish(sim)
+    key = next(stream)
+    assert key['t'] == 'key' and key['names'] == [c.name for c in sim.characters]
+    state.apply(key)
+    for _ in range(10):
+        for _ in range(25):
+            sim.tick()
+        broadcaster.publish(sim)
+        msg = next(stream)
+        assert msg['t'] == 'd'
+        state.apply(msg)
+    assert state.tick == sim.ticks
+    assert {i: (y, x) for i, (y, x, _) in state.chars.items()} == _on_stage(sim)
+    assert [state.names[i] for i in state.queue] == sim.checkout.names()
+    assert list(state.logs)[-1] == sim.logs[-1]
+
+
+def test_unchanged_frame_sends_an_empty_delta(sim, viewer):
+    broadcaster, stream = viewer
+    broadcaster.publish(sim)
+    next(stream)
+    broadcaster.publish(sim)
+    msg = next(stream)
+    assert (msg['set'], msg['del'], msg['logs']) == ([], [], [])
+    assert 'queue' not in msg
+
+
+def test_late_viewer_of_a_paused_sim_gets_a_keyframe(sim, viewer, tmp_path):
+    broadcaster, stream = viewer
+    sim.tick()
+    broadcaster.publish(sim)
+    next(stream)
+    late = connect(str(tmp_path / 'store.sock'))
+    late.settimeout(5)
+    for _ in range(500):
+        if broadcaster.viewers == 2:
+            break
+        time.sleep(0.01)
+    broadcaster.publish(sim)  # no tick in between
+    key = next(messages(late))
+    late.close()
+    assert key['t'] == 'key' and key['tick'] == sim.ticks
+    assert next(stream)['t'] == 'd'
+
+
+def test_deltas_before_a_keyframe_are_ignored():
+    state = SpectatorState()
+    assert state.apply({'t': 'd', 'tick': 5, 'set': [[0, 1, 1, 2]], 'del': [], 'logs': ['x']}) == []
+    assert not state.chars and state.tick == 0
+
+
+def test_parse_address():
+    assert parse_address('unix:/tmp/s.sock')[1] == '/tmp/s.sock'
+    assert parse_address('./s.sock')[1] == './s.sock'
+    assert parse_address(':7777')[1] == ('127.0.0.1', 7777)
+    with pytest.raises(ValueError):
+        parse_address('nowhere')